@@ -0,0 +1,224 @@
+import asyncio, contextvars, os, threading, weakref
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from attrClassifier import MediaAnalyzer
+import telemetry
+
+EXECUTOR_MODES = ('process', 'thread')
+
+
+class AnalysisQueueFull(Exception):
+    """Raised when every worker is busy and the wait queue is at its limit."""
+
+
+class AnalysisTimeout(Exception):
+    """Raised when a job doesn't finish within the per-job timeout."""
+
+
+def _init_worker(cv_threads):
+    """Runs once per worker process so jobs start with cv2/numpy already imported."""
+    import cv2
+    import numpy  # noqa: F401
+    cv2.setNumThreads(cv_threads)
+    # A forked worker starts with a copy of the parent's metrics; only its own spans go back
+    telemetry.REGISTRY.drain()
+
+
+def _ping():
+    return os.getpid()
+
+
+def run_analysis(file_type, file_path, analyzer_options=None):
+    """
+    Worker entry point. Receives a path rather than decoded frames so nothing
+    large crosses the process boundary except the (small) results dict.
+    """
+    analyzer = MediaAnalyzer(**(analyzer_options or {}))
+    if file_type == 'video':
+        return analyzer.analyze_video(file_path)
+    return analyzer.analyze_image(file_path)
+
+
+def _run_and_collect(file_type, file_path, analyzer_options=None, request_id="-"):
+    """
+    Process-pool entry point: run_analysis, plus the spans recorded in this worker since
+    its last job, for the parent to merge into the metrics it serves.
+    """
+    telemetry.request_id.set(request_id)
+    result = run_analysis(file_type, file_path, analyzer_options)
+    return result, telemetry.REGISTRY.drain()
+
+
+class AnalysisExecutor:
+    """
+    Runs MediaAnalyzer jobs off the event loop on a sized pool of warm workers,
+    with a bounded wait queue and per-job timeouts.
+
+    A job that times out while running (e.g. a hung decode) can't be cancelled, so in
+    process mode the pool's workers are killed and a fresh pool started; the other jobs
+    that were running on it are resubmitted. Threads can't be killed, so in thread mode
+    a timed-out job keeps its worker until it finishes.
+    """
+
+    def __init__(self,
+                 mode: str = os.getenv("ANALYSIS_EXECUTOR", "process"),
+                 workers: int = int(os.getenv("ANALYSIS_WORKERS", "0")),
+                 max_queue: int = int(os.getenv("ANALYSIS_MAX_QUEUE", "8")),
+                 timeout: float = float(os.getenv("ANALYSIS_TIMEOUT", "120")),
+                 cv_threads: int = int(os.getenv("ANALYSIS_CV_THREADS", "0")),
+                 analyzer_options: dict = None):
+        """
+        Args:
+            mode (str): 'process' for a process pool, 'thread' for a thread pool.
+            workers (int): Pool size; 0 uses the CPU count.
+            max_queue (int): Jobs allowed to wait for a free worker before rejecting.
+            timeout (float): Seconds a job may take, queue wait included, before it is abandoned
+                (and, in process mode, its worker killed).
+            cv_threads (int): cv2.setNumThreads per worker; 0 splits the cores evenly
+                between workers so they don't oversubscribe the machine.
+            analyzer_options (dict): Keyword arguments for MediaAnalyzer; by default
+                videos are split into ANALYSIS_SEGMENTS parallel segments or sampled
+                per ANALYSIS_VIDEO_SAMPLING, and images are processed per
+                ANALYSIS_IMAGE_MODE (see MediaAnalyzer).
+        """
+        if mode not in EXECUTOR_MODES:
+            raise ValueError(f"Unknown analysis executor mode: {mode}")
+        cpus = os.cpu_count() or 1
+        self.mode = mode
+        self.workers = workers or cpus
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.cv_threads = cv_threads or max(cpus // self.workers, 1)
+        self.analyzer_options = analyzer_options or {
+            'segments': int(os.getenv("ANALYSIS_SEGMENTS", "1")),
+            'image_mode': os.getenv("ANALYSIS_IMAGE_MODE", "full"),
+            'image_reduce': int(os.getenv("ANALYSIS_IMAGE_REDUCE", "2")),
+            'tile_memory_mb': int(os.getenv("ANALYSIS_TILE_MEMORY_MB", "64")),
+            'tiled_above_pixels': int(os.getenv("ANALYSIS_TILED_ABOVE_PIXELS", "24000000")),
+            'sampling': os.getenv("ANALYSIS_VIDEO_SAMPLING", "uniform"),
+            'max_frames': int(os.getenv("ANALYSIS_MAX_FRAMES", "100")),
+            'max_seconds': float(os.getenv("ANALYSIS_MAX_SECONDS", "0")),
+            'convergence_tolerance': float(os.getenv("ANALYSIS_CONVERGENCE_TOLERANCE", "0.05")),
+        }
+        self.pending = 0
+        self._pending_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._pool = None
+        # Pools killed to stop a timed-out job; jobs that broke with them are run again
+        self._recycled = weakref.WeakSet()
+
+    def cache_signature(self) -> dict:
+        return MediaAnalyzer(**self.analyzer_options).cache_signature()
+
+    def start(self):
+        """
+        Create the pool and spin every worker up before the first request arrives.
+        Blocks until the workers are up, so call it off the event loop.
+        """
+        with self._start_lock:
+            if self._pool is not None:
+                return
+            if self.mode == 'process':
+                pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    initializer=_init_worker,
+                    initargs=(self.cv_threads,),
+                )
+                # The pool spawns lazily; one job per slot forces every worker up now
+                for f in [pool.submit(_ping) for _ in range(self.workers)]:
+                    f.result()
+            else:
+                pool = ThreadPoolExecutor(
+                    max_workers=self.workers,
+                    thread_name_prefix="analysis",
+                )
+            self._pool = pool
+
+    def _replace_pool(self, broken):
+        """Shut a broken pool down and start a fresh one, unless another job already has."""
+        with self._start_lock:
+            if self._pool is broken:
+                broken.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+        self.start()
+
+    def _recycle(self, pool):
+        """Kill a pool's workers to stop a job stuck on one of them, and start a fresh pool."""
+        self._recycled.add(pool)
+        # No public way to stop running workers before Python 3.14 (terminate_workers)
+        # (and a pool already shut down has dropped its process table)
+        for process in list((pool._processes or {}).values()):
+            process.terminate()
+        self._replace_pool(pool)
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def has_capacity(self) -> bool:
+        return self.pending < self.workers + self.max_queue
+
+    async def run(self, file_type: str, file_path: str) -> dict:
+        """
+        Analyze a file on the pool.
+
+        Raises:
+            AnalysisQueueFull: Every worker is busy and max_queue jobs are already waiting.
+            AnalysisTimeout: The job took longer than the configured timeout.
+        """
+        if self._pool is None:
+            await asyncio.to_thread(self.start)
+        with self._pending_lock:
+            if not self.has_capacity():
+                raise AnalysisQueueFull(f"Analysis queue is full ({self.pending} jobs pending)")
+            self.pending += 1
+
+        try:
+            pool = self._pool
+            try:
+                future = self._submit(file_type, file_path)
+            except BrokenProcessPool:
+                # A worker died (e.g. OOM-killed); start a fresh pool for this and later jobs
+                await asyncio.to_thread(self._replace_pool, pool)
+                pool = self._pool
+                future = self._submit(file_type, file_path)
+        except BaseException:
+            # Never submitted, so _job_done won't release the slot
+            with self._pending_lock:
+                self.pending -= 1
+            raise
+        # A timed-out job keeps its worker busy until it finishes or is killed, so it stays counted until then
+        future.add_done_callback(self._job_done)
+        try:
+            # Queue wait plus run; the per-stage cv.* spans are recorded inside the worker
+            with telemetry.span("analysis.pool"):
+                result = await asyncio.wait_for(asyncio.wrap_future(future), self.timeout)
+        except asyncio.TimeoutError:
+            # cancel() only stops a job still waiting for a worker
+            if not future.cancel() and not future.done() and self.mode == 'process':
+                await asyncio.to_thread(self._recycle, pool)
+            raise AnalysisTimeout(f"Analysis did not finish within {self.timeout:.0f}s")
+        except BrokenProcessPool:
+            if pool in self._recycled:
+                # Killed along with a timed-out job on the same pool; this one didn't fail
+                return await self.run(file_type, file_path)
+            raise
+        if self.mode == 'process':
+            result, recorded = result
+            telemetry.REGISTRY.merge(recorded)
+        return result
+
+    def _submit(self, file_type, file_path):
+        if self.mode == 'process':
+            return self._pool.submit(_run_and_collect, file_type, file_path, self.analyzer_options,
+                                     telemetry.request_id.get())
+        # Threads record into this process's metrics directly; the copied context carries the request ID
+        return self._pool.submit(contextvars.copy_context().run, run_analysis, file_type, file_path,
+                                 self.analyzer_options)
+
+    def _job_done(self, future):
+        # Called from the pool's management thread
+        with self._pending_lock:
+            self.pending -= 1
@@ -1,23 +1,324 @@
 import cv2
 import numpy as np
-import os, time
+import math, os, queue, threading, time
+from concurrent.futures import ThreadPoolExecutor
+from telemetry import span
+
+# Bump whenever a metric's definition changes, so cached results from older code are not reused
+ANALYZER_VERSION = 2  # 2: edge_continuity uses the grayscale edge map
+
+DECODE_STRATEGIES = ('auto', 'seek', 'sequential')
+
+# Assumed keyframe spacing when the backend can't report frame types (x264's default keyint)
+DEFAULT_KEYFRAME_INTERVAL = 250
+# Frames decoded while looking for the second keyframe before giving up on measuring the GOP
+KEYFRAME_PROBE_FRAMES = 300
+# Extra cost of a seek (demuxer flush + decoder reset), expressed in decoded frames
+SEEK_OVERHEAD_FRAMES = 16
+# cv2.CAP_PROP_FRAME_TYPE reports the picture type as a character code
+INTRA_FRAME_TYPE = ord('I')
+# Below this many samples per segment, the extra capture + seek isn't worth a worker
+MIN_SAMPLES_PER_SEGMENT = 4
+
+SAMPLING_MODES = ('uniform', 'adaptive')
+# Width of the thumbnails compared by the adaptive sampler's scan pass
+SCAN_WIDTH = 64
+# Most scan frames per second of video; denser scans cost decode time without finding more cuts
+SCAN_MAX_RATE = 2
+# A scene cut is a scan step whose thumbnail difference is at least this (0-255 scale)...
+SCENE_CUT_MIN_DIFF = 20.0
+# ...and at least this many times the median step
+SCENE_CUT_RATIO = 3.0
+# Passes sampled before convergence is checked; one pass gives too few pairs to trust
+MIN_ADAPTIVE_PASSES = 2
+# Standard error that counts as converged however small the mean (motion and edge
+# differences near 0 on their 0-255 scale are codec noise, not a mean to pin down)
+CONVERGENCE_FLOOR = 0.5
+
+IMAGE_MODES = ('full', 'tiled', 'reduced', 'auto')
+# Downscale factor -> imread flag; JPEG decodes these directly at the reduced size
+REDUCED_READ_FLAGS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+# Working memory per tile pixel: BGR + gray + CV_16S Laplacian + edges + int32 labels + Canny buffers
+TILE_BYTES_PER_PIXEL = 24
+# Pixels of context around each tile, so Laplacian and Canny see past the tile border
+TILE_OVERLAP = 16
+
+
+class RunningStats:
+    """
+    Running mean and population variance (Welford's algorithm).
+    Matches np.mean / np.std (ddof=0) without keeping the samples around.
+    """
+    
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+    
+    def push(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+    
+    @property
+    def variance(self):
+        return self.m2 / self.count if self.count else 0.0
+    
+    @property
+    def std(self):
+        return float(np.sqrt(self.variance))
+    
+    @classmethod
+    def from_moments(cls, count, mean, variance):
+        """Statistics of a block of samples summarized elsewhere (e.g. by cv2.meanStdDev)."""
+        stats = cls()
+        stats.count = int(count)
+        stats.mean = float(mean)
+        stats.m2 = float(variance) * stats.count
+        return stats
+    
+    def merge(self, other):
+        """Fold in another RunningStats (Chan et al.'s parallel update), e.g. from another tile."""
+        if other.count == 0:
+            return
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta * delta * self.count * other.count / count
+        self.count = count
+
+
+class ContourStitcher:
+    """
+    Recovers whole-image contour statistics from tiles. Each tile's external contours
+    are tagged with their connected component; components that touch across a seam
+    (8-connectivity) are merged, so a contour cut by a tile border counts once, with
+    the lengths of its pieces summed.
+    """
+    
+    def __init__(self):
+        self._parent = {}
+        self._lengths = {}
+        self._row = None
+        self._above = {}  # tile column -> bottom row of labels, for the previous tile row
+        self._current = {}  # the same for the tile row being added
+        self._left = None  # right column of labels of the previous tile
+    
+    def _find(self, key):
+        root = key
+        while self._parent.get(root, root) != root:
+            root = self._parent[root]
+        while key != root:
+            self._parent[key], key = root, self._parent.get(key, key)
+        return root
+    
+    def _union(self, a, b):
+        ra, rb = self._find(a), self._find(b)
+        if ra != rb:
+            self._parent[ra] = rb
+    
+    def _join(self, tile_a, labels_a, tile_b, labels_b, offsets=(-1, 0, 1)):
+        # Pixel i of one seam touches pixels i-1, i, i+1 of the other
+        n = len(labels_a)
+        for d in offsets:
+            a = labels_a[max(0, -d):n - max(0, d)]
+            b = labels_b[max(0, d):n + min(0, d)]
+            touching = (a > 0) & (b > 0)
+            for la, lb in set(zip(a[touching].tolist(), b[touching].tolist())):
+                self._union((*tile_a, la), (*tile_b, lb))
+    
+    def add_tile(self, ty, tx, edges):
+        """Add the edge map of the tile at grid position (ty, tx); tiles must arrive in row-major order."""
+        if ty != self._row:
+            self._above, self._current, self._row = self._current, {}, ty
+        
+        contours, _ = cv2.findContours(edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        _, labels = cv2.connectedComponents(edges, connectivity=8)
+        for contour in contours:
+            x, y = contour[0][0]
+            key = (ty, tx, int(labels[y, x]))
+            self._lengths[key] = self._lengths.get(key, 0) + len(contour)
+        
+        if tx > 0:
+            self._join((ty, tx - 1), self._left, (ty, tx), labels[:, 0])
+        if tx in self._above:
+            self._join((ty - 1, tx), self._above[tx], (ty, tx), labels[0, :])
+        # Diagonal neighbours above meet this tile only at its top corners
+        if tx - 1 in self._above:
+            self._join((ty - 1, tx - 1), self._above[tx - 1][-1:], (ty, tx), labels[0, :1], offsets=(0,))
+        if tx + 1 in self._above:
+            self._join((ty - 1, tx + 1), self._above[tx + 1][:1], (ty, tx), labels[0, -1:], offsets=(0,))
+        
+        self._left = labels[:, -1].copy()
+        self._current[tx] = labels[-1, :].copy()
+    
+    def edge_continuity(self):
+        """Average contour length over the stitched contours (0 if there are none)."""
+        totals = {}
+        for key, length in self._lengths.items():
+            root = self._find(key)
+            totals[root] = totals.get(root, 0) + length
+        return float(np.mean(list(totals.values()))) if totals else 0
+
+
+def _pass_phase(p):
+    """Offset of adaptive pass p within its sampling intervals: 1/2, 1/4, 3/4, 1/8, 5/8, ..."""
+    phase, scale, n = 0.0, 1.0, p + 1
+    while n:
+        n, bit = divmod(n, 2)
+        scale /= 2
+        phase += bit * scale
+    return phase
+
+
+def prefetch(iterable, depth=2):
+    """
+    Run an iterator on a background thread, keeping at most `depth` items buffered.
+    OpenCV releases the GIL while decoding, so the next frame is decoded while the
+    current one is being featurized.
+    """
+    buffer = queue.Queue(maxsize=depth)
+    done = object()
+    stop = threading.Event()
+    
+    def produce():
+        try:
+            for item in iterable:
+                if stop.is_set():
+                    return
+                buffer.put(item)
+            buffer.put(done)
+        except BaseException as e:
+            buffer.put(e)
+    
+    worker = threading.Thread(target=produce, daemon=True)
+    worker.start()
+    try:
+        while True:
+            item = buffer.get()
+            if item is done:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        stop.set()
+        # Unblock the producer if it is waiting on a full buffer
+        while worker.is_alive():
+            try:
+                buffer.get_nowait()
+            except queue.Empty:
+                worker.join(timeout=0.01)
 
 
 class MediaAnalyzer:
     """
     Analyzes videos and images for deepfake detection using computer vision techniques.
     Extracts features like motion scores, edge consistency, and texture variance.
+    
+    Video frames are streamed: each sampled frame is featurized as soon as it is
+    decoded and only the previous frame and its edge map are kept, so memory does
+    not grow with the number of samples.
     """
     
-    def __init__(self):
-        self.frames = []
-        self.motion_scores = []
-        self.edge_consistency = []
-        self.texture_variances = []
+    def __init__(self, decode_strategy='auto', num_samples=10, prefetch_depth=2, segments=1,
+                 image_mode='full', image_reduce=2, tile_memory_mb=64, tiled_above_pixels=24_000_000,
+                 sampling='uniform', max_frames=100, max_seconds=0, convergence_tolerance=0.05, scan_points=100):
+        """
+        Args:
+            decode_strategy (str): How sampled video frames are read.
+                'seek' jumps to every sample with CAP_PROP_POS_FRAMES,
+                'sequential' walks the stream once with grab()/retrieve(),
+                'auto' walks sequentially while measuring keyframe spacing and
+                switches to seeking once that is cheaper for the remaining samples.
+            num_samples (int): Approximate number of frames sampled per video
+                (per pass with adaptive sampling).
+            prefetch_depth (int): Decoded frames buffered ahead of feature extraction
+                (0 decodes on the calling thread).
+            segments (int): Split a video's samples into up to this many contiguous
+                segments, each decoded by its own worker thread and VideoCapture.
+                Results are identical to a serial run. Uniform sampling only.
+            image_mode (str): How images are processed.
+                'full' runs every feature on the whole image,
+                'tiled' runs them tile by tile with bounded working memory and merges
+                the per-tile statistics,
+                'reduced' decodes at 1/image_reduce of the size (IMREAD_REDUCED_*),
+                'auto' is 'full' up to tiled_above_pixels and 'tiled' beyond.
+            image_reduce (int): Downscale factor for 'reduced' mode: 2, 4 or 8.
+            tile_memory_mb (int): Working memory per tile, which sets the tile size.
+            tiled_above_pixels (int): Image size from which 'auto' switches to tiles.
+            sampling (str): How video frames are chosen.
+                'uniform' takes num_samples evenly spaced frames,
+                'adaptive' scans the video at low resolution for scene cuts and
+                activity, then samples passes of num_samples frames weighted towards
+                active stretches until the statistics converge or a budget runs out
+                (see _analyze_video_adaptive).
+            max_frames (int): Adaptive sampling: most frames sampled per video.
+            max_seconds (float): Adaptive sampling: wall-clock budget per video,
+                scan included; 0 for none. Results then depend on machine speed.
+            convergence_tolerance (float): Adaptive sampling: stop once every metric's
+                standard error is within this fraction of its mean.
+            scan_points (int): Adaptive sampling: most frames compared by the scan
+                pass (also at most SCAN_MAX_RATE per second).
+        """
+        if decode_strategy not in DECODE_STRATEGIES:
+            raise ValueError(f"Unknown decode strategy: {decode_strategy}")
+        if image_mode not in IMAGE_MODES:
+            raise ValueError(f"Unknown image mode: {image_mode}")
+        if image_reduce not in REDUCED_READ_FLAGS:
+            raise ValueError(f"image_reduce must be one of {sorted(REDUCED_READ_FLAGS)}: {image_reduce}")
+        if num_samples < 1:
+            raise ValueError(f"num_samples must be positive: {num_samples}")
+        if sampling not in SAMPLING_MODES:
+            raise ValueError(f"Unknown sampling mode: {sampling}")
+        if max_frames < 1 or scan_points < 2:
+            raise ValueError(f"max_frames must be positive and scan_points at least 2: {max_frames}, {scan_points}")
+        self.decode_strategy = decode_strategy
+        self.num_samples = num_samples
+        self.prefetch_depth = prefetch_depth
+        self.segments = max(int(segments), 1)
+        self.image_mode = image_mode
+        self.image_reduce = image_reduce
+        self.tiled_above_pixels = tiled_above_pixels
+        self.tile_size = max(int(math.sqrt(tile_memory_mb * 2**20 / TILE_BYTES_PER_PIXEL)) - 2 * TILE_OVERLAP, 64)
+        self.sampling = sampling
+        self.max_frames = max_frames
+        self.max_seconds = max_seconds
+        self.convergence_tolerance = convergence_tolerance
+        self.scan_points = scan_points
         self.edge_density = 0
         self.color_variance = 0
         self.edge_continuity = 0
         self.metadata = {}
+        self.reset_stream()
+    
+    def cache_signature(self):
+        """Parameters that change analysis output (decode strategy, prefetching and segments don't)."""
+        signature = {'version': ANALYZER_VERSION, 'num_samples': self.num_samples}
+        if self.image_mode != 'full':
+            signature.update(image_mode=self.image_mode, image_reduce=self.image_reduce,
+                             tile_size=self.tile_size, tiled_above_pixels=self.tiled_above_pixels)
+        if self.sampling != 'uniform':
+            signature.update(sampling=self.sampling, max_frames=self.max_frames, max_seconds=self.max_seconds,
+                             convergence_tolerance=self.convergence_tolerance, scan_points=self.scan_points)
+        return signature
+    
+    def reset_stream(self):
+        """Clear the rolling window and running statistics before a new analysis."""
+        self.motion_scores = []
+        self.edge_consistency = []
+        self.texture_variances = []
+        self.motion_stats = RunningStats()
+        self.edge_stats = RunningStats()
+        self.texture_stats = RunningStats()
+        self._prev_frame = None
+        self._prev_edges = None
     
     def analyze_video(self, file_path):
         """
@@ -29,6 +330,10 @@ class MediaAnalyzer:
         Returns:
             dict: Video analysis results
         """
+        with span("cv.analyze_video"):
+            return self._analyze_video(file_path)
+    
+    def _analyze_video(self, file_path):
         cap = cv2.VideoCapture(file_path)
         
         if not cap.isOpened():
@@ -48,24 +353,308 @@ class MediaAnalyzer:
             'duration': frame_count / fps if fps > 0 else 0
         }
         
-        sample_rate = max(frame_count // 10, 1)
-        self.frames = []
+        self.reset_stream()
+        if self.sampling == 'adaptive':
+            self._analyze_video_adaptive(file_path, cap, frame_count)
+            return self.compile_results()
         
-        for i in range(0, frame_count, sample_rate):
-            cap.set(cv2.CAP_PROP_POS_FRAMES, i)
-            ret, frame = cap.read()
-            if not ret:
-                break
-            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-            self.frames.append(gray)
+        sample_rate = max(frame_count // self.num_samples, 1)
+        indices = range(0, frame_count, sample_rate)
+        segments = self.plan_segments(indices)
         
-        cap.release()
+        if len(segments) > 1:
+            cap.release()
+            self._analyze_segments(file_path, segments)
+            self.metadata['sample_indices'] = list(indices[:len(self.texture_variances)])
+            return self.compile_results()
         
-        self.calculate_motion_and_edges()
-        self.calculate_texture_variance()
+        frames = self.iter_sampled_frames(cap, indices)
+        if self.prefetch_depth > 0:
+            frames = prefetch(frames, self.prefetch_depth)
+        try:
+            for gray in frames:
+                self.update_frame(gray)
+        finally:
+            frames.close()
+            cap.release()
         
+        self.metadata['sample_indices'] = list(indices[:len(self.texture_variances)])
         return self.compile_results()
     
+    def _analyze_video_adaptive(self, file_path, cap, frame_count):
+        """
+        Scene-aware sampling. A scan pass compares SCAN_WIDTH thumbnails of scan_points
+        evenly spaced frames: steps far above the median difference are scene cuts, the
+        rest measure activity. Frames are then sampled in passes of num_samples, each
+        spread over the whole video with density proportional to activity (plus a floor,
+        so static stretches are still covered) and offset from earlier passes so they
+        interleave. Each pass is featurized in timeline order; motion and edge pairs are
+        only taken between consecutive samples of one pass within one scene, so every
+        pass measures the same thing and a cut is never scored as motion.
+        
+        Sampling stops after a pass once every metric has converged (standard error within
+        convergence_tolerance of the mean or CONVERGENCE_FLOOR, after MIN_ADAPTIVE_PASSES), or as soon as
+        max_frames or max_seconds is reached. raw_data is in sampling order; metadata
+        records the sampled indices, the cuts, the passes and why sampling stopped.
+        """
+        deadline = time.perf_counter() + self.max_seconds if self.max_seconds > 0 else None
+        with span("cv.scan"):
+            try:
+                positions, activity = self.scan_activity(cap, frame_count, self.metadata['fps'], deadline)
+            finally:
+                cap.release()
+        cuts = self.find_scene_cuts(activity)
+        scene_starts = positions[1:][cuts]
+        
+        sampled, attempted, strategies = [], set(), []
+        passes, stop_reason = 0, 'exhausted'
+        while len(positions) and len(sampled) < self.max_frames:
+            indices = [i for i in self.adaptive_indices(positions, activity, cuts, frame_count,
+                                                        self.num_samples, _pass_phase(passes))
+                       if i not in attempted]
+            budget = self.max_frames - len(sampled)
+            if len(indices) > budget:
+                # Keep the truncated pass spread over the whole video
+                indices = [indices[j] for j in np.unique(np.linspace(0, len(indices) - 1, budget).round().astype(int))]
+            if not indices:
+                break
+            attempted.update(indices)
+            read, timed_out = self._sample_pass(file_path, indices, scene_starts, deadline)
+            passes += 1
+            sampled.extend(read)
+            if self.metadata.get('decode_strategy') not in strategies:
+                strategies.append(self.metadata['decode_strategy'])
+            if timed_out:
+                stop_reason = 'max_seconds'
+                break
+            if not read:
+                stop_reason = 'unreadable'
+                break
+            if passes >= MIN_ADAPTIVE_PASSES and self._converged():
+                stop_reason = 'converged'
+                break
+        else:
+            if len(sampled) >= self.max_frames:
+                stop_reason = 'max_frames'
+        
+        self._prev_frame = self._prev_edges = None
+        self.metadata.update(
+            sampling='adaptive',
+            decode_strategy=','.join(strategies),
+            sample_indices=sorted(sampled),
+            scene_cuts=[int(i) for i in scene_starts],
+            scan_frames=len(positions),
+            sampling_passes=passes,
+            stop_reason=stop_reason,
+        )
+    
+    def scan_activity(self, cap, frame_count, fps=0, deadline=None):
+        """
+        Cheap pass for the adaptive sampler: up to scan_points evenly spaced frames
+        (at most SCAN_MAX_RATE per second), shrunk to SCAN_WIDTH pixels wide and
+        compared with the previous one.
+        
+        Args:
+            cap (cv2.VideoCapture): Capture positioned at the first frame
+            frame_count (int): Frames in the video
+            fps (float): Frame rate, 0 if unknown
+            deadline (float): time.perf_counter() value at which to stop scanning early
+            
+        Returns:
+            tuple: (scanned frame indices, mean absolute difference of each consecutive
+                pair of thumbnails), as numpy arrays of n and n - 1 values
+        """
+        step = max(frame_count // self.scan_points, int(fps / SCAN_MAX_RATE), 1)
+        wanted = range(0, frame_count, step)
+        positions, activity, prev = [], [], None
+        frames = self.iter_sampled_frames(cap, wanted)
+        try:
+            for index, gray in zip(wanted, frames):
+                height, width = gray.shape
+                thumb = cv2.resize(gray, (SCAN_WIDTH, max(round(height * SCAN_WIDTH / width), 1)),
+                                   interpolation=cv2.INTER_AREA)
+                if prev is not None:
+                    activity.append(float(np.mean(cv2.absdiff(thumb, prev))))
+                positions.append(index)
+                prev = thumb
+                if deadline is not None and time.perf_counter() >= deadline:
+                    break
+        finally:
+            frames.close()
+        return np.array(positions, dtype=int), np.array(activity)
+    
+    @staticmethod
+    def find_scene_cuts(activity):
+        """Mask of the scan steps that are scene cuts rather than motion."""
+        if len(activity) == 0:
+            return np.zeros(0, dtype=bool)
+        return (activity >= SCENE_CUT_MIN_DIFF) & (activity >= SCENE_CUT_RATIO * np.median(activity))
+    
+    @staticmethod
+    def adaptive_indices(positions, activity, cuts, frame_count, count, phase=0.5):
+        """
+        count frame indices with density proportional to scanned activity.
+        
+        Args:
+            positions (np.ndarray): Scanned frame indices
+            activity (np.ndarray): Difference across each scan step (len(positions) - 1)
+            cuts (np.ndarray): Mask of the steps that are scene cuts; they are weighted
+                like a median step, since an edit isn't content to sample
+            frame_count (int): Frames in the video; anything past the last scanned
+                frame is weighted like an average step
+            count (int): Indices wanted
+            phase (float): Where in each of the count equal-weight intervals to sample,
+                in [0, 1); different phases give interleaving passes
+            
+        Returns:
+            list: Ascending, unique frame indices (fewer than count if they collide)
+        """
+        steady = activity[~cuts]
+        floor = float(np.mean(steady)) if len(steady) else 0.0
+        weights = np.where(cuts, float(np.median(steady)) if len(steady) else 0.0, activity)
+        weights = np.append(weights, floor) + (floor or 1.0)
+        bounds = np.append(positions, frame_count).astype(float)
+        cdf = np.concatenate([[0.0], np.cumsum(weights * np.diff(bounds))])
+        targets = (np.arange(count) + phase) / count * cdf[-1]
+        indices = np.interp(targets, cdf, bounds).astype(int)
+        return np.unique(np.clip(indices, 0, frame_count - 1)).tolist()
+    
+    def _sample_pass(self, file_path, indices, scene_starts, deadline):
+        """
+        Featurize one adaptive pass in timeline order with a fresh VideoCapture.
+        
+        Returns:
+            tuple: (indices read, whether the deadline passed)
+        """
+        cap = cv2.VideoCapture(file_path)
+        if not cap.isOpened():
+            raise ValueError(f"Could not open video file: {file_path}")
+        
+        # Pairs never span two passes or two scenes
+        self._prev_frame = self._prev_edges = None
+        scenes = np.searchsorted(scene_starts, indices, side='right')
+        read = []
+        frames = self.iter_sampled_frames(cap, indices)
+        if self.prefetch_depth > 0:
+            frames = prefetch(frames, self.prefetch_depth)
+        try:
+            for index, scene, gray in zip(indices, scenes, frames):
+                if read and scene != scenes[len(read) - 1]:
+                    self._prev_frame = self._prev_edges = None
+                self.update_frame(gray)
+                read.append(index)
+                if deadline is not None and time.perf_counter() >= deadline:
+                    return read, True
+        finally:
+            frames.close()
+            cap.release()
+        return read, False
+    
+    def _converged(self):
+        """Whether every video metric's standard error is within convergence_tolerance of its mean (or CONVERGENCE_FLOOR)."""
+        for stats in (self.motion_stats, self.edge_stats, self.texture_stats):
+            tolerance = max(self.convergence_tolerance * abs(stats.mean), CONVERGENCE_FLOOR)
+            if stats.count < 2 or stats.std / math.sqrt(stats.count) > tolerance:
+                return False
+        return True
+    
+    def plan_segments(self, indices):
+        """Split sample indices into contiguous, roughly equal runs, one per worker."""
+        count = min(self.segments, len(indices) // MIN_SAMPLES_PER_SEGMENT)
+        if count <= 1:
+            return [indices]
+        bounds = np.linspace(0, len(indices), count + 1).astype(int)
+        return [indices[a:b] for a, b in zip(bounds[:-1], bounds[1:])]
+    
+    def analyze_segment(self, file_path, indices):
+        """
+        Featurize one contiguous run of sample indices with a dedicated VideoCapture.
+        
+        Args:
+            file_path (str): Path to the video file
+            indices (range): Sample indices belonging to this segment
+            
+        Returns:
+            dict: Per-sample values, the (frame, edges) pairs at both ends of the segment
+                for the cross-segment motion pair, and whether every sample was read
+        """
+        cap = cv2.VideoCapture(file_path)
+        if not cap.isOpened():
+            raise ValueError(f"Could not open video file: {file_path}")
+        
+        self.metadata = {}
+        self.reset_stream()
+        if indices[0] > 0:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, indices[0])
+        
+        first = None
+        frames = self.iter_sampled_frames(cap, indices)
+        if self.prefetch_depth > 0:
+            frames = prefetch(frames, self.prefetch_depth)
+        try:
+            for gray in frames:
+                edges = self.update_frame(gray)
+                if first is None:
+                    first = (gray, edges)
+        finally:
+            frames.close()
+            cap.release()
+        
+        return {
+            'motion_scores': self.motion_scores,
+            'edge_consistency': self.edge_consistency,
+            'texture_variances': self.texture_variances,
+            'first': first,
+            'last': (self._prev_frame, self._prev_edges),
+            'complete': len(self.texture_variances) == len(indices),
+            'decode_strategy': self.metadata.get('decode_strategy'),
+        }
+    
+    def _analyze_segments(self, file_path, segments):
+        """
+        Run analyze_segment for every segment in parallel (OpenCV releases the GIL while
+        decoding and filtering) and stitch the results back together in timeline order.
+        """
+        def run(indices):
+            worker = MediaAnalyzer(
+                decode_strategy=self.decode_strategy,
+                num_samples=self.num_samples,
+                prefetch_depth=self.prefetch_depth,
+            )
+            return worker.analyze_segment(file_path, indices)
+        
+        with ThreadPoolExecutor(max_workers=len(segments), thread_name_prefix="segment") as pool:
+            partials = list(pool.map(run, segments))
+        
+        strategies = []
+        for partial in partials:
+            if partial['first'] is None:
+                break
+            if partial['decode_strategy'] not in strategies:
+                strategies.append(partial['decode_strategy'])
+            
+            if self._prev_frame is not None:
+                # The pair straddling the segment boundary
+                gray, edges = partial['first']
+                self._record_pair(
+                    self.calculate_motion(self._prev_frame, gray),
+                    self.calculate_edge_consistency(self._prev_edges, edges),
+                )
+            # Replay in order so the running statistics match a serial pass exactly
+            for motion, edge_diff in zip(partial['motion_scores'], partial['edge_consistency']):
+                self._record_pair(motion, edge_diff)
+            for texture_variance in partial['texture_variances']:
+                self._record_texture(texture_variance)
+            self._prev_frame, self._prev_edges = partial['last']
+            
+            # A serial pass stops at the first unreadable frame; so does the merge
+            if not partial['complete']:
+                break
+        
+        self._prev_frame = self._prev_edges = None
+        self.metadata['decode_strategy'] = ','.join(strategies)
+        self.metadata['segments'] = len(segments)
+    
     def analyze_image(self, file_path):
         """
         Analyze a single image file.
@@ -76,12 +665,56 @@ class MediaAnalyzer:
         Returns:
             dict: Image analysis results
         """
-        image = cv2.imread(file_path)
+        with span("cv.analyze_image"):
+            image = self._read_image(file_path)
+            
+            if image is None:
+                raise ValueError(f"Could not read image file: {file_path}")
+            
+            return self.analyze_image_array(image)
+    
+    def _read_image(self, file_path):
+        with span("cv.decode"):
+            if self.image_mode == 'reduced':
+                return cv2.imread(file_path, REDUCED_READ_FLAGS[self.image_reduce])
+            return cv2.imread(file_path)
+    
+    def analyze_images(self, file_paths):
+        """
+        Analyze many image files, decoding the next image on a background thread
+        while the current one is featurized.
         
-        if image is None:
-            raise ValueError(f"Could not read image file: {file_path}")
+        Args:
+            file_paths (iterable): Paths to image files
+            
+        Yields:
+            tuple: (file_path, results dict or None, error message or None), in input order
+        """
+        def decode():
+            for file_path in file_paths:
+                yield file_path, self._read_image(file_path)
         
+        frames = prefetch(decode(), self.prefetch_depth) if self.prefetch_depth > 0 else decode()
+        for file_path, image in frames:
+            if image is None:
+                yield file_path, None, f"Could not read image file: {file_path}"
+            else:
+                yield file_path, self.analyze_image_array(image), None
+    
+    def analyze_image_array(self, image):
+        """
+        Analyze an already decoded BGR image. One grayscale conversion and one Canny
+        edge map are shared by texture, edge density and edge continuity.
+        
+        Args:
+            image (np.ndarray): BGR image
+            
+        Returns:
+            dict: Image analysis results
+        """
         height, width = image.shape[:2]
+        if self.image_mode == 'tiled' or (self.image_mode == 'auto' and height * width > self.tiled_above_pixels):
+            return self._analyze_image_tiled(image)
         gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
         
         self.metadata = {
@@ -89,51 +722,245 @@ class MediaAnalyzer:
             'width': width,
             'height': height
         }
+        if self.image_mode == 'reduced':
+            # width and height are of the decoded, downscaled image
+            self.metadata.update(image_mode='reduced', downscale=self.image_reduce)
         
-        self.frames = [gray]
+        self.reset_stream()
+        edges = self.update_frame(gray)
         
-
-        self.motion_scores = []
-        self.edge_consistency = []
-        self.calculate_texture_variance()
+        with span("cv.edge_density"):
+            self.edge_density = self.calculate_edge_density(gray, edges=edges)
+        with span("cv.color_variance"):
+            self.color_variance = self.calculate_color_variance(image)
+        with span("cv.edge_continuity"):
+            self.edge_continuity = self.calculate_edge_continuity(gray, edges=edges)
         
-        self.edge_density = self.calculate_edge_density(gray)
-        self.color_variance = self.calculate_color_variance(image)
-        self.edge_continuity = self.calculate_edge_continuity(image)
+        return self.compile_results()
+    
+    def _analyze_image_tiled(self, image):
+        """
+        analyze_image_array over tiles of at most tile_size x tile_size. Each tile is
+        processed with TILE_OVERLAP pixels of context and only its core is counted:
+        texture and color statistics merge exactly, edges match the full image except
+        where Canny's hysteresis links edges across more than the overlap, and
+        contours cut by a seam are stitched back together.
+        """
+        height, width = image.shape[:2]
+        step, pad = self.tile_size, TILE_OVERLAP
+        texture = RunningStats()
+        channels = [RunningStats() for _ in range(3)]
+        edge_pixels = 0
+        stitcher = ContourStitcher()
         
+        for ty, y0 in enumerate(range(0, height, step)):
+            for tx, x0 in enumerate(range(0, width, step)):
+                y1, x1 = min(y0 + step, height), min(x0 + step, width)
+                # Context around the core, clipped at the image border
+                cy0, cx0 = max(y0 - pad, 0), max(x0 - pad, 0)
+                cy1, cx1 = min(y1 + pad, height), min(x1 + pad, width)
+                core = (slice(y0 - cy0, y1 - cy0), slice(x0 - cx0, x1 - cx0))
+                
+                with span("cv.tile"):
+                    gray = cv2.cvtColor(image[cy0:cy1, cx0:cx1], cv2.COLOR_BGR2GRAY)
+                    edges = cv2.Canny(gray, 100, 200)[core]
+                    # 3x3 Laplacian of uint8 fits int16 exactly
+                    laplacian = cv2.Laplacian(gray, cv2.CV_16S)[core]
+                    mean, std = cv2.meanStdDev(laplacian)
+                    texture.merge(RunningStats.from_moments(laplacian.size, mean[0, 0], std[0, 0] ** 2))
+                    mean, std = cv2.meanStdDev(image[y0:y1, x0:x1])
+                    for c in range(3):
+                        channels[c].merge(RunningStats.from_moments(laplacian.size, mean[c, 0], std[c, 0] ** 2))
+                    edge_pixels += cv2.countNonZero(edges)
+                with span("cv.stitch"):
+                    stitcher.add_tile(ty, tx, np.ascontiguousarray(edges))
+        
+        self.metadata = {
+            'type': 'image',
+            'width': width,
+            'height': height,
+            'image_mode': 'tiled',
+            'tiles': (ty + 1) * (tx + 1),
+        }
+        self.reset_stream()
+        self._record_texture(texture.variance)
+        self.edge_density = edge_pixels / (height * width)
+        self.color_variance = float(np.mean([c.variance for c in channels]))
+        self.edge_continuity = stitcher.edge_continuity()
         return self.compile_results()
     
-    def calculate_motion_and_edges(self):
-        self.motion_scores = []
-        self.edge_consistency = []
+    def update_frame(self, gray):
+        """
+        Push the next sampled frame through the rolling window: featurize it, compare
+        it with the previous frame, and fold the results into the running statistics.
         
-        for i in range(1, len(self.frames)):
-
-            diff = cv2.absdiff(self.frames[i], self.frames[i-1])
-            self.motion_scores.append(np.mean(diff))
+        Args:
+            gray (np.ndarray): Grayscale frame
             
-            edges1 = cv2.Canny(self.frames[i-1], 100, 200)
-            edges2 = cv2.Canny(self.frames[i], 100, 200)
-            edge_diff = np.mean(cv2.absdiff(edges1, edges2))
-            self.edge_consistency.append(edge_diff)
+        Returns:
+            np.ndarray: The frame's edge map
+        """
+        edges, texture_variance = self.compute_frame_features(gray)
+        
+        if self._prev_frame is not None:
+            with span("cv.motion"):
+                motion = self.calculate_motion(self._prev_frame, gray)
+            with span("cv.edge_consistency"):
+                edge_diff = self.calculate_edge_consistency(self._prev_edges, edges)
+            self._record_pair(motion, edge_diff)
+        self._record_texture(texture_variance)
+        
+        self._prev_frame = gray
+        self._prev_edges = edges
+        return edges
+    
+    def _record_pair(self, motion, edge_diff):
+        motion = float(motion)
+        edge_diff = float(edge_diff)
+        self.motion_scores.append(motion)
+        self.motion_stats.push(motion)
+        self.edge_consistency.append(edge_diff)
+        self.edge_stats.push(edge_diff)
+    
+    def _record_texture(self, texture_variance):
+        texture_variance = float(texture_variance)
+        self.texture_variances.append(texture_variance)
+        self.texture_stats.push(texture_variance)
+    
+    def iter_sampled_frames(self, cap, indices):
+        """
+        Decode the requested frames as grayscale, using the configured decode strategy.
+        Records the strategy that was actually used in metadata['decode_strategy'].
+        
+        Args:
+            cap (cv2.VideoCapture): Opened capture positioned at or before the first index
+            indices (iterable): Ascending frame indices to sample
+            
+        Yields:
+            np.ndarray: Grayscale frame for each index, stopping at the first unreadable one
+        """
+        if self.decode_strategy == 'seek':
+            self.metadata['decode_strategy'] = 'seek'
+            yield from self._iter_seek(cap, indices)
+            return
+        
+        self.metadata['decode_strategy'] = 'sequential'
+        wanted = iter(indices)
+        target = next(wanted, None)
+        pos = start = int(cap.get(cv2.CAP_PROP_POS_FRAMES))
+        keyframes = []
+        probing = self.decode_strategy == 'auto'
+        
+        while target is not None:
+            if not cap.grab():
+                return
+            
+            if probing:
+                if cap.get(cv2.CAP_PROP_FRAME_TYPE) == INTRA_FRAME_TYPE:
+                    keyframes.append(pos)
+                if len(keyframes) >= 2 or pos + 1 - start >= KEYFRAME_PROBE_FRAMES:
+                    probing = False
+                    remaining = [target] + list(wanted)
+                    gop = self._estimate_keyframe_interval(keyframes, pos + 1)
+                    if self._prefer_seek(remaining, pos + 1, gop):
+                        self.metadata['decode_strategy'] = 'sequential+seek'
+                        if target == pos:
+                            gray = self._retrieve_gray(cap)
+                            if gray is None:
+                                return
+                            yield gray
+                            remaining = remaining[1:]
+                        yield from self._iter_seek(cap, remaining)
+                        return
+                    wanted = iter(remaining[1:])
+            
+            if pos == target:
+                gray = self._retrieve_gray(cap)
+                if gray is None:
+                    return
+                yield gray
+                target = next(wanted, None)
+            pos += 1
+    
+    def _iter_seek(self, cap, indices):
+        for i in indices:
+            with span("cv.decode"):
+                cap.set(cv2.CAP_PROP_POS_FRAMES, i)
+                ret, frame = cap.read()
+                gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if ret else None
+            if gray is None:
+                return
+            yield gray
+    
+    def _retrieve_gray(self, cap):
+        # Frames walked past with grab() aren't timed individually; cv.analyze_video covers them
+        with span("cv.decode"):
+            ok, frame = cap.retrieve()
+            return cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if ok else None
+    
+    @staticmethod
+    def _estimate_keyframe_interval(keyframes, probed):
+        """Keyframe spacing seen while probing; a lower bound if only one keyframe was found."""
+        if len(keyframes) >= 2:
+            return keyframes[-1] - keyframes[-2]
+        if keyframes:
+            return max(probed - keyframes[0], 1)
+        # Backend doesn't report frame types (or the stream has no I-frames in the window)
+        return DEFAULT_KEYFRAME_INTERVAL
+    
+    @staticmethod
+    def _prefer_seek(remaining, pos, gop):
+        """
+        Compare decode cost for the remaining samples. A seek lands on the preceding
+        keyframe and decodes forward, so on average it costs half a GOP per sample;
+        walking sequentially costs every frame up to the last sample.
+        """
+        if not remaining:
+            return False
+        seek_cost = len(remaining) * (gop / 2 + SEEK_OVERHEAD_FRAMES)
+        sequential_cost = remaining[-1] - pos + 1
+        return seek_cost < sequential_cost
+    
+    def compute_frame_features(self, gray):
+        """
+        Per-frame feature stage: everything derived from a single frame is computed
+        here exactly once, so pairwise steps reuse it instead of re-running Canny.
+        
+        Args:
+            gray (np.ndarray): Grayscale frame
+            
+        Returns:
+            tuple: (edge map, Laplacian variance)
+        """
+        with span("cv.canny"):
+            edges = cv2.Canny(gray, 100, 200)
+        with span("cv.texture_variance"):
+            texture_variance = self.calculate_texture_variance(gray)
+        return edges, texture_variance
+    
+    def calculate_motion(self, prev_gray, gray):
+        return np.mean(cv2.absdiff(gray, prev_gray))
+    
+    def calculate_edge_consistency(self, prev_edges, edges):
+        return np.mean(cv2.absdiff(prev_edges, edges))
     
-    def calculate_texture_variance(self):
-        self.texture_variances = [
-            np.var(cv2.Laplacian(frame, cv2.CV_64F)) 
-            for frame in self.frames
-        ]
+    def calculate_texture_variance(self, gray):
+        return np.var(cv2.Laplacian(gray, cv2.CV_64F))
     
-    def calculate_edge_density(self, gray_image):
-        edges = cv2.Canny(gray_image, 100, 200)
-        edge_density = np.sum(edges > 0) / (edges.shape[0] * edges.shape[1])
+    def calculate_edge_density(self, gray_image, edges=None):
+        if edges is None:
+            edges = cv2.Canny(gray_image, 100, 200)
+        edge_density = cv2.countNonZero(edges) / (edges.shape[0] * edges.shape[1])
         return edge_density
     
     def calculate_color_variance(self, color_image):
-        variances = [np.var(color_image[:, :, i]) for i in range(3)]
-        return np.mean(variances)
+        # Per-channel variance in one pass, without float64 copies of each channel
+        _, std = cv2.meanStdDev(color_image)
+        return float(np.mean(std ** 2))
     
-    def calculate_edge_continuity(self, img):
-        edges = cv2.Canny(img, 100, 200)
+    def calculate_edge_continuity(self, gray_image, edges=None):
+        if edges is None:
+            edges = cv2.Canny(gray_image, 100, 200)
         contours, _ = cv2.findContours(edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
         avg_len = np.mean([len(c) for c in contours]) if contours else 0
         return avg_len
@@ -150,43 +977,37 @@ class MediaAnalyzer:
             results = {
                 'metadata': self.metadata,
                 'metrics': {
-                    'avg_motion': float(np.mean(self.motion_scores)) if self.motion_scores else 0.0,
-                    'avg_edge_consistency': float(np.mean(self.edge_consistency)) if self.edge_consistency else 0.0,
-                    'avg_texture_variance': float(np.mean(self.texture_variances)) if self.texture_variances else 0.0,
-                    'motion_std': float(np.std(self.motion_scores)) if self.motion_scores else 0.0,
-                    'edge_std': float(np.std(self.edge_consistency)) if self.edge_consistency else 0.0,
-                    'texture_std': float(np.std(self.texture_variances)) if self.texture_variances else 0.0,
+                    'avg_motion': float(self.motion_stats.mean),
+                    'avg_edge_consistency': float(self.edge_stats.mean),
+                    'avg_texture_variance': float(self.texture_stats.mean),
+                    'motion_std': self.motion_stats.std,
+                    'edge_std': self.edge_stats.std,
+                    'texture_std': self.texture_stats.std,
                 },
                 'raw_data': {
-                    'motion_scores': [float(x) for x in self.motion_scores],
-                    'edge_consistency': [float(x) for x in self.edge_consistency],
-                    'texture_variances': [float(x) for x in self.texture_variances],
+                    'motion_scores': list(self.motion_scores),
+                    'edge_consistency': list(self.edge_consistency),
+                    'texture_variances': list(self.texture_variances),
                 }
             }
         else:
             results = {
                 'metadata': self.metadata,
                 'metrics': {
-                    'avg_texture_variance': float(np.mean(self.texture_variances)) if self.texture_variances else 0.0,
-                    'texture_std': float(np.std(self.texture_variances)) if self.texture_variances else 0.0,
+                    'avg_texture_variance': float(self.texture_stats.mean),
+                    'texture_std': self.texture_stats.std,
                     'edge_density': float(self.edge_density),
                     'color_variance': float(self.color_variance),
                     'edge_continuity': float(self.edge_continuity)
                 },
                 'raw_data': {
-                    'texture_variances': [float(x) for x in self.texture_variances],
+                    'texture_variances': list(self.texture_variances),
                 }
             }
         
         return results
 
 if __name__ == "__main__":
-    analyzer = MediaAnalyzer()
-    start_time = time.time()
-    #result = analyzer.analyze_image('../media/ai_cow.png')
-    result1 = analyzer.analyze_video('../media/lion_ai_video.mp4')
-    end_time = time.time()
-    elapsed_time = end_time - start_time
-    print(f"Test completed in {elapsed_time:.2f} seconds.")
-    #print(result)
-    print(result1)
\ No newline at end of file
+    # Single-file check or bulk scan; see batch_scan.py (python attrClassifier.py --help)
+    from batch_scan import main
+    raise SystemExit(main())
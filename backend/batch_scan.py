@@ -0,0 +1,347 @@
+"""
+Bulk scanning of stored media without the upload path: files are analyzed in place,
+results are written incrementally (JSON Lines or Parquet) and a rerun resumes where
+the previous one stopped.
+
+    python attrClassifier.py /data/images --output results.jsonl --workers 8
+    python attrClassifier.py manifest.txt --output results.parquet --explain
+"""
+import argparse, asyncio, json, os, time
+from file_validation_service import detect_file_type
+from attrClassifier import IMAGE_MODES, SAMPLING_MODES
+
+from typing import Dict, Any, Optional, Callable, Awaitable, Iterable, Iterator, Set
+
+OUTPUT_FORMATS = ('jsonl', 'parquet')
+
+
+def iter_media_paths(source: str, resolve: Optional[Callable[[str], str]] = None) -> Iterator[str]:
+    """
+    Yield media file paths from a directory (walked recursively, in sorted order), a
+    media file itself, or a manifest file listing one path per line.
+
+    Args:
+        source (str): Directory, media file or manifest.
+        resolve (callable): Maps each manifest entry to the path to use, e.g. to keep
+            entries inside an allowed root (it may raise); None uses entries as given.
+    """
+    if os.path.isdir(source):
+        for root, dirs, files in os.walk(source):
+            dirs.sort()
+            for name in sorted(files):
+                path = os.path.join(root, name)
+                if detect_file_type(path) != "unknown":
+                    yield path
+    elif detect_file_type(source) != "unknown":
+        yield source
+    else:
+        with open(source) as f:
+            for line in f:
+                if line.strip() and not line.startswith('#'):
+                    yield resolve(line.strip()) if resolve else line.strip()
+
+
+class JsonlWriter:
+    """
+    Appends one JSON object per line, flushed per record so a crash loses at most the line
+    being written. A file retried after an error gets a new record; the last one counts.
+    """
+
+    def __init__(self, path: str, append: bool = True):
+        """
+        Args:
+            path (str): Output file.
+            append (bool): Add to an existing file (to resume); False starts it afresh.
+        """
+        self.path = path
+        if append:
+            self._repair()
+        self._file = open(path, 'a' if append else 'w')
+
+    def _repair(self):
+        # Drop a partial last line left behind by a crash
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'rb+') as f:
+            data = f.read()
+            if data and not data.endswith(b'\n'):
+                f.truncate(data.rfind(b'\n') + 1)
+
+    def done_paths(self) -> Set[str]:
+        """Paths with a successful record; failed files are retried."""
+        done = set()
+        with open(self.path) as f:
+            for line in f:
+                record = json.loads(line)
+                if record.get('status') != 'error':
+                    done.add(record['path'])
+        return done
+
+    def write(self, record: Dict[str, Any]):
+        self._file.write(json.dumps(record) + '\n')
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class ParquetWriter:
+    """
+    Writes records as a Parquet dataset directory, one part file per `batch_size`
+    records. Parts are renamed into place when complete, so a crash only loses the
+    unwritten batch. Requires pyarrow.
+    """
+
+    def __init__(self, path: str, batch_size: int = 500, append: bool = True):
+        """
+        Args:
+            path (str): Dataset directory.
+            batch_size (int): Records per part file.
+            append (bool): Add parts to an existing dataset (to resume); False removes its parts first.
+        """
+        try:
+            import pyarrow, pyarrow.parquet  # noqa: F401
+        except ImportError:
+            raise ImportError("Parquet output requires pyarrow (pip install pyarrow)")
+        self.path = path
+        self.batch_size = batch_size
+        self._pending = []
+        os.makedirs(path, exist_ok=True)
+        if not append:
+            for name in os.listdir(path):
+                if name.endswith('.parquet') or name.endswith('.parquet.tmp'):
+                    os.remove(os.path.join(path, name))
+        self._parts = len([n for n in os.listdir(path) if n.endswith('.parquet')])
+
+    def done_paths(self) -> Set[str]:
+        """Paths with a successful record; failed files are retried."""
+        import pyarrow.parquet as pq
+        done = set()
+        for name in os.listdir(self.path):
+            if name.endswith('.parquet'):
+                table = pq.read_table(os.path.join(self.path, name), columns=['path', 'status'])
+                done.update(path for path, status in zip(table.column('path').to_pylist(),
+                                                         table.column('status').to_pylist())
+                            if status != 'error')
+        return done
+
+    def write(self, record: Dict[str, Any]):
+        # Nested results differ between images and videos, so they are stored as JSON text
+        self._pending.append({k: json.dumps(v) if isinstance(v, (dict, list)) else v for k, v in record.items()})
+        if len(self._pending) >= self.batch_size:
+            self._flush()
+
+    def _flush(self):
+        import pyarrow as pa, pyarrow.parquet as pq
+        if not self._pending:
+            return
+        part = os.path.join(self.path, f"part-{self._parts:05d}.parquet")
+        pq.write_table(pa.Table.from_pylist(self._pending), part + '.tmp')
+        os.replace(part + '.tmp', part)
+        self._parts += 1
+        self._pending = []
+
+    def close(self):
+        self._flush()
+
+
+def open_writer(output: str, fmt: Optional[str] = None, append: bool = True):
+    """
+    Writer for `output`; the format defaults from its extension (.parquet, otherwise JSON Lines).
+    With append=False an existing output is replaced rather than resumed.
+    """
+    fmt = fmt or ('parquet' if output.endswith('.parquet') else 'jsonl')
+    if fmt not in OUTPUT_FORMATS:
+        raise ValueError(f"Unknown output format: {fmt}. Choose from {OUTPUT_FORMATS}")
+    return ParquetWriter(output, append=append) if fmt == 'parquet' else JsonlWriter(output, append=append)
+
+
+class BatchProgress:
+    """Counters for a running batch; files_per_sec counts files analyzed in this run."""
+
+    def __init__(self):
+        self.started_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.ok = 0
+        self.errors = 0
+        self.skipped = 0
+
+    @property
+    def files_per_sec(self) -> float:
+        elapsed = (self.finished_at or time.time()) - self.started_at
+        return (self.ok + self.errors) / elapsed if elapsed > 0 else 0.0
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            'ok': self.ok,
+            'errors': self.errors,
+            'skipped': self.skipped,
+            'running': self.finished_at is None,
+            'seconds': (self.finished_at or time.time()) - self.started_at,
+            'files_per_sec': self.files_per_sec,
+        }
+
+
+async def run_batch(paths: Iterable[str],
+                    analyze: Callable[[str, str], Awaitable[Dict[str, Any]]],
+                    writer,
+                    explainer=None,
+                    max_in_flight: int = 4,
+                    keep_raw: bool = False,
+                    skip: Optional[Set[str]] = None,
+                    progress: Optional[BatchProgress] = None,
+                    report: Optional[Callable[[BatchProgress], None]] = None,
+                    report_every: int = 100) -> BatchProgress:
+    """
+    Analyze every path and write one record per file as each finishes (not in input order).
+
+    Args:
+        paths (iterable): Files to analyze; consumed lazily, so directories of any size stream through.
+        analyze (callable): async analyze(file_type, path) -> analysis_result, e.g. AnalysisExecutor.run.
+        writer: JsonlWriter or ParquetWriter.
+        explainer (ExplainabilityEngine): Also generate metric explanations; None skips the LLM.
+        max_in_flight (int): Files being analyzed at once.
+        keep_raw (bool): Keep per-frame raw_data in the records.
+        skip (set): Paths already written by an earlier run.
+        progress (BatchProgress): Counters to update, e.g. for status polling.
+        report (callable): Called with the counters every report_every files, e.g. to print throughput.
+        report_every (int): Files between report calls.
+
+    Returns:
+        BatchProgress: Final counters.
+    """
+    progress = progress or BatchProgress()
+    skip = skip or set()
+    in_flight = set()
+
+    async def one(path: str):
+        t0 = time.time()
+        file_type = detect_file_type(path)
+        record = {'path': path, 'type': file_type}
+        try:
+            if file_type == "unknown":
+                raise ValueError("Unsupported file type")
+            result = await analyze(file_type, path)
+            if not keep_raw:
+                result.pop('raw_data', None)
+            record.update(status='ok', analysis_result=result)
+            if explainer is not None:
+                record['metric_explanations'] = await explainer.analyze_all_metrics(result)
+            progress.ok += 1
+        except Exception as e:
+            record.update(status='error', error=f"{type(e).__name__}: {e}")
+            progress.errors += 1
+        record['seconds'] = time.time() - t0
+        writer.write(record)
+
+        if report is not None and (progress.ok + progress.errors) % report_every == 0:
+            report(progress)
+
+    try:
+        for path in paths:
+            if path in skip:
+                progress.skipped += 1
+                continue
+            if len(in_flight) >= max_in_flight:
+                _, in_flight = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+            in_flight.add(asyncio.create_task(one(path)))
+        await asyncio.gather(*in_flight)
+    finally:
+        for task in in_flight:
+            task.cancel()
+        progress.finished_at = time.time()
+    return progress
+
+
+def analyzer_options(args) -> Dict[str, Any]:
+    return {
+        'num_samples': args.num_samples,
+        'segments': args.segments,
+        'image_mode': args.image_mode,
+        'image_reduce': args.image_reduce,
+        'tile_memory_mb': args.tile_memory_mb,
+        'sampling': args.sampling,
+        'max_frames': args.max_frames,
+        'max_seconds': args.max_seconds,
+    }
+
+
+def print_progress(progress: BatchProgress):
+    print(f"Batch: {progress.ok + progress.errors} files ({progress.errors} errors), {progress.files_per_sec:.2f} files/sec")
+
+
+async def _main(args, writer) -> int:
+    from analysis_executor import AnalysisExecutor
+
+    executor = AnalysisExecutor(
+        mode='process',
+        workers=args.workers,
+        max_queue=2 * args.workers,
+        timeout=args.timeout,
+        analyzer_options=analyzer_options(args),
+    )
+    executor.start()
+    explainer = None
+    if args.explain:
+        from explainability import ExplainabilityEngine
+        from explanation_cache import ExplanationCache
+        explainer = ExplainabilityEngine(cache=ExplanationCache())
+
+    skip = writer.done_paths() if args.resume else set()
+    if skip:
+        print(f"Resuming: {len(skip)} files already in {args.output}")
+    try:
+        paths = (p for source in args.sources for p in iter_media_paths(source))
+        progress = await run_batch(paths, executor.run, writer, explainer=explainer,
+                                   max_in_flight=2 * executor.workers, keep_raw=args.raw, skip=skip,
+                                   report=print_progress)
+    finally:
+        writer.close()
+        executor.shutdown()
+        if explainer is not None:
+            await explainer.aclose()
+
+    stats = progress.snapshot()
+    print(f"Batch complete: {stats['ok']} ok, {stats['errors']} errors, {stats['skipped']} skipped "
+          f"in {stats['seconds']:.2f}s ({stats['files_per_sec']:.2f} files/sec)")
+    return 1 if progress.errors else 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Analyze media files in bulk with MediaAnalyzer.")
+    parser.add_argument('sources', nargs='+', help="Media files, directories, or manifest files listing one path per line")
+    parser.add_argument('--output', '-o', help="Results file (.jsonl) or dataset directory (.parquet); omit to print one file's result")
+    parser.add_argument('--format', choices=OUTPUT_FORMATS, help="Output format (default: from the output name)")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="Analysis processes")
+    parser.add_argument('--timeout', type=float, default=600, help="Seconds allowed per file")
+    parser.add_argument('--num-samples', type=int, default=10, help="Frames sampled per video (per pass with --sampling adaptive)")
+    parser.add_argument('--sampling', choices=SAMPLING_MODES, default='uniform',
+                        help="Evenly spaced frames, or scene-aware passes until the metrics converge")
+    parser.add_argument('--max-frames', type=int, default=100, help="Most frames sampled per video with --sampling adaptive")
+    parser.add_argument('--max-seconds', type=float, default=0, help="Sampling time budget per video with --sampling adaptive (0: none)")
+    parser.add_argument('--segments', type=int, default=1, help="Parallel segments per video")
+    parser.add_argument('--image-mode', choices=IMAGE_MODES, default='full',
+                        help="Whole image, bounded-memory tiles, IMREAD_REDUCED decode, or tiles only for large images")
+    parser.add_argument('--image-reduce', type=int, choices=(2, 4, 8), default=2, help="Downscale factor for --image-mode reduced")
+    parser.add_argument('--tile-memory-mb', type=int, default=64, help="Working memory per tile for tiled modes")
+    parser.add_argument('--explain', action='store_true', help="Also generate LLM metric explanations")
+    parser.add_argument('--raw', action='store_true', help="Keep per-frame raw_data in the records")
+    parser.add_argument('--no-resume', dest='resume', action='store_false', help="Replace the output instead of skipping files already in it")
+    args = parser.parse_args(argv)
+
+    if args.output is None:
+        # Quick look at a single file, as the module's old __main__ did
+        from attrClassifier import MediaAnalyzer
+        path = args.sources[0]
+        analyzer = MediaAnalyzer(**analyzer_options(args))
+        start_time = time.time()
+        result = analyzer.analyze_video(path) if detect_file_type(path) == 'video' else analyzer.analyze_image(path)
+        print(f"Test completed in {time.time() - start_time:.2f} seconds.")
+        print(result)
+        return 0
+
+    try:
+        writer = open_writer(args.output, args.format, append=args.resume)
+    except ImportError as e:
+        parser.error(str(e))
+    return asyncio.run(_main(args, writer))
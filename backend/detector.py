@@ -1,38 +1,50 @@
 from dotenv import load_dotenv
-import os, requests
+import asyncio, os, random, requests, time
+import httpx
+from telemetry import VERDICT_ATTEMPTS, log
+
+from typing import Dict, Any, Optional
 
 load_dotenv()
 
-API_KEY = os.getenv("AIORNOT_API_KEY")  
-IMAGE_ENDPOINT = "https://api.aiornot.com/v2/image/sync"
-VIDEO_ENDPOINT = "https://api.aiornot.com/v2/video/sync"
+API_KEY = os.getenv("AIORNOT_API_KEY")
+API_URL = os.getenv("AIORNOT_URL", "https://api.aiornot.com")
+IMAGE_ENDPOINT = f"{API_URL}/v2/image/sync"
+VIDEO_ENDPOINT = f"{API_URL}/v2/video/sync"
+VIDEO_PARAMS = {"only": ["ai_video", "deepfake_video"]}
+
+def parse_image_report(data: Dict[str, Any]) -> Dict[str, Any]:
+    report = data["report"]
+    return {
+        "ai_detected": report["ai_generated"]["ai"]["is_detected"],
+        "ai_confidence": report["ai_generated"]["ai"]["confidence"],
+        "deepfake_detected": report["deepfake"]["is_detected"],
+        "deepfake_confidence": report["deepfake"]["confidence"],
+    }
+
+def parse_video_report(data: Dict[str, Any]) -> Dict[str, Any]:
+    report = data["report"]
+    return {
+        "ai_detected": report["ai_video"]["is_detected"],
+        "ai_confidence": report["ai_video"]["confidence"],
+        "deepfake_detected": report["deepfake_video"]["is_detected"],
+        "deepfake_confidence": report["deepfake_video"]["confidence"],
+    }
 
 def scan_image(img_path):
     with open(img_path, "rb") as image_file:
         files = {"image": image_file}
         resp = requests.post(
             IMAGE_ENDPOINT,
-            headers={"Authorization": f"Bearer {API_KEY}"}, 
-            files=files
+            headers={"Authorization": f"Bearer {API_KEY}"},
+            files=files,
+            timeout=120,
         )
 
         if resp.status_code != 200:
             raise Exception(f"Failed to analyze image: {resp.status_code} {resp.text}")
 
-        data = resp.json()
-        report = data["report"]
-
-        ai_detected = report["ai_generated"]["ai"]["is_detected"]
-        ai_confidence = report["ai_generated"]["ai"]["confidence"]
-        deepfake_detected = report["deepfake"]["is_detected"]
-        deepfake_confidence = report["deepfake"]["confidence"]
-
-        return {
-            "ai_detected": ai_detected,
-            "ai_confidence": ai_confidence,
-            "deepfake_detected": deepfake_detected,
-            "deepfake_confidence": deepfake_confidence,
-        }
+        return parse_image_report(resp.json())
 
 def scan_video(video_path):
     with open(video_path, "rb") as video_file:
@@ -42,23 +54,183 @@ def scan_video(video_path):
             headers={"Authorization": f"Bearer {API_KEY}"},
             files=files,
             timeout=120,
-            params={"only": ["ai_video", "deepfake_video"]},
+            params=VIDEO_PARAMS,
         )
 
         if resp.status_code != 200:
             raise Exception(f"Failed to analyze video: {resp.status_code} {resp.text}")
-        
-        data = resp.json()
-        report = data["report"]
-
-        ai_detected = report["ai_video"]["is_detected"]
-        ai_confidence = report["ai_video"]["confidence"]
-        deep_fake_detected = report["deepfake_video"]["is_detected"] 
-        deep_fake_confidence = report["deepfake_video"]["confidence"]
-
-        return {
-            "ai_detected": ai_detected,
-            "ai_confidence": ai_confidence,
-            "deepfake_detected": deep_fake_detected,
-            "deepfake_confidence": deep_fake_confidence,
-        }
\ No newline at end of file
+
+        return parse_video_report(resp.json())
+
+
+class VerdictError(Exception):
+    """The verdict API rejected the request or returned something unusable."""
+
+
+class VerdictUnavailable(VerdictError):
+    """The verdict API could not be reached: retries exhausted or circuit open."""
+
+
+class CircuitBreaker:
+    """
+    Stops calling a failing API for a while. Opens after `threshold` consecutive
+    failures; after `reset_after` seconds one trial call is let through (half-open),
+    and its outcome closes or re-opens the circuit.
+    """
+
+    def __init__(self, threshold: int, reset_after: float):
+        self.threshold = threshold
+        self.reset_after = reset_after
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial_running = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_after:
+            return "half-open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half-open" and not self._trial_running:
+            self._trial_running = True
+            return True
+        return False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self._trial_running or self.failures >= self.threshold:
+            self.opened_at = time.monotonic()
+        self._trial_running = False
+
+    def release_trial(self):
+        """The call let through ended without an outcome (e.g. cancelled); let the next one try."""
+        self._trial_running = False
+
+
+class VerdictClient:
+    """
+    Async AI-or-NOT client sharing one pooled HTTP connection across requests.
+
+    Files are streamed into the multipart body rather than read into memory. Transport
+    errors, timeouts, 429 and 5xx responses are retried with full-jitter exponential
+    backoff; repeated failures open a circuit breaker so uploads fail fast while the
+    API is down.
+    """
+
+    def __init__(self,
+                 api_key: Optional[str] = API_KEY,
+                 base_url: str = API_URL,
+                 timeout: float = float(os.getenv("AIORNOT_TIMEOUT", "120")),
+                 connect_timeout: float = float(os.getenv("AIORNOT_CONNECT_TIMEOUT", "10")),
+                 max_retries: int = int(os.getenv("AIORNOT_RETRIES", "3")),
+                 backoff: float = float(os.getenv("AIORNOT_BACKOFF", "0.5")),
+                 max_connections: int = int(os.getenv("AIORNOT_MAX_CONNECTIONS", "10")),
+                 breaker_threshold: int = int(os.getenv("AIORNOT_BREAKER_THRESHOLD", "5")),
+                 breaker_reset: float = float(os.getenv("AIORNOT_BREAKER_RESET", "30")),
+                 transport: Optional[httpx.AsyncBaseTransport] = None):
+        """
+        Args:
+            api_key (str): AI-or-NOT API key.
+            base_url (str): API root; point it at the local stub for tests and benchmarks.
+            timeout (float): Seconds allowed for reading a response (the API scans synchronously).
+            connect_timeout (float): Seconds allowed to establish a connection.
+            max_retries (int): Retries after the first attempt.
+            backoff (float): Base delay in seconds; attempt n sleeps up to backoff * 2**n.
+            max_connections (int): Size of the connection pool.
+            breaker_threshold (int): Consecutive failed scans that open the circuit.
+            breaker_reset (float): Seconds the circuit stays open before a trial call.
+            transport (httpx.AsyncBaseTransport): Custom transport, e.g. httpx.ASGITransport in tests.
+        """
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.breaker = CircuitBreaker(breaker_threshold, breaker_reset)
+        self.client = httpx.AsyncClient(
+            base_url=base_url,
+            headers={"Authorization": f"Bearer {api_key}"},
+            timeout=httpx.Timeout(timeout, connect=connect_timeout),
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            transport=transport,
+        )
+
+    async def aclose(self):
+        await self.client.aclose()
+
+    async def scan(self, file_type: str, file_path: str) -> Dict[str, Any]:
+        """
+        Get the AI-or-NOT verdict for a stored image or video.
+
+        Returns:
+            dict: ai_detected, ai_confidence, deepfake_detected, deepfake_confidence
+
+        Raises:
+            VerdictUnavailable: The API could not be reached or the circuit is open.
+            VerdictError: The API rejected the file.
+        """
+        if file_type == "image":
+            return parse_image_report(await self._post("/v2/image/sync", "image", file_path))
+        if file_type == "video":
+            return parse_video_report(await self._post("/v2/video/sync", "video", file_path, VIDEO_PARAMS))
+        raise ValueError(f"Unsupported file type: {file_type}")
+
+    async def _post(self, path: str, field: str, file_path: str, params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        if not self.breaker.allow():
+            VERDICT_ATTEMPTS.inc(outcome="circuit_open")
+            raise VerdictUnavailable("Verdict API circuit open")
+        try:
+            return await self._attempt(path, field, file_path, params)
+        except VerdictError:
+            # The outcome has been recorded
+            raise
+        except Exception:
+            self.breaker.record_failure()
+            raise
+        except BaseException:
+            # Cancelled, e.g. because the CV analysis failed or the client went away
+            self.breaker.release_trial()
+            raise
+
+    async def _attempt(self, path: str, field: str, file_path: str, params: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        """_post's retry loop; records the outcome with the breaker unless it raises something else."""
+        t0 = time.time()
+        for attempt in range(self.max_retries + 1):
+            retry_after = None
+            try:
+                # Reopened per attempt: httpx streams the file into the body in chunks
+                with open(file_path, "rb") as f:
+                    resp = await self.client.post(path, files={field: (os.path.basename(file_path), f)}, params=params)
+            except httpx.TransportError as e:
+                error = f"{type(e).__name__}: {e}"
+            else:
+                if resp.status_code == 200:
+                    self.breaker.record_success()
+                    VERDICT_ATTEMPTS.inc(outcome="ok")
+                    log.info(f"Verdict ({field}): {time.time() - t0:.4f}s, {attempt + 1} attempt(s)")
+                    return resp.json()
+                if resp.status_code != 429 and resp.status_code < 500:
+                    # The API is up and answered; retrying the same file won't help
+                    self.breaker.record_success()
+                    VERDICT_ATTEMPTS.inc(outcome="rejected")
+                    raise VerdictError(f"Failed to analyze {field}: {resp.status_code} {resp.text}")
+                error = f"{resp.status_code} {resp.text}"
+                retry_after = resp.headers.get("Retry-After")
+            VERDICT_ATTEMPTS.inc(outcome="transient_error")
+
+            if attempt < self.max_retries:
+                delay = random.uniform(0, self.backoff * 2 ** attempt)
+                if retry_after is not None and retry_after.isdigit():
+                    delay = max(delay, float(retry_after))
+                await asyncio.sleep(delay)
+
+        self.breaker.record_failure()
+        raise VerdictUnavailable(f"Failed to analyze {field} after {self.max_retries + 1} attempts: {error}")
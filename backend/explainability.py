@@ -1,37 +1,383 @@
-import os, time, asyncio
-from openai import AsyncOpenAI
-from prompt_builder import build_video_overall_prompt, build_image_overall_prompt, build_single_metric_prompt
+import os, time, asyncio, json
+import httpx
+from openai import AsyncOpenAI, NotFoundError
+from llm_governor import LLMGovernor, PRIORITY_OVERVIEW, PRIORITY_METRIC, PRIORITY_NAMES
+from telemetry import LLM_SECONDS, LLM_TOKENS, log
+from explanation_cache import ExplanationCache, quantize_value
+from prompt_builder import build_video_overall_prompt, build_image_overall_prompt, build_single_metric_prompt, build_batched_metric_prompt
 
-from typing import Dict, Any
+from typing import Dict, Any, AsyncIterator, Iterable, Optional, Tuple
+
+DEFAULT_MODEL = os.getenv("OLLAMA_MODEL", "llama3.1:8b")
+# A smaller, faster model for the two-sentence metric explanations (default: OLLAMA_MODEL)
+METRIC_MODEL = os.getenv("OLLAMA_METRIC_MODEL", DEFAULT_MODEL)
+DEFAULT_URL = os.getenv("OLLAMA_URL", "http://localhost:11434/v1")
+# Completion caps per task (0 = no cap). The batched JSON reply covers every metric at once.
+MAX_TOKENS = {
+    'overview': int(os.getenv("LLM_OVERVIEW_MAX_TOKENS", "400")),
+    'metric': int(os.getenv("LLM_METRIC_MAX_TOKENS", "120")),
+    'metric_batch': int(os.getenv("LLM_METRIC_BATCH_MAX_TOKENS", "1024")),
+}
+# How long the server keeps a model loaded after a warm-up ping (Ollama duration syntax)
+LLM_KEEP_ALIVE = os.getenv("LLM_KEEP_ALIVE", "30m")
+# Re-ping models idle for this many seconds, before the server unloads them (0 = only warm up at startup)
+LLM_KEEP_ALIVE_INTERVAL = float(os.getenv("LLM_KEEP_ALIVE_INTERVAL", "240"))
+# Seconds before a model the server reported missing is tried again
+MODEL_RETRY_AFTER = 60
+# One JSON-mode completion for all metrics instead of one completion per metric
+BATCH_METRIC_EXPLANATIONS = os.getenv("BATCH_METRIC_EXPLANATIONS", "1") == "1"
+# Bands across each metric's expected range that values are snapped to before prompting (0 = exact values)
+EXPLANATION_BANDS = int(os.getenv("EXPLANATION_BANDS", "0"))
+
+VIDEO_METRIC_CONFIGS = {
+    'avg_motion': {
+        'display_name': 'Average Motion',
+        'expected_range': '10-50',
+        'low_threshold': 10,
+        'high_threshold': 50,
+        'description': 'Measures overall pixel intensity change between consecutive frames'
+    },
+    'motion_std': {
+        'display_name': 'Motion Standard Deviation',
+        'expected_range': '5-20',
+        'low_threshold': 5,
+        'high_threshold': 20,
+        'description': 'Captures how varied the motion is across the video sequence'
+    },
+    'avg_edge_consistency': {
+        'display_name': 'Average Edge Consistency',
+        'expected_range': '5-30',
+        'low_threshold': 5,
+        'high_threshold': 30,
+        'description': 'Measures how stable detected edges remain between frames'
+    },
+    'edge_std': {
+        'display_name': 'Edge Standard Deviation',
+        'expected_range': '2-15',
+        'low_threshold': 2,
+        'high_threshold': 15,
+        'description': 'Measures variation in edge consistency across frames'
+    },
+    'avg_texture_variance': {
+        'display_name': 'Average Texture Variance',
+        'expected_range': '100-10000',
+        'low_threshold': 100,
+        'high_threshold': 10000,
+        'description': 'Measures frame-to-frame variation in fine detail'
+    },
+    'texture_std': {
+        'display_name': 'Texture Standard Deviation',
+        'expected_range': '50-5000',
+        'low_threshold': 50,
+        'high_threshold': 5000,
+        'description': 'Measures variation in texture across frames'
+    }
+}
+
+IMAGE_METRIC_CONFIGS = {
+    'avg_texture_variance': {
+        'display_name': 'Texture Variance',
+        'expected_range': '250-600',
+        'low_threshold': 250,
+        'high_threshold': 600,
+        'description': 'Measures local variance of fine details (fur, grass, skin)'
+    },
+    'texture_std': {
+        'display_name': 'Texture Standard Deviation',
+        'expected_range': '100-10000',
+        'low_threshold': 100,
+        'high_threshold': 10000,
+        'description': 'Measures variation in texture across the image'
+    },
+    'edge_density': {
+        'display_name': 'Edge Density',
+        'expected_range': '0.03-0.10',
+        'low_threshold': 0.03,
+        'high_threshold': 0.10,
+        'description': 'Ratio of detected edges to total pixels'
+    },
+    'color_variance': {
+        'display_name': 'Color Variance',
+        'expected_range': '3000-8000',
+        'low_threshold': 3000,
+        'high_threshold': 8000,
+        'description': 'Measures diversity in color saturation and hue distribution'
+    },
+    'edge_continuity': {
+        'display_name': 'Edge Continuity',
+        'expected_range': '20-80',
+        'low_threshold': 20,
+        'high_threshold': 80,
+        'description': 'Average contour length across all detected edges'
+    }
+}
+
+def metric_status(config: Dict[str, Any], actual_value: float) -> str:
+    if actual_value < config['low_threshold']:
+        return 'suspicious_low'
+    elif actual_value > config['high_threshold']:
+        return 'suspicious_high'
+    return 'normal'
+
+def build_metric_result(metric_name: str, config: Dict[str, Any], actual_value: float, status: str, analysis: str) -> Dict[str, Any]:
+    return {
+        'metric_name': metric_name,
+        'display_name': config['display_name'],
+        'actual_value': actual_value,
+        'expected_range': config['expected_range'],
+        'description': config['description'],
+        'analysis': analysis,
+        'status': status
+    }
+
+def unknown_metric_result(metric_name: str) -> Dict[str, Any]:
+    return {
+        'error': f"Unknown metric: {metric_name}",
+        'metric_name': metric_name
+    }
+
+def parse_batched_explanations(text: str, metric_names: list) -> Dict[str, str]:
+    """
+    Pull per-metric explanations out of a batched JSON reply.
+    Tolerates prose or code fences around the object; returns only non-empty string entries.
+    """
+    start, end = text.find('{'), text.rfind('}')
+    if start == -1 or end <= start:
+        return {}
+    try:
+        data = json.loads(text[start:end + 1])
+    except json.JSONDecodeError:
+        return {}
+    if not isinstance(data, dict):
+        return {}
+    return {
+        name: data[name].strip()
+        for name in metric_names
+        if isinstance(data.get(name), str) and data[name].strip()
+    }
 
 class ExplainabilityEngine:
     
-    def __init__(self, local_model: str = os.getenv("OLLAMA_MODEL", "llama3.1:8b"), local_url: str = "http://localhost:11434/v1"):
+    def __init__(self, local_model: str = DEFAULT_MODEL, local_url: str = DEFAULT_URL,
+                 governor: Optional[LLMGovernor] = None, cache: Optional[ExplanationCache] = None,
+                 value_bands: int = EXPLANATION_BANDS, metric_model: Optional[str] = METRIC_MODEL,
+                 max_tokens: Optional[Dict[str, int]] = None, keep_alive: str = LLM_KEEP_ALIVE):
         """
         Initialize the ExplainabilityEngine to use a local LLM.
         
+        Create one engine per process and share it: the client keeps a pool of
+        keep-alive connections to the server, which a per-request engine throws away.
+        
         Args:
-            local_model (str): Name of the local model to use (e.g., 'llama3.1:8b').
+            local_model (str): Name of the local model to use (e.g., 'llama3.1:8b'); it
+                writes the overall explanation.
             local_url (str): URL of the local inference server.
+            governor (LLMGovernor): Limits concurrent generations and orders waiting
+                ones by priority; a private one is created if omitted.
+            cache (ExplanationCache): Reuses metric explanations for identical prompts;
+                None always calls the model.
+            value_bands (int): Quantize metric values into this many bands across the
+                expected range before prompting, so similar uploads share cache entries.
+            metric_model (str): Model for the per-metric explanations; None uses local_model.
+                If either model is missing on the server, calls fall back to the other.
+            max_tokens (dict): Completion cap per task ('overview', 'metric',
+                'metric_batch'), overriding MAX_TOKENS; 0 means no cap.
+            keep_alive (str): How long the server should keep models loaded after
+                a warm-up ping (see keep_warm).
         """
 
         self.local_model = local_model
+        self.models = {'overview': local_model, 'metric': metric_model or local_model}
+        self.max_tokens = {**MAX_TOKENS, **(max_tokens or {})}
+        self.keep_alive = keep_alive
+        self.governor = governor or LLMGovernor()
+        self.cache = cache
+        self.value_bands = value_bands
+        # model -> time it may be tried again, after the server reported it missing
+        self._unavailable: Dict[str, float] = {}
+        # model -> time of its last successful call or warm-up
+        self._last_used: Dict[str, float] = {}
 
         self.client = AsyncOpenAI(
             base_url=local_url,
             api_key="not-needed" # Local servers usually don't enforce API keys
         )
+        # Ollama's native API (preloading with keep_alive) lives next to the OpenAI-compatible one
+        self._native = httpx.AsyncClient(base_url=local_url.rstrip('/').removesuffix('/v1'), timeout=300)
 
-    async def _generate_content(self, prompt: str) -> str:
-        """Helper to generate content from the configured local LLM."""
+        # Running token totals, as reported by the server
+        self.usage = {'calls': 0, 'prompt_tokens': 0, 'completion_tokens': 0}
+
+    async def aclose(self):
+        """Close the pooled connections; call once on application shutdown."""
+        await self.client.close()
+        await self._native.aclose()
+
+    def _candidates(self, task: str) -> list:
+        """Models to try for a task: its own, then the other one; ones reported missing go last."""
+        route = 'overview' if task == 'overview' else 'metric'
+        other = 'metric' if route == 'overview' else 'overview'
+        models = list(dict.fromkeys([self.models[route], self.models[other]]))
+        now = time.time()
+        return sorted(models, key=lambda m: self._unavailable.get(m, 0) > now)
+
+    async def _create(self, task: str, prompt: str, **kwargs):
+        """
+        chat.completions.create on the task's model, capped at the task's max_tokens,
+        falling back to the other model if the server doesn't have it.
+
+        Returns:
+            tuple: (model used, response or stream)
+        """
+        if self.max_tokens.get(task):
+            kwargs['max_tokens'] = self.max_tokens[task]
+        error = None
+        for model in self._candidates(task):
+            try:
+                response = await self.client.chat.completions.create(
+                    model=model,
+                    messages=[{"role": "user", "content": prompt}],
+                    temperature=0.7,
+                    **kwargs
+                )
+            except NotFoundError as e:
+                log.warning(f"LLM model {model} unavailable ({e.message}), trying the next one")
+                self._unavailable[model] = time.time() + MODEL_RETRY_AFTER
+                error = e
+                continue
+            self._unavailable.pop(model, None)
+            self._last_used[model] = time.time()
+            return model, response
+        raise error
+
+    def unavailable_models(self) -> list:
+        """Models the server recently reported missing (calls are routed around them)."""
+        now = time.time()
+        return [model for model, until in self._unavailable.items() if until > now]
+
+    async def warm_up(self, model: str) -> bool:
+        """
+        Load a model on the server so the first real request doesn't pay for it, and
+        ask the server to keep it loaded for keep_alive. Uses Ollama's native preload
+        (an empty generate request); other servers get a one-token completion.
+
+        Returns:
+            bool: Whether the model is available
+        """
         t0 = time.time()
-        response = await self.client.chat.completions.create(
-            model=self.local_model,
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.7
-        )
-        print(f"LLM Gen ({len(prompt)} chars): {time.time() - t0:.4f}s")
+        try:
+            response = await self._native.post("/api/generate", json={"model": model, "keep_alive": self.keep_alive})
+            preloaded = response.status_code == 200
+        except httpx.HTTPError:
+            preloaded = False
+        try:
+            if not preloaded:
+                await self.client.chat.completions.create(
+                    model=model, messages=[{"role": "user", "content": "Hi"}], max_tokens=1)
+        except NotFoundError as e:
+            log.warning(f"LLM model {model} unavailable: {e.message}")
+            self._unavailable[model] = time.time() + MODEL_RETRY_AFTER
+            return False
+        self._unavailable.pop(model, None)
+        self._last_used[model] = time.time()
+        log.info(f"LLM model {model} warmed up: {time.time() - t0:.4f}s")
+        return True
+
+    async def keep_warm(self, interval: float = LLM_KEEP_ALIVE_INTERVAL):
+        """
+        Warm up every configured model, then (if interval > 0) re-ping the ones idle for
+        `interval` seconds until cancelled, so they are never unloaded between requests
+        and a model that was missing is picked up once it has been pulled. Failures
+        (e.g. the server not running yet) are logged and retried on the next round.
+        """
+        while True:
+            now = time.time()
+            for model in dict.fromkeys(self.models.values()):
+                if interval > 0 and now - self._last_used.get(model, 0) < interval:
+                    continue
+                try:
+                    await self.warm_up(model)
+                except Exception as e:
+                    log.warning(f"LLM warm-up of {model} failed: {e}")
+            if interval <= 0:
+                return
+            await asyncio.sleep(interval)
+
+    def _metric_prompt(self, media_type: str, config: Dict[str, Any], actual_value: float, status: str) -> str:
+        prompt_value = quantize_value(config, actual_value, status, self.value_bands)
+        return build_single_metric_prompt(media_type, config, prompt_value, status)
+
+    async def _explain_prompt(self, prompt: str) -> str:
+        """_generate_content through the explanation cache, if there is one."""
+        if self.cache is None:
+            return await self._generate_content(prompt)
+        return await self.cache.get_or_generate(self.models['metric'], prompt, lambda: self._generate_content(prompt))
+
+    async def _generate_content(self, prompt: str, json_mode: bool = False, priority: int = PRIORITY_METRIC) -> str:
+        """
+        Helper to generate content from the configured local LLM. Overview-priority calls
+        go to the overview model, the rest (metric explanations) to the metric model.
+        """
+        t0 = time.time()
+        if priority == PRIORITY_OVERVIEW:
+            task = 'overview'
+        else:
+            task = 'metric_batch' if json_mode else 'metric'
+        extra = {"response_format": {"type": "json_object"}} if json_mode else {}
+        async with self.governor.slot(priority):
+            model, response = await self._create(task, prompt, **extra)
+        log.info(f"LLM Gen ({model}, {len(prompt)} chars): {time.time() - t0:.4f}s")
+        self.usage['calls'] += 1
+        if response.usage is not None:
+            self._record_tokens(response.usage.prompt_tokens, response.usage.completion_tokens)
         return response.choices[0].message.content
+
+    def _record_tokens(self, prompt_tokens: Optional[int], completion_tokens: int):
+        if prompt_tokens is not None:
+            self.usage['prompt_tokens'] += prompt_tokens
+            LLM_TOKENS.observe(prompt_tokens, kind="prompt")
+        self.usage['completion_tokens'] += completion_tokens or 0
+        LLM_TOKENS.observe(completion_tokens or 0, kind="completion")
+    
+    async def _stream_content(self, prompt: str, priority: int = PRIORITY_METRIC) -> AsyncIterator[str]:
+        """Like _generate_content, but yields the completion's text as it is generated."""
+        t0 = time.time()
+        first_token = None
+        usage = None
+        chunks = 0
+        async with self.governor.slot(priority):
+            model, stream = await self._create('overview' if priority == PRIORITY_OVERVIEW else 'metric', prompt,
+                                               stream=True, stream_options={"include_usage": True})
+            async for chunk in stream:
+                # With include_usage the server sends the totals in a last chunk without choices
+                if getattr(chunk, 'usage', None) is not None:
+                    usage = chunk.usage
+                if chunk.choices and chunk.choices[0].delta.content:
+                    if first_token is None:
+                        first_token = time.time() - t0
+                        LLM_SECONDS.observe(first_token, phase="first_token", priority=PRIORITY_NAMES[priority])
+                    chunks += 1
+                    yield chunk.choices[0].delta.content
+        self.usage['calls'] += 1
+        if usage is not None:
+            self._record_tokens(usage.prompt_tokens, usage.completion_tokens)
+        else:
+            # Servers that don't report usage send about one token per chunk
+            self._record_tokens(None, chunks)
+        log.info(f"LLM Stream ({model}, {len(prompt)} chars): first token {first_token or 0:.4f}s, total {time.time() - t0:.4f}s")
+    
+    async def _overall_prompt(self, OCV_results: Dict[str, Any], API_results: Dict[str, Any]) -> str:
+        media_type = OCV_results['metadata']['type']
+        metrics = OCV_results['metrics']
+        metadata = OCV_results['metadata']
+        
+        verdict_bool = API_results.get('ai_detected') or API_results.get('deepfake_detected')
+        verdict = "AI-Generated" if verdict_bool else "Authentic"
+        confidence = max(API_results.get('ai_confidence', 0), API_results.get('deepfake_confidence', 0))
+        
+        if media_type == 'video':
+            return await build_video_overall_prompt(metadata, metrics, verdict= verdict, confidence= confidence)
+        return await build_image_overall_prompt(metadata, metrics, verdict=verdict, confidence=confidence)
     
     async def explain_overall_analysis(self, OCV_results: Dict[str, Any], API_results: Dict[str, Any])-> str:
         """
@@ -45,29 +391,41 @@ class ExplainabilityEngine:
         Returns:
             str: Natural language explanation of the overall analysis
         """
-        media_type = OCV_results['metadata']['type']
-        metrics = OCV_results['metrics']
-        metadata = OCV_results['metadata']
-        
-        verdict_bool = API_results.get('ai_detected') or API_results.get('deepfake_detected')
-        verdict = "AI-Generated" if verdict_bool else "Authentic"
-        confidence = max(API_results.get('ai_confidence', 0), API_results.get('deepfake_confidence', 0))
-        
-        
-        if media_type == 'video':
-            prompt = await build_video_overall_prompt(metadata, metrics, verdict= verdict, confidence= confidence)
-        else:
-            prompt = await build_image_overall_prompt(metadata, metrics, verdict=verdict, confidence=confidence)
+        prompt = await self._overall_prompt(OCV_results, API_results)
         
         try:
-            return await self._generate_content(prompt)
+            return await self._generate_content(prompt, priority=PRIORITY_OVERVIEW)
         except Exception as e:
             return f"Error generating explanation: {str(e)}"
     
-    async def analyze_all_metrics(self, analysis_result: Dict[str, Any]) -> list:
+    async def stream_overall_analysis(self, OCV_results: Dict[str, Any], API_results: Dict[str, Any]) -> AsyncIterator[str]:
+        """
+        Streaming version of explain_overall_analysis: yields the explanation in pieces
+        as the model produces them. Unlike explain_overall_analysis, a failure is raised
+        rather than returned as text, since part of the explanation may already be out.
+        """
+        prompt = await self._overall_prompt(OCV_results, API_results)
+        
+        async for delta in self._stream_content(prompt, priority=PRIORITY_OVERVIEW):
+            yield delta
+    
+    async def analyze_all_metrics(self, analysis_result: Dict[str, Any], batched: bool = None) -> list:
         """
-        Analyzes all metrics in the result concurrently.
+        Analyzes all metrics in the result, either with one batched JSON completion
+        or with one completion per metric run concurrently.
+        
+        Args:
+            analysis_result (dict): Analysis results from MediaAnalyzer
+            batched (bool): Override BATCH_METRIC_EXPLANATIONS for this call
+            
+        Returns:
+            list: One dict per metric, in the same shape as explain_individual_metric
         """
+        if batched is None:
+            batched = BATCH_METRIC_EXPLANATIONS
+        if batched:
+            return await self._analyze_all_metrics_batched(analysis_result)
+        
         metrics = analysis_result.get('metrics', {})
         tasks = [
             self.explain_individual_metric(analysis_result, metric_name) 
@@ -75,6 +433,67 @@ class ExplainabilityEngine:
         ]
         return await asyncio.gather(*tasks)
 
+    async def _analyze_all_metrics_batched(self, analysis_result: Dict[str, Any]) -> list:
+        """
+        One prompt asks for every metric's explanation as a JSON object. Metrics the
+        reply doesn't cover (or all of them, if it isn't valid JSON) fall back to
+        individual calls.
+        """
+        media_type = analysis_result['metadata']['type']
+        metrics = analysis_result.get('metrics', {})
+        metric_configs = VIDEO_METRIC_CONFIGS if media_type == 'video' else IMAGE_METRIC_CONFIGS
+        
+        entries = []
+        single_prompts = {}
+        explanations = {}
+        for metric_name in metrics.keys():
+            if metric_name in metric_configs:
+                config = metric_configs[metric_name]
+                actual_value = metrics.get(metric_name, 0)
+                status = metric_status(config, actual_value)
+                # Explanations are cached under the single-metric prompt, however they were generated
+                single_prompts[metric_name] = self._metric_prompt(media_type, config, actual_value, status)
+                cached = self.cache.get(self.models['metric'], single_prompts[metric_name]) if self.cache else None
+                if cached is not None:
+                    explanations[metric_name] = cached
+                else:
+                    prompt_value = quantize_value(config, actual_value, status, self.value_bands)
+                    entries.append((metric_name, config, prompt_value, status))
+        
+        if entries:
+            prompt = build_batched_metric_prompt(media_type, entries)
+            try:
+                reply = await self._generate_content(prompt, json_mode=True)
+            except Exception as e:
+                # The server itself failed; per-metric calls would fail the same way
+                error = f"Error generating analysis: {str(e)}"
+                explanations.update({e[0]: error for e in entries})
+            else:
+                parsed = parse_batched_explanations(reply, [e[0] for e in entries])
+                if len(parsed) < len(entries):
+                    log.warning(f"Batched reply covered {len(parsed)}/{len(entries)} metrics, falling back to per-metric calls")
+                if self.cache is not None:
+                    for metric_name, text in parsed.items():
+                        self.cache.set(self.models['metric'], single_prompts[metric_name], text)
+                explanations.update(parsed)
+        
+        missing = [name for name in metrics.keys() if name not in explanations]
+        fallback = await asyncio.gather(*[
+            self.explain_individual_metric(analysis_result, metric_name) for metric_name in missing
+        ])
+        fallback = dict(zip(missing, fallback))
+        
+        results = []
+        for metric_name in metrics.keys():
+            if metric_name in fallback:
+                results.append(fallback[metric_name])
+            else:
+                config = metric_configs[metric_name]
+                actual_value = metrics.get(metric_name, 0)
+                status = metric_status(config, actual_value)
+                results.append(build_metric_result(metric_name, config, actual_value, status, explanations[metric_name]))
+        return results
+
     async def explain_individual_metric(self, OCV_results: Dict[str, Any], metric_name: str) -> Dict[str, Any]:
         """
         Provides analysis for a single specific metric.
@@ -103,159 +522,93 @@ class ExplainabilityEngine:
         
     async def _analyze_video_metric(self, metrics: Dict[str, Any], metric_name: str) -> Dict[str, Any]:
         """Analyze a single video metric and return structured data."""
-        
-        # Define metric configurations
-        metric_configs = {
-            'avg_motion': {
-                'display_name': 'Average Motion',
-                'expected_range': '10-50',
-                'low_threshold': 10,
-                'high_threshold': 50,
-                'description': 'Measures overall pixel intensity change between consecutive frames'
-            },
-            'motion_std': {
-                'display_name': 'Motion Standard Deviation',
-                'expected_range': '5-20',
-                'low_threshold': 5,
-                'high_threshold': 20,
-                'description': 'Captures how varied the motion is across the video sequence'
-            },
-            'avg_edge_consistency': {
-                'display_name': 'Average Edge Consistency',
-                'expected_range': '5-30',
-                'low_threshold': 5,
-                'high_threshold': 30,
-                'description': 'Measures how stable detected edges remain between frames'
-            },
-            'edge_std': {
-                'display_name': 'Edge Standard Deviation',
-                'expected_range': '2-15',
-                'low_threshold': 2,
-                'high_threshold': 15,
-                'description': 'Measures variation in edge consistency across frames'
-            },
-            'avg_texture_variance': {
-                'display_name': 'Average Texture Variance',
-                'expected_range': '100-10000',
-                'low_threshold': 100,
-                'high_threshold': 10000,
-                'description': 'Measures frame-to-frame variation in fine detail'
-            },
-            'texture_std': {
-                'display_name': 'Texture Standard Deviation',
-                'expected_range': '50-5000',
-                'low_threshold': 50,
-                'high_threshold': 5000,
-                'description': 'Measures variation in texture across frames'
-            }
-        }
-        
+        return await self._analyze_metric('video', VIDEO_METRIC_CONFIGS, metrics, metric_name)
+    
+    async def _analyze_image_metric(self, metrics: Dict[str, Any], metric_name: str) -> Dict[str, Any]:
+        """Analyze a single image metric and return structured data."""
+        return await self._analyze_metric('image', IMAGE_METRIC_CONFIGS, metrics, metric_name)
+    
+    async def _analyze_metric(self, media_type: str, metric_configs: Dict[str, Any], metrics: Dict[str, Any], metric_name: str) -> Dict[str, Any]:
         if metric_name not in metric_configs:
-            return {
-                'error': f"Unknown metric: {metric_name}",
-                'metric_name': metric_name
-            }
+            return unknown_metric_result(metric_name)
         
         config = metric_configs[metric_name]
         actual_value = metrics.get(metric_name, 0)
+        status = metric_status(config, actual_value)
         
-        # Determine status
-        if actual_value < config['low_threshold']:
-            status = 'suspicious_low'
-        elif actual_value > config['high_threshold']:
-            status = 'suspicious_high'
-        else:
-            status = 'normal'
-        
-        prompt = build_single_metric_prompt('video', config, actual_value, status)
+        prompt = self._metric_prompt(media_type, config, actual_value, status)
 
         try:
-            analysis = await self._generate_content(prompt)
+            analysis = await self._explain_prompt(prompt)
         except Exception as e:
             analysis = f"Error generating analysis: {str(e)}"
         
-        return {
-            'metric_name': metric_name,
-            'display_name': config['display_name'],
-            'actual_value': actual_value,
-            'expected_range': config['expected_range'],
-            'description': config['description'],
-            'analysis': analysis,
-            'status': status
-        }
+        return build_metric_result(metric_name, config, actual_value, status, analysis)
     
-    async def _analyze_image_metric(self, metrics: Dict[str, Any], metric_name: str) -> Dict[str, Any]:
-        """Analyze a single image metric and return structured data."""
-        
-        # Define metric configurations
-        metric_configs = {
-            'avg_texture_variance': {
-                'display_name': 'Texture Variance',
-                'expected_range': '250-600',
-                'low_threshold': 250,
-                'high_threshold': 600,
-                'description': 'Measures local variance of fine details (fur, grass, skin)'
-            },
-            'texture_std': {
-                'display_name': 'Texture Standard Deviation',
-                'expected_range': '100-10000',
-                'low_threshold': 100,
-                'high_threshold': 10000,
-                'description': 'Measures variation in texture across the image'
-            },
-            'edge_density': {
-                'display_name': 'Edge Density',
-                'expected_range': '0.03-0.10',
-                'low_threshold': 0.03,
-                'high_threshold': 0.10,
-                'description': 'Ratio of detected edges to total pixels'
-            },
-            'color_variance': {
-                'display_name': 'Color Variance',
-                'expected_range': '3000-8000',
-                'low_threshold': 3000,
-                'high_threshold': 8000,
-                'description': 'Measures diversity in color saturation and hue distribution'
-            },
-            'edge_continuity': {
-                'display_name': 'Edge Continuity',
-                'expected_range': '20-80',
-                'low_threshold': 20,
-                'high_threshold': 80,
-                'description': 'Average contour length across all detected edges'
-            }
-        }
-        
-        if metric_name not in metric_configs:
-            return {
-                'error': f"Unknown metric: {metric_name}",
-                'metric_name': metric_name
-            }
-        
-        config = metric_configs[metric_name]
-        actual_value = metrics.get(metric_name, 0)
+    async def stream_all_metrics(self, analysis_result: Dict[str, Any]) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        """
+        Stream every metric's explanation concurrently, multiplexed into one sequence of events:
+        ('metric', {'metric_name', 'delta'}) for each piece of text, then
+        ('metric_done', <same dict as explain_individual_metric>) once a metric is complete.
+        Streaming is always per-metric; the batched JSON reply can't be shown incrementally.
+        """
+        media_type = analysis_result['metadata']['type']
+        metrics = analysis_result.get('metrics', {})
+        metric_configs = VIDEO_METRIC_CONFIGS if media_type == 'video' else IMAGE_METRIC_CONFIGS
+        events = asyncio.Queue()
         
-        # Determine status
-        if actual_value < config['low_threshold']:
-            status = 'suspicious_low'
-        elif actual_value > config['high_threshold']:
-            status = 'suspicious_high'
-        else:
-            status = 'normal'
+        async def run(metric_name: str):
+            if metric_name not in metric_configs:
+                await events.put(('metric_done', unknown_metric_result(metric_name)))
+                return
+            config = metric_configs[metric_name]
+            actual_value = metrics.get(metric_name, 0)
+            status = metric_status(config, actual_value)
+            prompt = self._metric_prompt(media_type, config, actual_value, status)
+            
+            cached = self.cache.get(self.models['metric'], prompt) if self.cache else None
+            if cached is not None:
+                await events.put(('metric_done', build_metric_result(metric_name, config, actual_value, status, cached)))
+                return
+            
+            parts = []
+            try:
+                async for delta in self._stream_content(prompt):
+                    parts.append(delta)
+                    await events.put(('metric', {'metric_name': metric_name, 'delta': delta}))
+                analysis = "".join(parts)
+                if self.cache is not None:
+                    self.cache.set(self.models['metric'], prompt, analysis)
+            except Exception as e:
+                analysis = f"Error generating analysis: {str(e)}"
+            await events.put(('metric_done', build_metric_result(metric_name, config, actual_value, status, analysis)))
         
-        prompt = build_single_metric_prompt('image', config, actual_value, status)
-
+        tasks = [asyncio.create_task(run(metric_name)) for metric_name in metrics.keys()]
+        remaining = len(tasks)
         try:
-            analysis = await self._generate_content(prompt)
-        except Exception as e:
-            analysis = f"Error generating analysis: {str(e)}"
+            while remaining:
+                event, data = await events.get()
+                if event == 'metric_done':
+                    remaining -= 1
+                yield event, data
+        finally:
+            # The consumer went away (e.g. client disconnected): stop generating
+            for task in tasks:
+                task.cancel()
+
+    async def prewarm(self, corpus: Iterable[Dict[str, Any]]) -> int:
+        """
+        Fill the explanation cache from past analysis results, one result at a time so
+        warming never takes more than one generation slot.
         
-        return {
-            'metric_name': metric_name,
-            'display_name': config['display_name'],
-            'actual_value': actual_value,
-            'expected_range': config['expected_range'],
-            'description': config['description'],
-            'analysis': analysis,
-            'status': status
-        }
\ No newline at end of file
+        Args:
+            corpus (iterable): analysis_result dicts, e.g. from iter_corpus
+            
+        Returns:
+            int: Number of analysis results processed
+        """
+        count = 0
+        for analysis_result in corpus:
+            await self.analyze_all_metrics(analysis_result)
+            count += 1
+        return count
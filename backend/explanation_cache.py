@@ -0,0 +1,143 @@
+import asyncio, hashlib, json, math, os
+from cachetools import LRUCache
+from result_cache import SQLiteCacheTier
+from telemetry import CACHE_LOOKUPS
+
+from typing import Dict, Any, Optional, Callable, Awaitable, Iterator
+
+
+def quantize_value(config: Dict[str, Any], actual_value: float, status: str, bands: int) -> float:
+    """
+    Snap a metric value to the centre of its band, so nearby values produce the same prompt.
+
+    The expected range [low_threshold, high_threshold] is split into `bands` equal bands and
+    the same width continues outside it. Band edges fall on both thresholds, so the snapped
+    value always has the same status as the real one.
+
+    Args:
+        config (dict): Metric config with 'low_threshold' and 'high_threshold'.
+        actual_value (float): Measured value.
+        status (str): Status of the measured value, from metric_status.
+        bands (int): Bands across the expected range; 0 disables quantization.
+
+    Returns:
+        float: Band centre, or actual_value unchanged if quantization is off.
+    """
+    low, high = config['low_threshold'], config['high_threshold']
+    if bands <= 0 or high <= low:
+        return actual_value
+    width = (high - low) / bands
+    band = math.floor((actual_value - low) / width)
+    if status == 'normal':
+        # A value sitting exactly on high_threshold is still in range
+        band = min(band, bands - 1)
+    return low + (band + 0.5) * width
+
+
+def normalize_prompt(prompt: str) -> str:
+    return " ".join(prompt.split())
+
+
+def iter_corpus(path: str) -> Iterator[Dict[str, Any]]:
+    """
+    Yield analysis results from a JSON Lines file, one per line. A line is either an
+    analysis_result itself or an object holding one under 'analysis_result'
+    (as in cached /upload responses).
+    """
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                yield record.get("analysis_result", record)
+
+
+class ExplanationCache:
+    """
+    Cache of LLM explanations keyed on the normalized prompt plus the model name.
+
+    An in-process LRU tier, backed by an optional SQLite tier with TTL expiry (shared
+    implementation with the result cache). Concurrent requests for the same prompt are
+    coalesced into a single generation.
+    """
+
+    def __init__(self,
+                 max_entries: int = int(os.getenv("EXPLANATION_CACHE_MAX", "4096")),
+                 db_path: Optional[str] = os.getenv("EXPLANATION_CACHE_DB"),
+                 ttl: float = float(os.getenv("EXPLANATION_CACHE_TTL", str(30 * 24 * 3600)))):
+        """
+        Args:
+            max_entries (int): Explanations kept in memory before the least recently used is evicted.
+            db_path (str): SQLite file for the persistent tier; None keeps the cache in memory only.
+            ttl (float): Seconds an entry lives in the persistent tier.
+        """
+        self.memory = LRUCache(maxsize=max_entries)
+        self.disk = SQLiteCacheTier(db_path, ttl) if db_path else None
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def key(self, model: str, prompt: str) -> str:
+        payload = json.dumps([model, normalize_prompt(prompt)]).encode()
+        return hashlib.sha256(payload).hexdigest()
+
+    def get(self, model: str, prompt: str) -> Optional[str]:
+        key = self.key(model, prompt)
+        text = self.memory.get(key)
+        if text is None and self.disk is not None:
+            blob = self.disk.get(key)
+            if blob is not None:
+                text = blob.decode()
+                self.memory[key] = text
+        if text is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        CACHE_LOOKUPS.inc(cache="explanation", result="miss" if text is None else "hit")
+        return text
+
+    def set(self, model: str, prompt: str, text: str):
+        # An empty completion (e.g. a stream that ended without content) isn't an explanation
+        if not text or not text.strip():
+            return
+        key = self.key(model, prompt)
+        self.memory[key] = text
+        if self.disk is not None:
+            self.disk.set(key, text.encode())
+
+    async def get_or_generate(self, model: str, prompt: str, generate: Callable[[], Awaitable[str]]) -> str:
+        """
+        Return the cached explanation, or generate it once however many callers ask at the
+        same time. Failures propagate to every waiting caller; they and empty results are not cached.
+        """
+        text = self.get(model, prompt)
+        if text is not None:
+            return text
+
+        key = self.key(model, prompt)
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            task = asyncio.ensure_future(generate())
+            self._inflight[key] = task
+
+            def finished(t: asyncio.Future):
+                self._inflight.pop(key, None)
+                if not t.cancelled() and t.exception() is None:
+                    self.set(model, prompt, t.result())
+
+            task.add_done_callback(finished)
+        # One caller going away must not cancel the generation the others are waiting on
+        return await asyncio.shield(task)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self.memory),
+            "max_entries": self.memory.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "inflight": len(self._inflight),
+            "persistent": self.disk is not None,
+        }
@@ -1,4 +1,5 @@
 import mimetypes
+from concurrent.futures import ThreadPoolExecutor
 from detector import scan_image, scan_video
 from attrClassifier import MediaAnalyzer
 
@@ -11,17 +12,60 @@ def detect_file_type(path):
             return "video"
     return "unknown"
 
+# Bytes needed by sniff_media_type (the WebM doctype sits inside the EBML header)
+SNIFF_BYTES = 64
+
+def sniff_media_type(head):
+    """
+    Identify a file from its leading bytes instead of its name.
+
+    Args:
+        head (bytes): At least the first SNIFF_BYTES of the file (or all of it, if shorter).
+
+    Returns:
+        tuple: (file_type, extension), e.g. ("image", ".jpg"), or None for unsupported content.
+    """
+    if head.startswith(b"\xff\xd8\xff"):
+        return "image", ".jpg"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image", ".png"
+    if head[:6] in (b"GIF87a", b"GIF89a"):
+        return "image", ".gif"
+    if head[:4] in (b"II*\x00", b"MM\x00*"):
+        return "image", ".tiff"
+    if head.startswith(b"BM") and len(head) >= 26 and head[6:10] == b"\x00\x00\x00\x00":
+        return "image", ".bmp"
+    if head.startswith(b"RIFF") and head[8:12] == b"WEBP":
+        return "image", ".webp"
+    if head.startswith(b"RIFF") and head[8:12] == b"AVI ":
+        return "video", ".avi"
+    if head[4:8] == b"ftyp":
+        brand = head[8:12]
+        if brand in (b"heic", b"heix", b"mif1", b"msf1", b"avif"):
+            return None  # HEIF stills, which OpenCV can't decode
+        return "video", ".mov" if brand == b"qt  " else ".mp4"
+    if head.startswith(b"\x1a\x45\xdf\xa3"):
+        return "video", ".webm" if b"webm" in head[:SNIFF_BYTES] else ".mkv"
+    if head.startswith(b"FLV\x01"):
+        return "video", ".flv"
+    if head.startswith(b"\x00\x00\x01\xba"):
+        return "video", ".mpg"
+    return None
+
 def get_results(file_path):
     file_type = detect_file_type(file_path)
     if file_type == "unknown":
         return ValueError("Unsupported file type")
     analyzer = MediaAnalyzer()
-    if file_type == "image":
-        ai_scan_result = scan_image(file_path)
-        analysis_result = analyzer.analyze_image(file_path)
-    elif file_type == "video":
-        ai_scan_result = scan_video(file_path)
-        analysis_result = analyzer.analyze_video(file_path)
+    # The scan is mostly waiting on the network, so run it alongside the CV analysis
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        if file_type == "image":
+            scan = pool.submit(scan_image, file_path)
+            analysis_result = analyzer.analyze_image(file_path)
+        elif file_type == "video":
+            scan = pool.submit(scan_video, file_path)
+            analysis_result = analyzer.analyze_video(file_path)
+        ai_scan_result = scan.result()
 
     return ai_scan_result, analysis_result
 
@@ -0,0 +1,219 @@
+import asyncio, os, secrets, time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from cachetools import TTLCache
+
+from typing import Dict, Any, Optional, Callable, Awaitable, List
+
+JOB_STAGES = ('save', 'cv', 'verdict', 'overview', 'metrics')
+TERMINAL_EVENTS = ('done', 'failed')
+
+
+class JobQueueFull(Exception):
+    """Raised when a job is submitted while the queue is at capacity."""
+
+
+class Job:
+    """
+    One upload moving through the analysis stages.
+
+    Every state change is recorded as an event; subscribers (e.g. a WebSocket) get
+    the history so far followed by live events.
+    """
+
+    def __init__(self, job_id: str, client: str, params: Optional[Dict[str, Any]] = None, stages=JOB_STAGES):
+        self.job_id = job_id
+        self.client = client
+        self.params = params or {}  # Inputs for the runner, e.g. the stored upload
+        self.status = 'queued'  # queued -> running -> done | failed
+        self.stages = {name: {'status': 'pending'} for name in stages}
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.events: List[Dict[str, Any]] = []
+        self._subscribers: List[asyncio.Queue] = []
+
+    def emit(self, event: str, **data: Any):
+        message = {'event': event, 'job_id': self.job_id, 'time': time.time(), **data}
+        self.events.append(message)
+        for queue in self._subscribers:
+            queue.put_nowait(message)
+
+    def subscribe(self) -> asyncio.Queue:
+        queue = asyncio.Queue()
+        for message in self.events:
+            queue.put_nowait(message)
+        self._subscribers.append(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        if queue in self._subscribers:
+            self._subscribers.remove(queue)
+
+    def start_stage(self, name: str):
+        self.stages[name] = {'status': 'running', 'started_at': time.time()}
+        self.emit('stage_started', stage=name)
+
+    def finish_stage(self, name: str, status: str = 'done', **data: Any):
+        """status is 'done', 'cached' (served from a cache) or 'failed'."""
+        stage = self.stages[name]
+        stage['status'] = status
+        stage['finished_at'] = time.time()
+        if 'started_at' in stage:
+            stage['seconds'] = stage['finished_at'] - stage['started_at']
+        self.emit('stage_finished', stage=name, status=status, **data)
+
+    def complete(self, result: Dict[str, Any]):
+        self.status = 'done'
+        self.result = result
+        self.emit('done', result=result)
+
+    def fail(self, error: str):
+        self.status = 'failed'
+        self.error = error
+        for stage in self.stages.values():
+            if stage['status'] == 'running':
+                stage['status'] = 'failed'
+        self.emit('failed', error=error)
+
+    @property
+    def finished(self) -> bool:
+        return self.status in TERMINAL_EVENTS
+
+    def progress(self) -> float:
+        done = sum(1 for s in self.stages.values() if s['status'] in ('done', 'cached'))
+        return done / len(self.stages)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            'job_id': self.job_id,
+            'status': self.status,
+            'progress': self.progress(),
+            'stages': self.stages,
+            'result': self.result,
+            'error': self.error,
+            'created_at': self.created_at,
+        }
+
+
+class JobQueue:
+    """
+    Bounded in-process job queue with round-robin fairness across clients, so one
+    client submitting many uploads can't starve the others.
+
+    `runner` does the work for a job; it is the seam for moving execution out of
+    process later (anything that drives a Job's stages and completes or fails it).
+    Stages share per-stage concurrency limits through `stage()`.
+    """
+
+    def __init__(self,
+                 runner: Callable[[Job], Awaitable[None]],
+                 workers: int = int(os.getenv("JOB_WORKERS", "4")),
+                 max_queued: int = int(os.getenv("JOB_MAX_QUEUED", "100")),
+                 stage_limits: Optional[Dict[str, int]] = None,
+                 max_jobs: int = int(os.getenv("JOB_MAX", "1000")),
+                 ttl: float = float(os.getenv("JOB_TTL", "3600"))):
+        """
+        Args:
+            runner (callable): async runner(job) that executes the job's stages.
+            workers (int): Jobs run at the same time.
+            max_queued (int): Jobs waiting to run before submit raises JobQueueFull.
+            stage_limits (dict): Stage name -> max jobs inside that stage at once;
+                stages not listed are only bounded by `workers`.
+            max_jobs (int): Jobs remembered for status lookups.
+            ttl (float): Seconds a job stays available for status lookups.
+        """
+        self.runner = runner
+        self.workers = workers
+        self.max_queued = max_queued
+        self.stage_limits = stage_limits or {}
+        self.jobs = TTLCache(maxsize=max_jobs, ttl=ttl)
+        self._queues: "OrderedDict[str, deque]" = OrderedDict()
+        self._queued = 0
+        self._available: Optional[asyncio.Semaphore] = None
+        self._stage_semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._tasks: List[asyncio.Task] = []
+
+    def start(self):
+        self._available = asyncio.Semaphore(0)
+        self._stage_semaphores = {name: asyncio.Semaphore(limit) for name, limit in self.stage_limits.items()}
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def shutdown(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def create(self, client: str, params: Optional[Dict[str, Any]] = None) -> Job:
+        job = Job(secrets.token_urlsafe(16), client, params)
+        self.jobs[job.job_id] = job
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        self.jobs.expire()
+        return self.jobs.get(job_id)
+
+    def has_capacity(self) -> bool:
+        return self._queued < self.max_queued
+
+    def submit(self, job: Job):
+        if not self.has_capacity():
+            raise JobQueueFull(f"{self._queued} jobs already queued")
+        self._queues.setdefault(job.client, deque()).append(job)
+        self._queued += 1
+        job.emit('queued', queued=self._queued)
+        self._available.release()
+
+    def _next_job(self) -> Job:
+        # Take from the client at the front, then send that client to the back
+        client, queue = next(iter(self._queues.items()))
+        job = queue.popleft()
+        if queue:
+            self._queues.move_to_end(client)
+        else:
+            del self._queues[client]
+        self._queued -= 1
+        return job
+
+    async def _worker(self):
+        while True:
+            await self._available.acquire()
+            job = self._next_job()
+            job.status = 'running'
+            job.emit('running')
+            try:
+                await self.runner(job)
+            except asyncio.CancelledError:
+                job.fail("Server shutting down")
+                raise
+            except Exception as e:
+                job.fail(str(e))
+            if not job.finished:
+                job.fail("Job ended without a result")
+
+    @asynccontextmanager
+    async def stage(self, job: Job, name: str):
+        """Run one stage of a job under that stage's concurrency limit, recording progress."""
+        semaphore = self._stage_semaphores.get(name)
+        if semaphore is not None:
+            await semaphore.acquire()
+        job.start_stage(name)
+        try:
+            yield
+        except BaseException:
+            job.finish_stage(name, 'failed')
+            raise
+        finally:
+            if semaphore is not None:
+                semaphore.release()
+        job.finish_stage(name)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'workers': self.workers,
+            'queued': self._queued,
+            'max_queued': self.max_queued,
+            'clients_waiting': len(self._queues),
+            'stage_limits': self.stage_limits,
+        }
@@ -0,0 +1,116 @@
+import asyncio, heapq, itertools, os, time
+from collections import deque
+from contextlib import asynccontextmanager
+from telemetry import LLM_SECONDS
+
+from typing import Dict, Any
+
+# Lower value is served first
+PRIORITY_OVERVIEW = 0
+PRIORITY_METRIC = 1
+PRIORITY_NAMES = {PRIORITY_OVERVIEW: 'overview', PRIORITY_METRIC: 'metric'}
+
+
+class LatencyStats:
+    """Count, mean, max and percentiles over a window of recent samples (seconds)."""
+
+    def __init__(self, window: int = 1024):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.recent = deque(maxlen=window)
+
+    def record(self, seconds: float):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.recent.append(seconds)
+
+    def percentile(self, q: float) -> float:
+        if not self.recent:
+            return 0.0
+        ordered = sorted(self.recent)
+        return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+    def summary(self) -> Dict[str, float]:
+        return {
+            'count': self.count,
+            'mean': self.total / self.count if self.count else 0.0,
+            'p50': self.percentile(0.50),
+            'p95': self.percentile(0.95),
+            'p99': self.percentile(0.99),
+            'max': self.max,
+        }
+
+
+class LLMGovernor:
+    """
+    Caps how many LLM calls run at once against the single local model server.
+    Calls beyond the cap wait in a priority queue, so overview explanations (which the
+    user is waiting on) are served ahead of detail-metric explanations, FIFO otherwise.
+    """
+
+    def __init__(self, max_concurrency: int = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))):
+        """
+        Args:
+            max_concurrency (int): Simultaneous generations; match the server's
+                parallelism (e.g. OLLAMA_NUM_PARALLEL) to keep it busy without thrashing.
+        """
+        self.max_concurrency = max_concurrency
+        self.active = 0
+        self._waiters = []
+        self._sequence = itertools.count()
+        self.queue_wait = {p: LatencyStats() for p in PRIORITY_NAMES}
+        self.generation = {p: LatencyStats() for p in PRIORITY_NAMES}
+
+    @property
+    def waiting(self) -> int:
+        return sum(1 for _, _, f in self._waiters if not f.done())
+
+    async def _acquire(self, priority: int):
+        if self.active < self.max_concurrency and not self.waiting:
+            self.active += 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._sequence), future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            # Granted the slot just as we were cancelled: hand it on
+            if future.done() and not future.cancelled():
+                self._release()
+            raise
+
+    def _release(self):
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                # Pass the slot straight to the next waiter; active stays the same
+                future.set_result(None)
+                return
+        self.active -= 1
+
+    @asynccontextmanager
+    async def slot(self, priority: int = PRIORITY_METRIC):
+        """Hold one generation slot for the duration of the block."""
+        t0 = time.time()
+        await self._acquire(priority)
+        t1 = time.time()
+        self.queue_wait[priority].record(t1 - t0)
+        LLM_SECONDS.observe(t1 - t0, phase="queue_wait", priority=PRIORITY_NAMES[priority])
+        try:
+            yield
+        finally:
+            elapsed = time.time() - t1
+            self.generation[priority].record(elapsed)
+            LLM_SECONDS.observe(elapsed, phase="generation", priority=PRIORITY_NAMES[priority])
+            self._release()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'max_concurrency': self.max_concurrency,
+            'active': self.active,
+            'waiting': self.waiting,
+            'queue_wait': {PRIORITY_NAMES[p]: s.summary() for p, s in self.queue_wait.items()},
+            'generation': {PRIORITY_NAMES[p]: s.summary() for p, s in self.generation.items()},
+        }
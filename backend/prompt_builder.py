@@ -1,4 +1,4 @@
-from typing import Dict, Any
+from typing import Dict, Any, List, Tuple
 
 async def build_video_overall_prompt(metadata: Dict[str, Any], metrics: Dict[str, Any], verdict, confidence) -> str:
     prompt = f"""Role: Deepfake detection expert.
@@ -31,9 +31,12 @@ Metrics (Value vs Normal Range):
 Explain why the image is likely {verdict} based on the most significant metrics. Be concise. No formatting."""
     return prompt
 
+def format_metric_value(media_type: str, actual_value: float) -> str:
+    return f"{actual_value:.2f}" if media_type == 'video' else f"{actual_value:.4f}"
+
 def build_single_metric_prompt(media_type: str, config: Dict[str, Any], actual_value: float, status: str) -> str:
     status_text = 'Within normal range' if status == 'normal' else 'Outside normal range'
-    val_str = f"{actual_value:.2f}" if media_type == 'video' else f"{actual_value:.4f}"
+    val_str = format_metric_value(media_type, actual_value)
     
     return f"""Role: Deepfake expert.
 Task: Analyze this single metric in 2 sentences.
@@ -42,3 +45,21 @@ Value: {val_str} (Range: {config['expected_range']})
 Status: {status_text}
 
 Explain what this value indicates about the {media_type} (e.g., "like natural hand shake" or "artificial smoothing"). Be concise. No formatting."""
+
+def build_batched_metric_prompt(media_type: str, entries: List[Tuple[str, Dict[str, Any], float, str]]) -> str:
+    """Build one prompt covering several metrics. entries: (metric_name, config, actual_value, status)."""
+    lines = []
+    for metric_name, config, actual_value, status in entries:
+        status_text = 'Within normal range' if status == 'normal' else 'Outside normal range'
+        val_str = format_metric_value(media_type, actual_value)
+        lines.append(f"- {metric_name}: {config['display_name']} ({config['description']}). Value: {val_str} (Range: {config['expected_range']}). Status: {status_text}")
+    metric_lines = "\n".join(lines)
+    keys = ", ".join(f'"{metric_name}"' for metric_name, _, _, _ in entries)
+
+    return f"""Role: Deepfake expert.
+Task: Analyze each metric below in 2 sentences.
+Metrics:
+{metric_lines}
+
+For each metric, explain what its value indicates about the {media_type} (e.g., "like natural hand shake" or "artificial smoothing"). Be concise. No formatting inside the explanations.
+Respond with only a JSON object with exactly these keys: {keys}. Each value is the explanation string for that metric."""
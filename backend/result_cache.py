@@ -0,0 +1,136 @@
+import hashlib, json, os, sqlite3, threading, time
+from cachetools import LRUCache
+from telemetry import CACHE_LOOKUPS
+
+from typing import Dict, Any, Optional
+
+
+def cache_version(*parts: Any) -> str:
+    """Short, stable digest of everything that changes a cached result (analyzer params, model name, ...)."""
+    payload = json.dumps(parts, sort_keys=True, default=str).encode()
+    return hashlib.sha256(payload).hexdigest()[:12]
+
+
+class SQLiteCacheTier:
+    """
+    Persistent key -> bytes store with per-entry expiry.
+    Shared by the result cache and the explanation cache.
+    """
+
+    def __init__(self, path: str, ttl: float):
+        self.path = path
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value BLOB, expires_at REAL)"
+            )
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] < time.time():
+                with self._conn:
+                    self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+                return None
+            return row[0]
+
+    def set(self, key: str, value: bytes):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, value, time.time() + self.ttl),
+            )
+
+    def evict_expired(self) -> int:
+        with self._lock, self._conn:
+            return self._conn.execute("DELETE FROM cache WHERE expires_at < ?", (time.time(),)).rowcount
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class ResultCache:
+    """
+    Content-addressed cache of /upload results, keyed on the SHA-256 of the file
+    bytes plus a version string.
+
+    Entries are stored as JSON bytes: an in-process LRU tier bounded by total size,
+    backed by an optional SQLite tier with TTL expiry. Disk hits are promoted to memory.
+    """
+
+    def __init__(self,
+                 version: str,
+                 max_bytes: int = int(os.getenv("RESULT_CACHE_MAX_BYTES", str(64 * 1024 * 1024))),
+                 db_path: Optional[str] = os.getenv("RESULT_CACHE_DB"),
+                 ttl: float = float(os.getenv("RESULT_CACHE_TTL", str(7 * 24 * 3600)))):
+        """
+        Args:
+            version (str): Mixed into every key, so changing analyzer parameters or the
+                LLM model never serves results produced under the old settings.
+            max_bytes (int): Byte budget of the in-memory tier.
+            db_path (str): SQLite file for the persistent tier; None keeps the cache in memory only.
+            ttl (float): Seconds an entry lives in the persistent tier.
+        """
+        self.version = version
+        self.memory = LRUCache(maxsize=max_bytes, getsizeof=len)
+        self.disk = SQLiteCacheTier(db_path, ttl) if db_path else None
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, content_hash: str) -> str:
+        return f"{self.version}:{content_hash}"
+
+    def get(self, content_hash: str) -> Optional[Dict[str, Any]]:
+        blob = self._load(self.key(content_hash))
+        if blob is None:
+            self.misses += 1
+            CACHE_LOOKUPS.inc(cache="result", result="miss")
+            return None
+        self.hits += 1
+        CACHE_LOOKUPS.inc(cache="result", result="hit")
+        return json.loads(blob)
+
+    def set(self, content_hash: str, entry: Dict[str, Any]):
+        key = self.key(content_hash)
+        blob = json.dumps(entry).encode()
+        self._remember(key, blob)
+        if self.disk is not None:
+            self.disk.set(key, blob)
+
+    def update(self, content_hash: str, **fields: Any):
+        """Add fields (e.g. metric explanations produced later) to an existing entry."""
+        blob = self._load(self.key(content_hash))
+        if blob is not None:
+            entry = json.loads(blob)
+            entry.update(fields)
+            self.set(content_hash, entry)
+
+    def _load(self, key: str) -> Optional[bytes]:
+        blob = self.memory.get(key)
+        if blob is None and self.disk is not None:
+            blob = self.disk.get(key)
+            if blob is not None:
+                self._remember(key, blob)
+        return blob
+
+    def _remember(self, key: str, blob: bytes):
+        # Entries larger than the whole budget are only kept on disk
+        if len(blob) <= self.memory.maxsize:
+            self.memory[key] = blob
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self.memory),
+            "bytes": self.memory.currsize,
+            "max_bytes": self.memory.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "persistent": self.disk is not None,
+        }
@@ -1,15 +1,116 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException, Body
+from fastapi import FastAPI, HTTPException, Request, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from explainability import ExplainabilityEngine
-from file_validation_service import detect_file_type, get_results
-from attrClassifier import MediaAnalyzer
+from fastapi.responses import StreamingResponse, PlainTextResponse, Response
+from explainability import ExplainabilityEngine, DEFAULT_MODEL, METRIC_MODEL
+from analysis_executor import AnalysisExecutor, AnalysisQueueFull, AnalysisTimeout
+from result_cache import ResultCache, cache_version
+from session_store import SessionStore, AnalysisSession
+from explanation_cache import ExplanationCache, iter_corpus
+from detector import VerdictClient, VerdictError
+from job_queue import JobQueue, JobQueueFull, Job, TERMINAL_EVENTS
+from storage_manager import StorageManager
+from upload_store import UploadStore, ResumableUploads, UploadRejected, upload_body
+from batch_scan import BatchProgress, iter_media_paths, open_writer, run_batch, OUTPUT_FORMATS
+from serialization import encode_response, negotiate, shape_raw_data
+from telemetry import REGISTRY, HTTP_SECONDS, Gauge, log, monitor_event_loop, request_id, span
 
-import shutil, os, asyncio, random, time
+import json, os, asyncio, random, re, secrets, time
+from contextlib import asynccontextmanager
+from cachetools import TTLCache
 from pydantic import BaseModel
-from typing import Dict, Any
+from typing import Dict, Any, Optional, List
 
-app = FastAPI()
+# Start metric explanations in the background as soon as CV analysis is done
+SPECULATIVE_METRICS = os.getenv("SPECULATIVE_METRICS", "1") == "1"
+# JSON Lines file of past analysis results used to fill the explanation cache on startup
+EXPLANATION_PREWARM = os.getenv("EXPLANATION_PREWARM")
+# Load the LLM models on startup and keep them loaded (see LLM_KEEP_ALIVE*)
+LLM_WARMUP = os.getenv("LLM_WARMUP", "1") == "1"
+# 'api' asks AI-or-NOT (see AIORNOT_* env vars); 'random' fakes a verdict to save credits
+VERDICT_SOURCE = os.getenv("VERDICT_SOURCE", "random")
+# Period of the event loop lag probe behind trueview_event_loop_lag_seconds; 0 disables it
+EVENT_LOOP_PROBE_INTERVAL = float(os.getenv("EVENT_LOOP_PROBE_INTERVAL", "0.1"))
+
+# CV work runs on a dedicated, sized pool (see ANALYSIS_* env vars) instead of the default thread executor
+analysis_executor = AnalysisExecutor()
+
+# Repeat uploads of the same bytes skip CV, verdict and LLM work (see RESULT_CACHE_* env vars)
+result_cache = ResultCache(version=cache_version(analysis_executor.cache_signature(), DEFAULT_MODEL, METRIC_MODEL, VERDICT_SOURCE))
+
+# Uploads are referenced by analysis_id afterwards (see SESSION_* env vars)
+session_store = SessionStore()
+
+# One LLM client (and connection pool) for the whole app, created on startup;
+# concurrent generations are capped by its governor (see LLM_MAX_CONCURRENCY)
+explainer: Optional[ExplainabilityEngine] = None
+verdict_client: Optional[VerdictClient] = None
+
+# Metric explanations are reused across uploads with the same prompt (see EXPLANATION_* env vars)
+explanation_cache = ExplanationCache()
+
+async def prewarm_explanations(path: str):
+    t0 = time.time()
+    try:
+        count = await explainer.prewarm(iter_corpus(path))
+        log.info(f"Explanation cache pre-warmed from {count} results: {time.time() - t0:.4f}s")
+    except Exception as e:
+        log.warning(f"Explanation cache pre-warm failed: {e}")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global explainer, verdict_client
+    analysis_executor.start()
+    explainer = ExplainabilityEngine(cache=explanation_cache)
+    if VERDICT_SOURCE == "api":
+        verdict_client = VerdictClient()
+    job_queue.start()
+    storage.start()
+    prewarm = asyncio.create_task(prewarm_explanations(EXPLANATION_PREWARM)) if EXPLANATION_PREWARM else None
+    loop_probe = asyncio.create_task(monitor_event_loop(EVENT_LOOP_PROBE_INTERVAL)) if EVENT_LOOP_PROBE_INTERVAL > 0 else None
+    # In the background: requests are accepted meanwhile and simply wait for the model to load
+    model_keeper = asyncio.create_task(explainer.keep_warm()) if LLM_WARMUP else None
+    yield
+    if model_keeper is not None:
+        model_keeper.cancel()
+    if loop_probe is not None:
+        loop_probe.cancel()
+    for task in batch_tasks.values():
+        task.cancel()
+    await job_queue.shutdown()
+    await storage.shutdown()
+    if prewarm is not None:
+        prewarm.cancel()
+    await explainer.aclose()
+    if verdict_client is not None:
+        await verdict_client.aclose()
+    analysis_executor.shutdown()
+
+app = FastAPI(lifespan=lifespan)
+
+# Caller-supplied request IDs are echoed back and logged only if they look like IDs
+REQUEST_ID_PATTERN = re.compile(r"[\w.-]{1,64}")
+
+@app.middleware("http")
+async def trace_request(request: Request, call_next):
+    """Tag the request's logs with a request ID and time it into trueview_http_request_seconds."""
+    rid = request.headers.get("x-request-id", "")
+    if not REQUEST_ID_PATTERN.fullmatch(rid):
+        rid = secrets.token_hex(8)
+    token = request_id.set(rid)
+    t0 = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        response.headers["X-Request-ID"] = rid
+        return response
+    finally:
+        # Route template, not the raw path, so IDs in the URL don't explode the label set.
+        # Streaming responses are timed up to their headers, not to the end of the body.
+        route = getattr(request.scope.get("route"), "path", "unmatched")
+        HTTP_SECONDS.observe(time.perf_counter() - t0, method=request.method, route=route, status=status)
+        request_id.reset(token)
 
 app.add_middleware(
     CORSMiddleware,
@@ -21,79 +122,771 @@ app.add_middleware(
 
 # Use absolute path relative to this file to ensure consistency regardless of where the server is run
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-UPLOAD_FOLDER = os.path.join(BASE_DIR, "media")
+UPLOAD_FOLDER = os.getenv("UPLOAD_FOLDER", os.path.join(BASE_DIR, "media"))
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
-app.mount("/media", StaticFiles(directory=UPLOAD_FOLDER), name="media")
+# Quota, LRU/TTL eviction and previews for the upload folder (see MEDIA_* env vars)
+storage = StorageManager(UPLOAD_FOLDER)
 
-@app.post("/upload")
-async def upload_file(file: UploadFile = File(...)):
-    start_total = time.time()
-    filepath = os.path.join(UPLOAD_FOLDER, file.filename)
+class MediaFiles(StaticFiles):
+    """Serves stored uploads and previews, recording each access for LRU eviction. Partial uploads aren't served."""
+
+    async def get_response(self, path: str, scope):
+        if path.startswith((".incoming", ".resumable")):
+            raise HTTPException(status_code=404)
+        response = await super().get_response(path, scope)
+        storage.touch(path)
+        return response
+
+app.mount("/media", MediaFiles(directory=UPLOAD_FOLDER), name="media")
 
-    file_type = detect_file_type(file.filename)
-    if file_type == "unknown":
-        raise HTTPException(status_code=400, detail="Unsupported file type")
-    
-    with open(filepath, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+# Uploads are streamed into content-addressed files (see UPLOAD_MAX_* env vars)
+upload_store = UploadStore(UPLOAD_FOLDER)
 
-    print(f"File saved to: {filepath} ({time.time() - start_total:.4f}s)")
+async def save_upload(request: Request, shed_load: bool = True):
+    """
+    Stream an upload to disk, validating and hashing it on the way.
+
+    The body is either a multipart form with a `file` field (as the frontend sends it) or
+    the raw file bytes, optionally named with a `filename` query parameter. The type is
+    sniffed from the leading bytes; oversized or unsupported files are refused before the
+    rest of the body is read.
+
+    Args:
+        shed_load (bool): Refuse with 503 when the analysis pool is saturated
+            (jobs are queued instead, so /jobs skips this).
+
+    Returns:
+        tuple: (filepath, response fields describing the stored file). The file is
+            left pinned; see register_upload.
+    """
+    start_time = time.time()
+
+    # Shed load before reading the body
+    if shed_load and not analysis_executor.has_capacity():
+        raise HTTPException(status_code=503, detail="Server busy, try again shortly", headers={"Retry-After": "5"})
+
+    content_length = request.headers.get("content-length")
+    try:
+        declared_size = int(content_length) if content_length else None
+        if declared_size is not None and declared_size < 0:
+            raise ValueError(content_length)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid Content-Length: {content_length}")
+    try:
+        body = upload_body(request.stream(), request.headers.get("content-type", ""), request.query_params.get("filename"))
+        with span("upload.io"):
+            stored = await upload_store.ingest(body, declared_size=declared_size)
+    except UploadRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    register_upload(stored)
+    log.info(f"File saved to: {stored['path']} ({time.time() - start_time:.4f}s{', already stored' if stored['deduplicated'] else ''})")
+    return stored["path"], upload_response(stored, body.filename)
+
+def register_upload(stored: Dict[str, Any]):
+    """
+    Hand a newly stored file to retention (evicting older files if over quota) and start its previews.
+
+    The file is left pinned so other uploads can't evict it before it is analyzed; the
+    caller releases it once a session holds the file or the request has failed.
+    """
+    storage.acquire(stored["path"])
+    try:
+        storage.add(stored["path"])
+    except FileNotFoundError:
+        storage.release(stored["path"])
+        # A deduplicated copy was evicted between the store and this call
+        raise HTTPException(status_code=503, detail="Server busy, try again shortly", headers={"Retry-After": "5"})
+    storage.schedule_previews(stored["path"], stored["type"])
+
+def upload_response(stored: Dict[str, Any], filename: Optional[str]) -> Dict[str, Any]:
+    """Response fields describing a file in the upload store."""
+    stored_name = os.path.basename(stored["path"])
+    return {
+        "status": "success",
+        "filename": filename or stored_name,
+        "path": f"/media/{stored_name}",
+        "size": stored["size"],
+        "type": stored["type"],
+        "content_hash": stored["content_hash"], # Lets /analyze/metrics reuse cached explanations
+        # Smaller derivatives to load instead of the original; generated in the background,
+        # so usually listed by GET /storage/previews/{content_hash} a little later
+        "previews": {kind: f"/media/{rel}" for kind, rel in storage.previews(stored["path"]).items()},
+    }
+
+def create_session(analysis_result: Dict[str, Any], ai_scan_result: Dict[str, Any],
+                   content_hash: str, filepath: str) -> AnalysisSession:
+    """Session for an upload; its media file is kept on disk while the session lives."""
+    session = session_store.create(analysis_result, ai_scan_result, content_hash)
+    storage.acquire(filepath)
+    session.on_close.append(lambda: storage.release(filepath))
+    return session
+
+async def get_verdict(file_type: str, filepath: str) -> Dict[str, Any]:
+    if verdict_client is not None:
+        with span("verdict"):
+            return await verdict_client.scan(file_type, filepath)
+
+    # Using random verdict to save credits
+    is_fake = random.choice([True, False])
+    return {
+        "ai_detected": is_fake,
+        "deepfake_detected": is_fake,
+        "ai_confidence": random.uniform(0.8, 0.99) if is_fake else random.uniform(0.01, 0.2),
+        "deepfake_confidence": random.uniform(0.8, 0.99) if is_fake else random.uniform(0.01, 0.2)
+    }
+
+async def analyze_upload(filepath: str, file_type: str):
+    """
+    Run CV analysis and get the verdict for a stored upload.
 
-    loop = asyncio.get_running_loop()
+    Returns:
+        tuple: (analysis_result, ai_scan_result)
+    """
     t_analysis_start = time.time()
+    # CV analysis and the verdict are independent, so latency is the slower of the two
+    tasks = [
+        asyncio.create_task(analysis_executor.run(file_type, filepath)),
+        asyncio.create_task(get_verdict(file_type, filepath)),
+    ]
     try:
-        # ai_scan_result, analysis_result = await loop.run_in_executor(None, get_results, filepath)
-        
-        # Using local analyzer and random verdict to save credits
-        analyzer = MediaAnalyzer()
-        if "video" in file_type.lower():
-            analysis_result = await loop.run_in_executor(None, analyzer.analyze_video, filepath)
-        else:
-            analysis_result = await loop.run_in_executor(None, analyzer.analyze_image, filepath)
-            
-        is_fake = random.choice([True, False])
-        ai_scan_result = {
-            "ai_detected": is_fake,
-            "deepfake_detected": is_fake,
-            "ai_confidence": random.uniform(0.8, 0.99) if is_fake else random.uniform(0.01, 0.2),
-            "deepfake_confidence": random.uniform(0.8, 0.99) if is_fake else random.uniform(0.01, 0.2)
-        }
+        with storage.hold(filepath):
+            analysis_result, ai_scan_result = await asyncio.gather(*tasks)
+    except VerdictError as e:
+        raise HTTPException(status_code=502, detail=f"Verdict service failed: {str(e)}")
+    except AnalysisQueueFull:
+        raise HTTPException(status_code=503, detail="Server busy, try again shortly", headers={"Retry-After": "5"})
+    except AnalysisTimeout as e:
+        raise HTTPException(status_code=504, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Analysis failed: {str(e)}")
+    finally:
+        # If one side failed, don't leave the other running
+        for task in tasks:
+            task.cancel()
 
-    print(f"CV Analysis & Classification: {time.time() - t_analysis_start:.4f}s")
+    log.info(f"CV Analysis & Classification: {time.time() - t_analysis_start:.4f}s")
+    return analysis_result, ai_scan_result
+
+def cache_upload_result(session: AnalysisSession, brief_overview: str):
+    # Don't pin failed LLM output in the cache
+    if brief_overview.startswith("Error generating explanation"):
+        return
+    entry = {
+        "ai_scan_result": session.ai_scan_result,
+        "analysis_result": session.analysis_result,
+        "brief_overview": brief_overview,
+    }
+    # The speculative task may already be done; if not, it adds its result when it finishes
+    task = session.metrics_task
+    if task is not None and task.done() and not task.cancelled() and task.exception() is None:
+        if not has_llm_errors(task.result()):
+            entry["metric_explanations"] = task.result()
+    result_cache.set(session.content_hash, entry)
+
+def result_response(request: Request, payload: Dict[str, Any]) -> Response:
+    """
+    Encode a response that carries analysis results. `?raw_data=omit` drops the per-frame
+    raw_data, `?raw_offset=`/`?raw_limit=` return one page of it, and the Accept header
+    selects plain JSON or JSON with base64 float32 arrays (see serialization).
+    """
+    params = request.query_params
+    try:
+        shaped = shape_raw_data(payload, params.get("raw_data", "include"), int(params.get("raw_offset", 0)),
+                                int(params["raw_limit"]) if "raw_limit" in params else None)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return encode_response(shaped, negotiate(request.headers.get("accept")))
+
+@app.post("/upload")
+async def upload_file(request: Request):
+    """Store an upload (multipart `file` field or raw body, see save_upload) and analyze it."""
+    start_total = time.time()
+    filepath, response = await save_upload(request)
+    try:
+        return result_response(request, await analyze_stored(filepath, response, start_total))
+    finally:
+        storage.release(filepath)
+
+@app.get("/analysis/{analysis_id}/raw_data")
+async def get_raw_data(analysis_id: str, request: Request):
+    """Per-frame raw_data of an upload, e.g. page by page after `/upload?raw_data=omit`."""
+    session = session_store.get(analysis_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Analysis not found or expired")
+    return result_response(request, {"analysis_id": analysis_id, "raw_data": session.analysis_result.get("raw_data", {})})
+
+async def analyze_stored(filepath: str, response: Dict[str, Any], start_total: float) -> Dict[str, Any]:
+    """The /upload response for a stored file: cached result, or CV analysis, verdict and overview."""
+    content_hash = response["content_hash"]
+
+    cached = result_cache.get(content_hash)
+    if cached is not None:
+        log.info(f"Result cache hit: {content_hash[:12]} ({time.time() - start_total:.4f}s)")
+        session = create_session(cached["analysis_result"], cached["ai_scan_result"], content_hash, filepath)
+        if SPECULATIVE_METRICS:
+            session_store.start_metrics(session, explain_session_metrics)
+        return {
+            **response,
+            "analysis_id": session.analysis_id,
+            "ai_scan_result": cached["ai_scan_result"],
+            "analysis_result": cached["analysis_result"],
+            "brief_overview": cached["brief_overview"],
+            "cached": True,
+        }
+
+    analysis_result, ai_scan_result = await analyze_upload(filepath, response["type"])
+
+    session = create_session(analysis_result, ai_scan_result, content_hash, filepath)
+    if SPECULATIVE_METRICS:
+        session_store.start_metrics(session, explain_session_metrics)
 
     t_llm_start = time.time()
-    explainer = ExplainabilityEngine()
-    brief_overview = await explainer.explain_overall_analysis(analysis_result, ai_scan_result)
-    print(f"LLM Overall Explanation: {time.time() - t_llm_start:.4f}s")
-    print(f"Total Upload Handler Time: {time.time() - start_total:.4f}s")
+    with span("llm.overview"):
+        brief_overview = await explainer.explain_overall_analysis(analysis_result, ai_scan_result)
+    log.info(f"LLM Overall Explanation: {time.time() - t_llm_start:.4f}s")
+    log.info(f"Total Upload Handler Time: {time.time() - start_total:.4f}s")
+
+    cache_upload_result(session, brief_overview)
+
     return {
-        "status": "success",
-        "filename": file.filename,
-        "path": f"/media/{file.filename}",
-        "size": os.path.getsize(filepath),
-        "type": file_type,
+        **response,
+        "analysis_id": session.analysis_id, # Frontend passes this to /analyze/metrics
         "ai_scan_result": ai_scan_result,
-        "analysis_result": analysis_result, # Frontend sends this back to /analyze/metrics
-        "brief_overview": brief_overview
+        "analysis_result": analysis_result,
+        "brief_overview": brief_overview,
+        "cached": False,
     }
 
+# Resumable uploads for large files over unreliable links (see UPLOAD_CHUNK_MB, UPLOAD_RESUMABLE_* env vars)
+resumable_uploads = ResumableUploads(upload_store)
+storage.maintenance += [upload_store.remove_stale, resumable_uploads.expire]
+# Their preallocated space counts towards MEDIA_QUOTA_MB
+storage.reserved.append(resumable_uploads.outstanding_bytes)
+
+class ResumableUploadRequest(BaseModel):
+    size: int
+    filename: Optional[str] = None
+    chunk_size: Optional[int] = None  # Defaults to UPLOAD_CHUNK_MB
+
+@app.post("/uploads", status_code=201)
+async def init_resumable_upload(request: ResumableUploadRequest, http_request: Request):
+    """
+    Start a resumable upload. Send each chunk with PUT /uploads/{upload_id}?offset=N
+    (in any order, retrying as needed) with its SHA-256 hex in an X-Chunk-SHA256 header,
+    then POST /uploads/{upload_id}/finalize to analyze it. GET /uploads/{upload_id}
+    lists the chunks still missing after a dropped connection. Each client may hold
+    UPLOAD_RESUMABLE_PER_CLIENT unfinished uploads, UPLOAD_RESUMABLE_MAX_MB in total.
+    """
+    if not storage.make_room(request.size):
+        raise HTTPException(status_code=507, detail="Not enough storage for this upload, try again later")
+    try:
+        # Preallocating gigabytes can take a while on some filesystems
+        upload = await asyncio.to_thread(resumable_uploads.init, request.size, request.filename, request.chunk_size,
+                                         client=http_request.client.host if http_request.client else None)
+    except UploadRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    # Concurrent requests may all have passed the check above; now this upload is counted
+    if not storage.make_room(0):
+        await resumable_uploads.abort(upload.upload_id)
+        raise HTTPException(status_code=507, detail="Not enough storage for this upload, try again later")
+    return {**upload.snapshot(), "upload_url": f"/uploads/{upload.upload_id}"}
+
+@app.get("/uploads/{upload_id}")
+async def get_resumable_upload(upload_id: str):
+    try:
+        return resumable_uploads.get(upload_id).snapshot()
+    except UploadRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+
+@app.put("/uploads/{upload_id}")
+async def put_upload_chunk(upload_id: str, offset: int, request: Request):
+    checksum = request.headers.get("x-chunk-sha256")
+    if not checksum:
+        raise HTTPException(status_code=400, detail="X-Chunk-SHA256 header required")
+    try:
+        upload = resumable_uploads.get(upload_id)
+        # A chunk is at most chunk_size bytes, so it is read into memory
+        data = bytearray()
+        async for part in request.stream():
+            data += part
+            if len(data) > upload.chunk_size:
+                raise HTTPException(status_code=413, detail=f"Chunks are at most {upload.chunk_size} bytes")
+        upload = await resumable_uploads.write_chunk(upload_id, offset, bytes(data), checksum)
+    except UploadRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    return upload.snapshot()
+
+@app.post("/uploads/{upload_id}/finalize")
+async def finalize_upload(upload_id: str, request: Request):
+    """Assemble a completed resumable upload and analyze it; the response is the same as /upload's."""
+    start_total = time.time()
+    # The chunks stay in place, so a refused finalize can simply be retried
+    if not analysis_executor.has_capacity():
+        raise HTTPException(status_code=503, detail="Server busy, try again shortly", headers={"Retry-After": "5"})
+    try:
+        stored = await resumable_uploads.finalize(upload_id)
+    except UploadRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    register_upload(stored)
+    log.info(f"Resumable upload finalized: {stored['path']} ({time.time() - start_total:.4f}s)")
+    try:
+        return result_response(request, await analyze_stored(stored["path"], upload_response(stored, stored["filename"]), start_total))
+    finally:
+        storage.release(stored["path"])
+
+@app.delete("/uploads/{upload_id}")
+async def abort_upload(upload_id: str):
+    try:
+        await resumable_uploads.abort(upload_id)
+    except UploadRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    return {"upload_id": upload_id, "status": "aborted"}
+
+def has_llm_errors(metric_explanations: list) -> bool:
+    return any(m.get("analysis", "").startswith("Error generating analysis") for m in metric_explanations)
+
+async def explain_session_metrics(session: AnalysisSession) -> list:
+    """Generate (or fetch from the result cache) the per-metric explanations for a session."""
+    if session.content_hash:
+        cached = result_cache.get(session.content_hash)
+        if cached is not None and "metric_explanations" in cached:
+            log.info(f"Metric explanations cache hit: {session.content_hash[:12]}")
+            return cached["metric_explanations"]
+
+    start_time = time.time()
+    with span("llm.metrics"):
+        metric_explanations = await explainer.analyze_all_metrics(session.analysis_result)
+    log.info(f"Detailed Metrics Analysis (Parallel): {time.time() - start_time:.4f}s")
+
+    if session.content_hash and not has_llm_errors(metric_explanations):
+        result_cache.update(session.content_hash, metric_explanations=metric_explanations)
+    return metric_explanations
+
 class MetricRequest(BaseModel):
-    analysis_result: Dict[str, Any]
+    analysis_id: Optional[str] = None
+    # Legacy clients post the whole analysis_result back instead of an analysis_id
+    analysis_result: Optional[Dict[str, Any]] = None
+    content_hash: Optional[str] = None
 
 @app.post("/analyze/metrics")
 async def analyze_metrics(request: MetricRequest):
     """
-    Step 2: Takes the analysis result from Step 1 and generates detailed metric explanations in parallel.
+    Step 2: Returns the detailed metric explanations for an upload, generated in parallel.
+    Usually these were already started speculatively by /upload.
     """
     start_time = time.time()
-    explainer = ExplainabilityEngine()
-    metric_explanations = await explainer.analyze_all_metrics(request.analysis_result)
-    
-    print(f"Detailed Metrics Analysis (Parallel): {time.time() - start_time:.4f}s")
+    if request.analysis_id:
+        session = session_store.get(request.analysis_id)
+        if session is None:
+            raise HTTPException(status_code=404, detail="Analysis not found or expired")
+        # Shield the shared task so a client disconnect doesn't cancel it for everyone
+        metric_explanations = await asyncio.shield(session_store.start_metrics(session, explain_session_metrics))
+    elif request.analysis_result is not None:
+        cached = result_cache.get(request.content_hash) if request.content_hash else None
+        # Only trust the hash if the client sent back the metrics we computed for it
+        trusted = cached is not None and cached["analysis_result"].get("metrics") == request.analysis_result.get("metrics")
+        session = AnalysisSession(None, request.analysis_result, {}, request.content_hash if trusted else None)
+        metric_explanations = await explain_session_metrics(session)
+    else:
+        raise HTTPException(status_code=422, detail="Either analysis_id or analysis_result is required")
+
+    log.info(f"Metric explanations ready after {time.time() - start_time:.4f}s")
+
+    return {
+        "metricExplanations": metric_explanations,
+    }
+
+def sse_event(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+async def stream_session_metrics(session: AnalysisSession):
+    """
+    SSE events for a session's metric explanations: from the cache, or from the speculative
+    task /upload started, when possible; otherwise streamed token by token.
+    """
+    cached = result_cache.get(session.content_hash) if session.content_hash else None
+    if cached is not None and "metric_explanations" in cached:
+        for metric in cached["metric_explanations"]:
+            yield sse_event("metric_done", metric)
+        return
+
+    task = session.metrics_task
+    if task is not None and not task.cancelled():
+        # Already generating; streaming them again would double the LLM load
+        for metric in await asyncio.shield(task):
+            yield sse_event("metric_done", metric)
+        return
+
+    metric_explanations = []
+    async for event, data in explainer.stream_all_metrics(session.analysis_result):
+        if event == "metric_done":
+            metric_explanations.append(data)
+        yield sse_event(event, data)
+
+    if session.content_hash and not has_llm_errors(metric_explanations):
+        result_cache.update(session.content_hash, metric_explanations=metric_explanations)
+
+async def stream_upload_events(session: AnalysisSession, response: Dict[str, Any], brief_overview: Optional[str]):
+    yield sse_event("analysis", {
+        **response,
+        "analysis_id": session.analysis_id,
+        "ai_scan_result": session.ai_scan_result,
+        "analysis_result": session.analysis_result,
+        "cached": brief_overview is not None,
+    })
+
+    if brief_overview is None:
+        t_llm_start = time.time()
+        parts = []
+        try:
+            async for delta in explainer.stream_overall_analysis(session.analysis_result, session.ai_scan_result):
+                parts.append(delta)
+                yield sse_event("overview", {"delta": delta})
+        except Exception as e:
+            error = f"Error generating explanation: {str(e)}"
+            parts.append(error)
+            yield sse_event("overview", {"delta": error})
+        else:
+            # Only a complete overview is cached; a partial one followed by the error isn't
+            cache_upload_result(session, "".join(parts))
+        brief_overview = "".join(parts)
+        log.info(f"LLM Overall Explanation (streamed): {time.time() - t_llm_start:.4f}s")
+    yield sse_event("overview_done", {"brief_overview": brief_overview})
+
+    async for event in stream_session_metrics(session):
+        yield event
+    yield sse_event("done", {})
+
+@app.post("/upload/stream")
+async def upload_file_stream(request: Request):
+    """
+    Streaming variant of /upload (Server-Sent Events). Sends the CV metrics and verdict
+    as soon as they are ready, then the overview and each metric explanation token by token:
+
+        analysis       upload fields, analysis_id, ai_scan_result, analysis_result
+        overview       {"delta": str}, repeated
+        overview_done  {"brief_overview": str}
+        metric         {"metric_name": str, "delta": str}, repeated and interleaved across metrics
+        metric_done    one metric explanation, same shape as in /analyze/metrics
+        done           {}
 
+    The body is the same as for /upload.
+    """
+    filepath, response = await save_upload(request)
+    content_hash = response["content_hash"]
+
+    try:
+        cached = result_cache.get(content_hash)
+        if cached is not None:
+            session = create_session(cached["analysis_result"], cached["ai_scan_result"], content_hash, filepath)
+            brief_overview = cached["brief_overview"]
+        else:
+            analysis_result, ai_scan_result = await analyze_upload(filepath, response["type"])
+            session = create_session(analysis_result, ai_scan_result, content_hash, filepath)
+            brief_overview = None
+    finally:
+        storage.release(filepath)
+
+    return StreamingResponse(
+        stream_upload_events(session, response, brief_overview),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS,
+    )
+
+@app.get("/llm/stats")
+async def llm_stats():
+    """Concurrency, queue-wait and generation-time stats of the shared LLM client."""
     return {
+        **explainer.governor.stats(),
+        "models": explainer.models,
+        "unavailable_models": explainer.unavailable_models(),
+        "usage": explainer.usage,
+        "explanation_cache": explanation_cache.stats(),
+    }
+
+# Point-in-time values, read on each scrape
+REGISTRY.register(Gauge("trueview_analysis_pending", "Analyses running or queued on the CV pool",
+                        lambda: analysis_executor.pending))
+REGISTRY.register(Gauge("trueview_llm_active", "LLM generations in progress",
+                        lambda: explainer.governor.active if explainer else 0))
+REGISTRY.register(Gauge("trueview_llm_waiting", "LLM calls waiting for a generation slot",
+                        lambda: explainer.governor.waiting if explainer else 0))
+REGISTRY.register(Gauge("trueview_storage_bytes", "Bytes stored in the upload folder",
+                        lambda: storage.bytes))
+
+@app.get("/metrics")
+async def metrics():
+    """Stage, HTTP and LLM latency histograms, token counts and cache hit counters in the Prometheus text format."""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/storage")
+async def storage_stats():
+    """Upload folder usage against the quota, pinned files and eviction counters."""
+    return storage.stats()
+
+@app.get("/storage/previews/{content_hash}")
+async def get_previews(content_hash: str):
+    previews = storage.previews(content_hash)
+    return {
+        "previews": {kind: f"/media/{rel}" for kind, rel in previews.items()},
+        "pending": storage.previews_pending(content_hash),
+    }
+
+@app.get("/analyze/metrics/stream")
+async def analyze_metrics_stream(analysis_id: str):
+    """Streams an upload's metric explanations as 'metric' / 'metric_done' / 'done' SSE events."""
+    session = session_store.get(analysis_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Analysis not found or expired")
+
+    async def events():
+        async for event in stream_session_metrics(session):
+            yield event
+        yield sse_event("done", {})
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+async def analyze_when_free(file_type: str, path: str) -> Dict[str, Any]:
+    """
+    analysis_executor.run for work that was already accepted (jobs, batches): share the pool
+    with interactive uploads, but wait for room rather than failing with AnalysisQueueFull.
+    """
+    while True:
+        try:
+            return await analysis_executor.run(file_type, path)
+        except AnalysisQueueFull:
+            await asyncio.sleep(0.5)
+
+async def run_upload_job(job: Job):
+    """Job runner for stored uploads: CV analysis and verdict (concurrently), overview, metrics."""
+    filepath, response = job.params["filepath"], job.params["response"]
+    content_hash = response["content_hash"]
+
+    # create_job left the file pinned; the session holds it from here on
+    try:
+        cached = result_cache.get(content_hash)
+        if cached is not None:
+            session = create_session(cached["analysis_result"], cached["ai_scan_result"], content_hash, filepath)
+            brief_overview = cached["brief_overview"]
+            for stage in ("cv", "verdict", "overview"):
+                job.finish_stage(stage, "cached")
+        else:
+            async def cv():
+                async with job_queue.stage(job, "cv"):
+                    return await analyze_when_free(response["type"], filepath)
+
+            async def verdict():
+                async with job_queue.stage(job, "verdict"):
+                    return await get_verdict(response["type"], filepath)
+
+            tasks = [asyncio.create_task(cv()), asyncio.create_task(verdict())]
+            try:
+                analysis_result, ai_scan_result = await asyncio.gather(*tasks)
+            finally:
+                for task in tasks:
+                    task.cancel()
+
+            session = create_session(analysis_result, ai_scan_result, content_hash, filepath)
+            job.emit("partial", analysis_id=session.analysis_id, ai_scan_result=ai_scan_result, metrics=analysis_result["metrics"])
+            if SPECULATIVE_METRICS:
+                session_store.start_metrics(session, explain_session_metrics)
+            async with job_queue.stage(job, "overview"):
+                brief_overview = await explainer.explain_overall_analysis(analysis_result, ai_scan_result)
+            job.emit("partial", brief_overview=brief_overview)
+            cache_upload_result(session, brief_overview)
+    finally:
+        storage.release(filepath)
+
+    async with job_queue.stage(job, "metrics"):
+        metric_explanations = await asyncio.shield(session_store.start_metrics(session, explain_session_metrics))
+
+    job.complete({
+        **response,
+        "analysis_id": session.analysis_id,
+        "ai_scan_result": session.ai_scan_result,
+        "analysis_result": session.analysis_result,
+        "brief_overview": brief_overview,
         "metricExplanations": metric_explanations,
-    }
\ No newline at end of file
+        "cached": cached is not None,
+    })
+
+# Uploads submitted through /jobs (see JOB_* env vars). The runner is the swap point
+# for executing jobs out of process.
+job_queue = JobQueue(
+    runner=run_upload_job,
+    stage_limits={
+        "cv": int(os.getenv("JOB_CV_CONCURRENCY", str(analysis_executor.workers))),
+        "verdict": int(os.getenv("JOB_VERDICT_CONCURRENCY", "8")),
+        "overview": int(os.getenv("JOB_OVERVIEW_CONCURRENCY", "4")),
+        "metrics": int(os.getenv("JOB_METRICS_CONCURRENCY", "4")),
+    },
+)
+
+@app.post("/jobs", status_code=202)
+async def create_job(request: Request):
+    """
+    Job-oriented variant of /upload: stores the file, queues the analysis and returns
+    straight away. Follow progress with GET /jobs/{job_id} or the /jobs/{job_id}/events
+    WebSocket; the finished job's result has the /upload fields plus metricExplanations.
+    """
+    if not job_queue.has_capacity():
+        raise HTTPException(status_code=503, detail="Job queue full, try again shortly", headers={"Retry-After": "5"})
+
+    # Jobs from the same client are served round-robin against everyone else's
+    job = job_queue.create(client=request.client.host if request.client else "unknown")
+    # The body has to be received before the request can complete, so saving runs here
+    job.start_stage("save")
+    try:
+        filepath, response = await save_upload(request, shed_load=False)
+    except HTTPException as e:
+        job.fail(str(e.detail))
+        raise
+    job.finish_stage("save")
+    job.params.update(filepath=filepath, response=response)
+
+    try:
+        job_queue.submit(job)
+    except JobQueueFull:
+        storage.release(filepath)
+        job.fail("Job queue full")
+        raise HTTPException(status_code=503, detail="Job queue full, try again shortly", headers={"Retry-After": "5"})
+
+    return {
+        "job_id": job.job_id,
+        "status": job.status,
+        "status_url": f"/jobs/{job.job_id}",
+        "events_url": f"/jobs/{job.job_id}/events",
+    }
+
+@app.get("/jobs")
+async def job_stats():
+    return job_queue.stats()
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str, request: Request):
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+    return result_response(request, job.snapshot())
+
+@app.websocket("/jobs/{job_id}/events")
+async def job_events(websocket: WebSocket, job_id: str):
+    """
+    Sends the job's events so far, then live ones, as JSON messages:
+    queued, running, stage_started / stage_finished (per stage), partial results, and
+    finally done (with the result) or failed (with the error).
+    """
+    job = job_queue.get(job_id)
+    if job is None:
+        await websocket.close(code=4404)
+        return
+    await websocket.accept()
+    queue = job.subscribe()
+    try:
+        while True:
+            message = await queue.get()
+            await websocket.send_json(message)
+            if message["event"] in TERMINAL_EVENTS:
+                break
+        await websocket.close()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        job.unsubscribe(queue)
+
+# Bulk scans of files already on the server (see BATCH_* env vars)
+BATCH_ROOT = os.path.realpath(os.getenv("BATCH_ROOT", UPLOAD_FOLDER))
+BATCH_OUTPUT_FOLDER = os.getenv("BATCH_OUTPUT_FOLDER", os.path.join(BASE_DIR, "batch_results"))
+batches: Dict[str, Dict[str, Any]] = {}  # Running
+batch_tasks: Dict[str, asyncio.Task] = {}
+# Finished batches stay available for status lookups for a while (see BATCH_TTL, BATCH_MAX_FINISHED)
+finished_batches = TTLCache(maxsize=int(os.getenv("BATCH_MAX_FINISHED", "100")),
+                            ttl=float(os.getenv("BATCH_TTL", str(24 * 3600))))
+# Outputs of batches still being set up, so two requests can't open the same one
+batch_outputs_preparing: set = set()
+
+class BatchRequest(BaseModel):
+    paths: Optional[List[str]] = None  # Files or directories, under BATCH_ROOT
+    output: str  # File name in BATCH_OUTPUT_FOLDER; the extension picks the format
+    format: Optional[str] = None
+    explain: bool = False
+    raw: bool = False
+    resume: bool = True
+
+def resolve_batch_path(path: str) -> str:
+    resolved = os.path.realpath(os.path.join(BATCH_ROOT, path))
+    if os.path.commonpath([resolved, BATCH_ROOT]) != BATCH_ROOT:
+        raise HTTPException(status_code=400, detail=f"Path outside the batch root: {path}")
+    return resolved
+
+async def analyze_for_batch(file_type: str, path: str) -> Dict[str, Any]:
+    with storage.hold(path):
+        return await analyze_when_free(file_type, path)
+
+async def run_batch_job(batch_id: str, paths: List[str], writer, skip: set, explain: bool, raw: bool):
+    progress = batches[batch_id]["progress"]
+    try:
+        await run_batch(paths, analyze_for_batch, writer, explainer=explainer if explain else None,
+                        max_in_flight=analysis_executor.workers, keep_raw=raw, skip=skip, progress=progress)
+    except Exception as e:
+        batches[batch_id]["error"] = str(e)
+    finally:
+        writer.close()
+        batch_tasks.pop(batch_id, None)
+        finished_batches[batch_id] = batches.pop(batch_id)
+        stats = progress.snapshot()
+        log.info(f"Batch {batch_id}: {stats['ok']} ok, {stats['errors']} errors in {stats['seconds']:.2f}s ({stats['files_per_sec']:.2f} files/sec)")
+
+@app.post("/batch", status_code=202)
+async def start_batch(request: BatchRequest):
+    """
+    Analyze files already on the server (under BATCH_ROOT, default the media folder) without
+    re-uploading them. LLM explanations are skipped unless `explain` is set. Results are
+    appended to the output as each file finishes; rerunning with the same output resumes
+    (retrying files that failed), unless `resume` is false, which replaces the output.
+    """
+    if request.format is not None and request.format not in OUTPUT_FORMATS:
+        raise HTTPException(status_code=422, detail=f"format must be one of {OUTPUT_FORMATS}")
+    sources = [resolve_batch_path(p) for p in (request.paths or ["."])]
+    output = os.path.join(BATCH_OUTPUT_FOLDER, os.path.basename(request.output))
+    if output in batch_outputs_preparing or any(b["output"] == output for b in batches.values()):
+        raise HTTPException(status_code=409, detail="A batch is already writing to this output")
+
+    def prepare():
+        # Directory walks, manifests and reading back the output are file I/O: keep them off the event loop
+        paths = [p for source in sources for p in iter_media_paths(source, resolve=resolve_batch_path)]
+        os.makedirs(BATCH_OUTPUT_FOLDER, exist_ok=True)
+        writer = open_writer(output, request.format, append=request.resume)
+        return paths, writer, writer.done_paths() if request.resume else set()
+
+    batch_outputs_preparing.add(output)
+    try:
+        paths, writer, skip = await asyncio.to_thread(prepare)
+    except ImportError as e:
+        raise HTTPException(status_code=501, detail=str(e))
+    except OSError as e:
+        raise HTTPException(status_code=400, detail=f"Cannot read batch source: {e}")
+    finally:
+        batch_outputs_preparing.discard(output)
+
+    batch_id = secrets.token_urlsafe(8)
+    batches[batch_id] = {"output": output, "progress": BatchProgress(), "error": None}
+    batch_tasks[batch_id] = asyncio.create_task(
+        run_batch_job(batch_id, paths, writer, skip, request.explain, request.raw)
+    )
+    return {"batch_id": batch_id, "output": output, "status_url": f"/batch/{batch_id}"}
+
+@app.get("/batch/{batch_id}")
+async def get_batch(batch_id: str):
+    batch = batches.get(batch_id) or finished_batches.get(batch_id)
+    if batch is None:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    return {
+        "batch_id": batch_id,
+        "output": batch["output"],
+        "error": batch["error"],
+        **batch["progress"].snapshot(),
+    }
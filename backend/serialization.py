@@ -0,0 +1,145 @@
+"""
+Response encoding for analysis results.
+
+Results are written with orjson straight into the response, skipping FastAPI's
+jsonable_encoder walk over the whole nested dict. Per-frame raw_data is the bulk of a
+result, so clients can also ask for less of it or a denser encoding of it:
+
+- raw_data can be omitted, or sliced to a page of samples (see shape_raw_data).
+- The Accept header picks the encoding (see negotiate):
+    application/json                   raw_data arrays as JSON lists (default)
+    application/vnd.trueview.f32+json  raw_data arrays as base64 little-endian float32
+
+An encoded array is {"dtype": "float32", "length": n, "data": <base64>}.
+"""
+import base64
+import numpy as np
+import orjson
+from fastapi.responses import ORJSONResponse, Response
+
+from typing import Dict, Any, Optional, Callable
+
+JSON_MEDIA_TYPE = "application/json"
+F32_JSON_MEDIA_TYPE = "application/vnd.trueview.f32+json"
+# Accept values -> encoding
+MEDIA_TYPES = {
+    JSON_MEDIA_TYPE: "json",
+    F32_JSON_MEDIA_TYPE: "f32",
+}
+RAW_DATA_MODES = ("include", "omit")
+
+
+def negotiate(accept: Optional[str]) -> str:
+    """
+    Encoding for an Accept header: the client's most preferred of MEDIA_TYPES (by q-value,
+    then order). Anything else means JSON.
+
+    Returns:
+        str: 'json' or 'f32'
+    """
+    offers = []
+    for position, part in enumerate((accept or "").split(",")):
+        media_type, *params = [p.strip() for p in part.split(";")]
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        encoding = MEDIA_TYPES.get(media_type.lower())
+        if encoding is not None and q > 0:
+            offers.append((-q, position, encoding))
+    return min(offers)[2] if offers else "json"
+
+
+def _map_raw_data(obj: Any, fn: Callable[[Dict[str, Any]], Any]) -> Any:
+    """
+    obj with every 'raw_data' dict replaced by fn(raw_data) (dropped if that returns None).
+    Only the containers on the way to a raw_data are copied; everything else is shared.
+    """
+    if isinstance(obj, dict):
+        mapped, changed = {}, False
+        for key, value in obj.items():
+            if key == "raw_data" and isinstance(value, dict):
+                new = fn(value)
+                changed = True
+                if new is None:
+                    continue
+            else:
+                new = _map_raw_data(value, fn)
+                changed = changed or new is not value
+            mapped[key] = new
+        return mapped if changed else obj
+    if isinstance(obj, list):
+        mapped = [_map_raw_data(value, fn) for value in obj]
+        return mapped if any(new is not old for new, old in zip(mapped, obj)) else obj
+    return obj
+
+
+def shape_raw_data(payload: Any, mode: str = "include", offset: int = 0, limit: Optional[int] = None) -> Any:
+    """
+    Drop raw_data from a response payload, or keep one page of it.
+
+    Args:
+        payload: Response content; every nested 'raw_data' dict is shaped.
+        mode (str): 'include' or 'omit'.
+        offset (int): First sample of each raw_data array to keep.
+        limit (int): Samples to keep per array; None keeps the rest. With a limit, a
+            'page' entry {'offset', 'limit', 'total'} is added to raw_data.
+
+    Returns:
+        The payload with raw_data shaped (the input is not modified).
+    """
+    if mode not in RAW_DATA_MODES:
+        raise ValueError(f"raw_data must be one of {RAW_DATA_MODES}: {mode}")
+    if offset < 0 or (limit is not None and limit < 0):
+        raise ValueError("raw_offset and raw_limit must not be negative")
+    if mode == "omit":
+        return _map_raw_data(payload, lambda raw: None)
+    if offset == 0 and limit is None:
+        return payload
+
+    def page(raw):
+        end = None if limit is None else offset + limit
+        shaped = {name: values[offset:end] for name, values in raw.items() if isinstance(values, list)}
+        total = max((len(values) for values in raw.values() if isinstance(values, list)), default=0)
+        shaped["page"] = {"offset": offset, "limit": limit, "total": total}
+        return shaped
+
+    return _map_raw_data(payload, page)
+
+
+def pack_floats(values) -> Dict[str, Any]:
+    """A list of numbers as base64 little-endian float32 bytes."""
+    data = np.asarray(values, dtype="<f4").tobytes()
+    return {"dtype": "float32", "length": len(values), "data": base64.b64encode(data).decode()}
+
+
+def unpack_floats(packed: Dict[str, Any]) -> np.ndarray:
+    """Inverse of pack_floats."""
+    return np.frombuffer(base64.b64decode(packed["data"]), dtype="<f4")
+
+
+def _pack_raw_data(payload: Any) -> Any:
+    return _map_raw_data(payload, lambda raw: {
+        name: pack_floats(values) if isinstance(values, list) else values
+        for name, values in raw.items()
+    })
+
+
+def encode_response(payload: Any, encoding: str = "json", status_code: int = 200) -> Response:
+    """
+    Response for a payload in one of negotiate()'s encodings.
+
+    Args:
+        payload: JSON-like content; numpy arrays and scalars are allowed.
+        encoding (str): 'json' or 'f32'.
+        status_code (int): HTTP status of the response.
+    """
+    headers = {"Vary": "Accept"}
+    if encoding == "f32":
+        body = orjson.dumps(_pack_raw_data(payload), option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+        return Response(body, status_code=status_code, media_type=F32_JSON_MEDIA_TYPE, headers=headers)
+    return ORJSONResponse(payload, status_code=status_code, headers=headers)
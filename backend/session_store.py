@@ -0,0 +1,86 @@
+import asyncio, os, secrets, time
+from cachetools import TTLCache
+
+from typing import Dict, Any, Optional, Callable, Awaitable, List
+
+
+class AnalysisSession:
+    """Server-side state for one upload, looked up by analysis_id from /analyze/metrics."""
+
+    def __init__(self, analysis_id: str, analysis_result: Dict[str, Any], ai_scan_result: Dict[str, Any],
+                 content_hash: Optional[str] = None):
+        self.analysis_id = analysis_id
+        self.analysis_result = analysis_result
+        self.ai_scan_result = ai_scan_result
+        self.content_hash = content_hash
+        self.created_at = time.time()
+        self.metrics_task: Optional[asyncio.Task] = None
+        # Called once when the session expires or is evicted, e.g. to release its media file
+        self.on_close: List[Callable[[], None]] = []
+
+    def close(self):
+        """Stop any explanation work nobody is going to collect."""
+        if self.metrics_task is not None and not self.metrics_task.done():
+            self.metrics_task.cancel()
+        callbacks, self.on_close = self.on_close, []
+        for callback in callbacks:
+            callback()
+
+
+class _SessionCache(TTLCache):
+    """TTLCache that closes sessions when they expire or are evicted as least recently used."""
+
+    def popitem(self):
+        key, session = super().popitem()
+        session.close()
+        return key, session
+
+    def expire(self, time=None):
+        expired = super().expire(time)
+        for _, session in expired:
+            session.close()
+        return expired
+
+
+class SessionStore:
+    """
+    Bounded store of analysis sessions with TTL expiry and LRU eviction.
+
+    Lets the frontend refer to an upload by ID instead of posting the full
+    analysis_result (including raw_data) back to /analyze/metrics, and lets
+    metric explanations start in the background before they are requested.
+    """
+
+    def __init__(self,
+                 max_sessions: int = int(os.getenv("SESSION_MAX", "1000")),
+                 ttl: float = float(os.getenv("SESSION_TTL", "1800"))):
+        """
+        Args:
+            max_sessions (int): Sessions kept before the least recently used is evicted.
+            ttl (float): Seconds a session lives after it was last stored.
+        """
+        self._sessions = _SessionCache(maxsize=max_sessions, ttl=ttl)
+
+    def __len__(self):
+        self._sessions.expire()
+        return len(self._sessions)
+
+    def create(self, analysis_result: Dict[str, Any], ai_scan_result: Dict[str, Any],
+               content_hash: Optional[str] = None) -> AnalysisSession:
+        session = AnalysisSession(secrets.token_urlsafe(16), analysis_result, ai_scan_result, content_hash)
+        self._sessions[session.analysis_id] = session
+        return session
+
+    def get(self, analysis_id: str) -> Optional[AnalysisSession]:
+        self._sessions.expire()
+        return self._sessions.get(analysis_id)
+
+    def start_metrics(self, session: AnalysisSession,
+                      explain: Callable[[AnalysisSession], Awaitable[list]]) -> asyncio.Task:
+        """
+        Start (or return the already running) metric explanation task for a session.
+        Called speculatively once CV analysis is done and again from /analyze/metrics.
+        """
+        if session.metrics_task is None or session.metrics_task.cancelled():
+            session.metrics_task = asyncio.create_task(explain(session))
+        return session.metrics_task
@@ -0,0 +1,394 @@
+"""
+Retention for the upload folder.
+
+Uploads are stored by content hash (see upload_store). StorageManager keeps an index of
+them in least-recently-used order, with a byte quota and a TTL. Files that are being
+analyzed or that belong to a live session are reference counted and never evicted. A
+background task compacts the folder periodically. Optional preview derivatives (a JPEG
+thumbnail, plus a small WebM proxy for videos) are generated off the request path.
+They count toward the quota and are evicted with their original.
+"""
+import asyncio, os, threading, time
+from collections import OrderedDict
+from contextlib import contextmanager
+import cv2
+from telemetry import log
+
+from typing import Dict, Any, Optional, Callable, List
+
+PREVIEW_FOLDER = ".previews"
+# Derivative name suffixes, per kind
+PREVIEW_SUFFIXES = {"thumbnail": ".thumb.jpg", "proxy": ".proxy.webm"}
+
+
+def content_key(path: str) -> Optional[str]:
+    """The content hash a stored file or preview is named after, or None for anything else."""
+    key = os.path.basename(path)[:64]
+    if len(key) == 64 and all(c in "0123456789abcdef" for c in key):
+        return key
+    return None
+
+
+def make_thumbnail(src: str, dst: str, file_type: str, max_side: int = 320) -> bool:
+    """Write a JPEG thumbnail of an image, or of a video's first frame."""
+    if file_type == "video":
+        cap = cv2.VideoCapture(src)
+        ok, image = cap.read()
+        cap.release()
+        if not ok:
+            return False
+    else:
+        # Reduced decoding keeps the cost low for very large originals
+        image = cv2.imread(src, cv2.IMREAD_REDUCED_COLOR_2)
+        if image is None:
+            return False
+    scale = max_side / max(image.shape[:2])
+    if scale < 1:
+        image = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    return cv2.imwrite(dst, image, [cv2.IMWRITE_JPEG_QUALITY, 80])
+
+
+def make_proxy(src: str, dst: str, max_height: int = 360, max_fps: float = 15) -> bool:
+    """
+    Write a low-resolution, low-frame-rate WebM (VP8) copy of a video for playback in the browser.
+    OpenCV's writer has no bitrate control, so the size comes from resolution and frame rate.
+    """
+    cap = cv2.VideoCapture(src)
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30
+    width, height = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    if not width or not height:
+        cap.release()
+        return False
+    scale = min(1.0, max_height / height)
+    size = (max(2, int(width * scale) // 2 * 2), max(2, int(height * scale) // 2 * 2))
+    step = max(1, round(fps / max_fps))
+    writer = cv2.VideoWriter(dst, cv2.VideoWriter_fourcc(*"VP80"), fps / step, size)
+    if not writer.isOpened():
+        cap.release()
+        return False
+    index = 0
+    try:
+        # grab() skips decoding of the dropped frames
+        while cap.grab():
+            if index % step == 0:
+                ok, frame = cap.retrieve()
+                if not ok:
+                    break
+                writer.write(cv2.resize(frame, size, interpolation=cv2.INTER_AREA))
+            index += 1
+    finally:
+        cap.release()
+        writer.release()
+    return index > 0
+
+
+class StoredFile:
+    __slots__ = ("name", "size", "last_access")
+
+    def __init__(self, name: str, size: int, last_access: float):
+        self.name = name  # File name in the upload folder: <sha256><ext>
+        self.size = size  # Including previews
+        self.last_access = last_access
+
+
+class StorageManager:
+    """
+    Byte quota, LRU/TTL eviction and reference counting for the upload folder.
+
+    Files are keyed by content hash. acquire/release (or hold) pin a file while it is
+    analyzed or referenced by a session; pinned files are skipped by eviction, so usage
+    can exceed the quota while everything is in use.
+    """
+
+    def __init__(self,
+                 root: str,
+                 quota_bytes: int = int(os.getenv("MEDIA_QUOTA_MB", "10240")) * 1024 * 1024,
+                 ttl: float = float(os.getenv("MEDIA_TTL", str(7 * 24 * 3600))),
+                 compact_interval: float = float(os.getenv("MEDIA_COMPACT_INTERVAL", "300")),
+                 previews: bool = os.getenv("MEDIA_PREVIEWS", "0") == "1",
+                 preview_concurrency: int = int(os.getenv("MEDIA_PREVIEW_CONCURRENCY", "1"))):
+        """
+        Args:
+            root (str): Upload folder.
+            quota_bytes (int): Usage above which least recently used files are evicted; 0 disables.
+            ttl (float): Seconds since last access after which a file is evicted; 0 disables.
+            compact_interval (float): Seconds between background compactions.
+            previews (bool): Generate thumbnails and video proxies for new uploads.
+            preview_concurrency (int): Previews generated at once (video proxies re-encode the video).
+        """
+        self.root = root
+        self.preview_folder = os.path.join(root, PREVIEW_FOLDER)
+        self.quota_bytes = quota_bytes
+        self.ttl = ttl
+        self.compact_interval = compact_interval
+        self.previews_enabled = previews
+        # Run on each compaction, e.g. clearing abandoned partial uploads
+        self.maintenance: List[Callable[[], Any]] = []
+        # Bytes taken outside the index that count towards the quota, e.g. preallocated partial uploads
+        self.reserved: List[Callable[[], int]] = []
+        os.makedirs(self.preview_folder, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._files: "OrderedDict[str, StoredFile]" = OrderedDict()  # Least recently used first
+        self._refs: Dict[str, int] = {}
+        self._preview_tasks: Dict[str, asyncio.Task] = {}
+        self._preview_slots = asyncio.Semaphore(preview_concurrency)
+        self._task: Optional[asyncio.Task] = None
+        self.bytes = 0
+        self.evictions = 0
+        self.evicted_bytes = 0
+        self.compactions = 0
+        self.scan()
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.root, name)
+
+    def _preview_path(self, key: str, kind: str) -> str:
+        return os.path.join(self.preview_folder, key + PREVIEW_SUFFIXES[kind])
+
+    def _disk_size(self, key: str, name: str) -> int:
+        size = 0
+        for path in [self._path(name)] + [self._preview_path(key, kind) for kind in PREVIEW_SUFFIXES]:
+            try:
+                size += os.path.getsize(path)
+            except OSError:
+                pass
+        return size
+
+    def scan(self):
+        """Rebuild the index from disk, e.g. after a restart or files added by another worker."""
+        # Listed under the lock, so a file add() registers meanwhile can't be left out of the index
+        with self._lock:
+            files = []
+            for entry in os.scandir(self.root):
+                key = content_key(entry.name)
+                if key is None or not entry.is_file():
+                    continue
+                stat = entry.stat()
+                # Accesses recorded in memory are fresher than file times
+                known = self._files.get(key)
+                last_access = max(stat.st_atime, stat.st_mtime, known.last_access if known else 0)
+                files.append((key, StoredFile(entry.name, self._disk_size(key, entry.name), last_access)))
+            self._files = OrderedDict(sorted(files, key=lambda f: f[1].last_access))
+            self.bytes = sum(f.size for f in self._files.values())
+
+    def add(self, path: str):
+        """
+        Register a newly stored file (or mark a deduplicated one as used) and evict to fit
+        the quota. Call it holding a reference, so the new file itself can't be evicted.
+
+        Raises:
+            FileNotFoundError: The file was evicted before it could be registered.
+        """
+        key = content_key(path)
+        if key is None:
+            return
+        with self._lock:
+            if not os.path.exists(path):
+                raise FileNotFoundError(path)
+            stored = self._files.get(key)
+            if stored is None:
+                stored = self._files[key] = StoredFile(os.path.basename(path), self._disk_size(key, os.path.basename(path)), time.time())
+                self.bytes += stored.size
+            else:
+                stored.last_access = time.time()
+                self._files.move_to_end(key)
+        self.evict()
+
+    def touch(self, path: str):
+        """Record an access (the file or one of its previews was served)."""
+        key = content_key(path)
+        with self._lock:
+            stored = self._files.get(key)
+            if stored is not None:
+                stored.last_access = time.time()
+                self._files.move_to_end(key)
+
+    def acquire(self, path: str):
+        key = content_key(path)
+        if key is not None and os.path.dirname(os.path.abspath(path)) == os.path.abspath(self.root):
+            with self._lock:
+                self._refs[key] = self._refs.get(key, 0) + 1
+
+    def release(self, path: str):
+        key = content_key(path)
+        with self._lock:
+            if key in self._refs:
+                self._refs[key] -= 1
+                if self._refs[key] <= 0:
+                    del self._refs[key]
+
+    @contextmanager
+    def hold(self, path: str):
+        """Pin a file for the duration of a block, e.g. while it is being analyzed."""
+        self.acquire(path)
+        try:
+            yield
+        finally:
+            self.release(path)
+
+    def _delete(self, key: str):
+        # Called with the lock held
+        stored = self._files.pop(key)
+        for path in [self._path(stored.name)] + [self._preview_path(key, kind) for kind in PREVIEW_SUFFIXES]:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        self.bytes -= stored.size
+        self.evictions += 1
+        self.evicted_bytes += stored.size
+
+    def reserved_bytes(self) -> int:
+        return sum(reserved() for reserved in self.reserved)
+
+    def evict(self, reserve: int = 0) -> int:
+        """
+        Evict expired files, then least recently used ones until usage plus `reserve`
+        bytes (and the reserved hooks) fits the quota. Pinned files are skipped.
+
+        Returns:
+            int: Bytes freed.
+        """
+        freed = 0
+        reserve += self.reserved_bytes()
+        with self._lock:
+            if self.ttl:
+                cutoff = time.time() - self.ttl
+                for key, stored in list(self._files.items()):
+                    if stored.last_access >= cutoff:
+                        break
+                    if key not in self._refs:
+                        freed += stored.size
+                        self._delete(key)
+            if self.quota_bytes:
+                for key in list(self._files):
+                    if self.bytes + reserve <= self.quota_bytes:
+                        break
+                    if key not in self._refs:
+                        freed += self._files[key].size
+                        self._delete(key)
+        return freed
+
+    def make_room(self, size: int) -> bool:
+        """Evict so that `size` more bytes fit the quota; False if pinned files leave too little room."""
+        self.evict(reserve=size)
+        return not self.quota_bytes or self.bytes + self.reserved_bytes() + size <= self.quota_bytes
+
+    def _remove_orphan_previews(self) -> int:
+        removed = 0
+        for name in os.listdir(self.preview_folder):
+            key = content_key(name)
+            with self._lock:
+                orphan = key is None or key not in self._files
+            if orphan and key not in self._preview_tasks:
+                try:
+                    os.remove(os.path.join(self.preview_folder, name))
+                    removed += 1
+                except OSError:
+                    pass
+        return removed
+
+    def compact(self):
+        """Re-sync the index with disk, evict, drop orphaned previews and run the maintenance hooks."""
+        t0 = time.time()
+        self.scan()
+        freed = self.evict()
+        orphans = self._remove_orphan_previews()
+        for hook in self.maintenance:
+            hook()
+        self.compactions += 1
+        log.info(f"Storage compaction: {freed} bytes evicted, {orphans} orphaned previews removed ({time.time() - t0:.4f}s)")
+
+    async def _compact_loop(self):
+        while True:
+            await asyncio.sleep(self.compact_interval)
+            try:
+                await asyncio.to_thread(self.compact)
+            except Exception as e:
+                log.warning(f"Storage compaction failed: {e}")
+
+    def start(self):
+        self._task = asyncio.create_task(self._compact_loop())
+
+    async def shutdown(self):
+        tasks = list(self._preview_tasks.values()) + ([self._task] if self._task else [])
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._task = None
+
+    def previews(self, path: str) -> Dict[str, str]:
+        """Previews of a stored file that exist so far, as paths relative to the upload folder."""
+        key = content_key(path)
+        if key is None:
+            return {}
+        return {
+            kind: f"{PREVIEW_FOLDER}/{key}{suffix}"
+            for kind, suffix in PREVIEW_SUFFIXES.items()
+            if os.path.exists(self._preview_path(key, kind))
+        }
+
+    def previews_pending(self, path: str) -> bool:
+        return content_key(path) in self._preview_tasks
+
+    def schedule_previews(self, path: str, file_type: str) -> Optional[asyncio.Task]:
+        """Generate missing previews in the background (no-op unless previews are enabled)."""
+        key = content_key(path)
+        if not self.previews_enabled or key is None or key in self._preview_tasks:
+            return None
+        kinds = ["thumbnail", "proxy"] if file_type == "video" else ["thumbnail"]
+        kinds = [kind for kind in kinds if not os.path.exists(self._preview_path(key, kind))]
+        if not kinds:
+            return None
+        task = self._preview_tasks[key] = asyncio.create_task(self._make_previews(path, key, file_type, kinds))
+        task.add_done_callback(lambda _: self._preview_tasks.pop(key, None))
+        return task
+
+    async def _make_previews(self, path: str, key: str, file_type: str, kinds: List[str]):
+        with self.hold(path):
+            async with self._preview_slots:
+                for kind in kinds:
+                    t0 = time.time()
+                    dst = self._preview_path(key, kind)
+                    tmp = dst + ".tmp" + os.path.splitext(dst)[1]  # Writers pick the format from the extension
+                    try:
+                        if kind == "thumbnail":
+                            ok = await asyncio.to_thread(make_thumbnail, path, tmp, file_type)
+                        else:
+                            ok = await asyncio.to_thread(make_proxy, path, tmp)
+                        if not ok:
+                            raise ValueError("unreadable media")
+                        os.replace(tmp, dst)
+                    except Exception as e:
+                        log.warning(f"Preview {kind} failed for {os.path.basename(path)}: {e}")
+                        if os.path.exists(tmp):
+                            os.remove(tmp)
+                        continue
+                    with self._lock:
+                        stored = self._files.get(key)
+                        if stored is not None:
+                            size = os.path.getsize(dst)
+                            stored.size += size
+                            self.bytes += size
+                    log.info(f"Preview {kind} for {os.path.basename(path)}: {time.time() - t0:.4f}s")
+        self.evict()
+
+    def stats(self) -> Dict[str, Any]:
+        reserved = self.reserved_bytes()
+        with self._lock:
+            oldest = next(iter(self._files.values()), None)
+            return {
+                "files": len(self._files),
+                "bytes": self.bytes,
+                "reserved_bytes": reserved,
+                "quota_bytes": self.quota_bytes,
+                "usage": (self.bytes + reserved) / self.quota_bytes if self.quota_bytes else None,
+                "ttl": self.ttl,
+                "pinned": len(self._refs),
+                "oldest_access_age": time.time() - oldest.last_access if oldest else None,
+                "evictions": self.evictions,
+                "evicted_bytes": self.evicted_bytes,
+                "compactions": self.compactions,
+                "previews_pending": len(self._preview_tasks),
+            }
@@ -0,0 +1,250 @@
+"""
+Structured timing for the request path.
+
+span() times a stage (upload I/O, decode, each CV feature, verdict call, LLM queue wait
+and generation, ...) into a histogram, and logs go through the "trueview" logger with
+the current request ID attached. /metrics serves every histogram and counter in the
+Prometheus text format, so p50/p99 per stage can be computed with histogram_quantile().
+
+Analysis worker processes record into their own registry; AnalysisExecutor ships the
+recorded deltas back with each result and merges them here (see drain/merge).
+"""
+import asyncio, contextvars, logging, os, threading, time
+from contextlib import contextmanager
+
+from typing import Dict, Any, Optional, Tuple, List, Callable
+
+# Seconds, from a single CV kernel on a small frame up to a full video analysis
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+TOKEN_BUCKETS = (16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192)
+
+# Set per HTTP request (see save_file) and carried into analysis workers
+request_id: contextvars.ContextVar = contextvars.ContextVar("request_id", default="-")
+
+
+class _RequestIdFilter(logging.Filter):
+    def filter(self, record):
+        record.request_id = request_id.get()
+        return True
+
+
+def get_logger() -> logging.Logger:
+    """The app logger; every line carries the request ID it was logged under."""
+    logger = logging.getLogger("trueview")
+    if not logger.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s [%(request_id)s] %(message)s"))
+        handler.addFilter(_RequestIdFilter())
+        logger.addHandler(handler)
+        logger.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+        logger.propagate = False
+    return logger
+
+
+log = get_logger()
+
+
+class Histogram:
+    """Cumulative-bucket histogram with labels, as in the Prometheus data model."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        # label values -> [count per bucket (non-cumulative, last is +Inf), sum]
+        self._series: Dict[Tuple[str, ...], List[Any]] = {}
+
+    def observe(self, value: float, **labels: Any):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        index = len(self.buckets)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                index = i
+                break
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def drain(self) -> Dict[Tuple[str, ...], List[Any]]:
+        with self._lock:
+            series, self._series = self._series, {}
+        return series
+
+    def merge(self, series: Dict[Tuple[str, ...], List[Any]]):
+        with self._lock:
+            for key, (counts, total) in series.items():
+                mine = self._series.get(key)
+                if mine is None:
+                    self._series[key] = [list(counts), total]
+                else:
+                    mine[0] = [a + b for a, b in zip(mine[0], counts)]
+                    mine[1] += total
+
+    def samples(self) -> Dict[Tuple[str, ...], Tuple[List[int], float]]:
+        with self._lock:
+            return {key: (list(counts), total) for key, (counts, total) in self._series.items()}
+
+    def render(self) -> List[str]:
+        lines = []
+        for key, (counts, total) in sorted(self.samples().items()):
+            labels = [f'{name}="{_escape(value)}"' for name, value in zip(self.labelnames, key)]
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(float(bound))
+                bucket_labels = ",".join(labels + ['le="' + le + '"'])
+                lines.append(f"{self.name}_bucket{{{bucket_labels}}} {cumulative}")
+            suffix = "{" + ",".join(labels) + "}" if labels else ""
+            lines.append(f"{self.name}_sum{suffix} {total}")
+            lines.append(f"{self.name}_count{suffix} {cumulative}")
+        return lines
+
+
+class Counter:
+    """Monotonic counter with labels."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._lock = threading.Lock()
+        self._series: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels: Any):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            self._series[key] = self._series.get(key, 0) + amount
+
+    def drain(self) -> Dict[Tuple[str, ...], float]:
+        with self._lock:
+            series, self._series = self._series, {}
+        return series
+
+    def merge(self, series: Dict[Tuple[str, ...], float]):
+        with self._lock:
+            for key, value in series.items():
+                self._series[key] = self._series.get(key, 0) + value
+
+    def render(self) -> List[str]:
+        with self._lock:
+            series = dict(self._series)
+        lines = []
+        for key, value in sorted(series.items()):
+            labels = ",".join(f'{name}="{_escape(v)}"' for name, v in zip(self.labelnames, key))
+            lines.append(f"{self.name}{{{labels}}} {value}" if labels else f"{self.name} {value}")
+        return lines
+
+
+class Gauge:
+    """Current value read from a callback at scrape time (queue depths, usage)."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, read: Callable[[], float]):
+        self.name = name
+        self.documentation = documentation
+        self.read = read
+
+    def drain(self):
+        return None
+
+    def merge(self, series):
+        pass
+
+    def render(self) -> List[str]:
+        return [f"{self.name} {float(self.read())}"]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: Dict[str, Any] = {}
+
+    def register(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def drain(self) -> Dict[str, Any]:
+        """Take everything recorded so far (and reset it), e.g. to send from a worker process."""
+        return {name: metric.drain() for name, metric in self.metrics.items()}
+
+    def merge(self, drained: Dict[str, Any]):
+        for name, series in drained.items():
+            if series and name in self.metrics:
+                self.metrics[name].merge(series)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "trueview_stage_seconds", "Duration of request and analysis stages", ("stage", "status")))
+HTTP_SECONDS = REGISTRY.register(Histogram(
+    "trueview_http_request_seconds", "HTTP request duration by route", ("method", "route", "status")))
+LLM_SECONDS = REGISTRY.register(Histogram(
+    "trueview_llm_seconds", "LLM queue wait, time to first token and generation time", ("phase", "priority")))
+LLM_TOKENS = REGISTRY.register(Histogram(
+    "trueview_llm_tokens", "Tokens per LLM call, as reported by the server", ("kind",), TOKEN_BUCKETS))
+CACHE_LOOKUPS = REGISTRY.register(Counter(
+    "trueview_cache_lookups_total", "Result and explanation cache lookups", ("cache", "result")))
+VERDICT_ATTEMPTS = REGISTRY.register(Counter(
+    "trueview_verdict_attempts_total", "Verdict API calls by outcome", ("outcome",)))
+EVENT_LOOP_LAG = REGISTRY.register(Histogram(
+    "trueview_event_loop_lag_seconds", "How late the event loop woke a periodic timer, i.e. how long it was blocked"))
+
+
+async def monitor_event_loop(interval: float = 0.1):
+    """
+    Record event loop lag until cancelled: sleep for `interval` and observe how much later
+    than that the loop got back to us. Anything synchronous on the loop (CPU work, blocking
+    I/O) shows up here.
+    """
+    loop = asyncio.get_running_loop()
+    while True:
+        t0 = loop.time()
+        await asyncio.sleep(interval)
+        EVENT_LOOP_LAG.observe(max(loop.time() - t0 - interval, 0.0))
+
+
+@contextmanager
+def span(stage: str, log_level: Optional[int] = None, **fields: Any):
+    """
+    Time a block into trueview_stage_seconds{stage, status}; status is "error" if it raised.
+
+    Args:
+        stage (str): Stage name, dotted by subsystem (e.g. "cv.canny", "upload.io").
+        log_level (int): Also log the duration at this level (e.g. logging.INFO); None doesn't log.
+        fields: Extra context for the log line.
+    """
+    t0 = time.perf_counter()
+    status = "ok"
+    try:
+        yield
+    except BaseException:
+        status = "error"
+        raise
+    finally:
+        elapsed = time.perf_counter() - t0
+        STAGE_SECONDS.observe(elapsed, stage=stage, status=status)
+        if log_level is not None:
+            extra = "".join(f" {k}={v}" for k, v in fields.items())
+            log.log(log_level, f"{stage}: {elapsed:.4f}s{extra}" + ("" if status == "ok" else " (failed)"))
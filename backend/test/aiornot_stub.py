@@ -0,0 +1,91 @@
+"""
+Local stand-in for the AI-or-NOT sync API, for tests and benchmarks.
+
+Run it and point the backend at it:
+
+    uvicorn aiornot_stub:app --port 8001      (from backend/test)
+    AIORNOT_URL=http://localhost:8001 VERDICT_SOURCE=api uvicorn save_file:app
+
+Behaviour is set with STUB_LATENCY (seconds), STUB_JITTER (seconds, see sample_latency),
+STUB_DISTRIBUTION, STUB_FAILURE_RATE (0-1) and STUB_FAILURE_STATUS (HTTP status of
+injected failures).
+"""
+import asyncio, math, os, random
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+from typing import Callable
+
+LATENCY_DISTRIBUTIONS = ('uniform', 'exponential', 'lognormal')
+
+
+def sample_latency(latency: float, jitter: float, distribution: str = 'uniform') -> float:
+    """
+    One latency draw, in seconds.
+
+    Args:
+        latency (float): 'uniform' and 'exponential': the minimum; 'lognormal': the median.
+        jitter (float): 'uniform': up to this much extra; 'exponential': mean extra;
+            'lognormal': sigma of the log (0.5 gives a p99 about 3x the median).
+        distribution (str): One of LATENCY_DISTRIBUTIONS.
+    """
+    if distribution == 'uniform':
+        return latency + random.uniform(0, jitter)
+    if distribution == 'exponential':
+        return latency + (random.expovariate(1 / jitter) if jitter > 0 else 0.0)
+    if distribution == 'lognormal':
+        return random.lognormvariate(math.log(latency), jitter) if latency > 0 else 0.0
+    raise ValueError(f"Unknown latency distribution: {distribution}")
+
+
+def create_app(latency: float = float(os.getenv("STUB_LATENCY", "0.5")),
+               jitter: float = float(os.getenv("STUB_JITTER", "0.0")),
+               failure_rate: float = float(os.getenv("STUB_FAILURE_RATE", "0.0")),
+               failure_status: int = int(os.getenv("STUB_FAILURE_STATUS", "503")),
+               distribution: str = os.getenv("STUB_DISTRIBUTION", "uniform")) -> FastAPI:
+    """
+    Args:
+        latency (float): Seconds every scan takes (see sample_latency).
+        jitter (float): Spread of the latency (see sample_latency).
+        failure_rate (float): Fraction of requests answered with failure_status.
+        failure_status (int): Status code of injected failures.
+        distribution (str): Latency distribution, one of LATENCY_DISTRIBUTIONS.
+    """
+    if distribution not in LATENCY_DISTRIBUTIONS:
+        raise ValueError(f"Unknown latency distribution: {distribution}")
+    app = FastAPI()
+    app.state.requests = 0
+
+    async def scan(request: Request, field: str, report: Callable[[bool, float], dict]):
+        app.state.requests += 1
+        form = await request.form()
+        upload = form.get(field)
+        if upload is None:
+            return JSONResponse({"detail": f"Missing '{field}' file"}, status_code=400)
+        size = len(await upload.read())
+
+        await asyncio.sleep(sample_latency(latency, jitter, distribution))
+        if random.random() < failure_rate:
+            return JSONResponse({"detail": "Injected failure"}, status_code=failure_status)
+        # Deterministic per file size, so repeated scans of a file agree
+        confidence = (size % 100) / 100
+        return {"id": f"stub-{size}", "report": report(confidence > 0.5, confidence)}
+
+    @app.post("/v2/image/sync")
+    async def image_sync(request: Request):
+        return await scan(request, "image", lambda detected, confidence: {
+            "ai_generated": {"ai": {"is_detected": detected, "confidence": confidence}},
+            "deepfake": {"is_detected": detected, "confidence": confidence},
+        })
+
+    @app.post("/v2/video/sync")
+    async def video_sync(request: Request):
+        return await scan(request, "video", lambda detected, confidence: {
+            "ai_video": {"is_detected": detected, "confidence": confidence},
+            "deepfake_video": {"is_detected": detected, "confidence": confidence},
+        })
+
+    return app
+
+
+app = create_app()
@@ -0,0 +1,287 @@
+import sys
+from pathlib import Path
+import argparse, json, os, platform, resource, statistics, subprocess, tempfile, time
+
+import cv2
+import numpy as np
+
+# Backend modules import each other by bare name
+script_dir = Path(__file__).resolve().parent
+sys.path.append(str(script_dir.parent))
+
+from attrClassifier import MediaAnalyzer
+
+# Reproducible micro-benchmarks of the CV path on generated media.
+# Usage:
+#   python bench_cv.py [--quick] [--save baseline.json] [--compare baseline.json [--threshold 0.15]]
+# Every case (an image size, or a video resolution / duration / codec) runs in its own
+# process, so peak RSS is measured per case. It reports the best and median time of
+# analyze_image / analyze_video over --repeats runs and the best time of each feature
+# kernel (calculate_*, Canny) on one decoded frame. --compare exits with status 1 if a
+# time or the peak memory grew by more than --threshold against the baseline.
+
+CODECS = {'mp4v': '.mp4', 'MJPG': '.avi', 'VP80': '.webm'}
+FPS = 30
+
+# name -> (size, seconds, codec); seconds and codec are None for images
+CASES = {
+    'image-vga': ((640, 480), None, None),
+    'image-1080p': ((1920, 1080), None, None),
+    'image-4k': ((3840, 2160), None, None),
+    'video-360p-5s-mp4v': ((640, 360), 5, 'mp4v'),
+    'video-720p-5s-mp4v': ((1280, 720), 5, 'mp4v'),
+    'video-720p-5s-MJPG': ((1280, 720), 5, 'MJPG'),
+    'video-720p-5s-VP80': ((1280, 720), 5, 'VP80'),
+    'video-720p-30s-mp4v': ((1280, 720), 30, 'mp4v'),
+    'video-1080p-10s-mp4v': ((1920, 1080), 10, 'mp4v'),
+}
+QUICK_CASES = ('image-vga', 'image-1080p', 'video-360p-5s-mp4v', 'video-720p-5s-MJPG')
+
+# Seconds spent timing each kernel; short kernels get many more calls than --repeats
+KERNEL_BUDGET = 0.5
+# Differences below these are noise at any threshold. Whole-case times only: kernels take
+# microseconds to milliseconds, and their best-of-many timings are checked relative only
+NOISE_SECONDS = 0.001
+NOISE_MB = 8
+
+
+def textured_background(rng, size):
+    """Smooth large-scale colour structure with fine grain, like a natural photo."""
+    width, height = size
+    coarse = rng.integers(0, 255, (max(height // 64, 2), max(width // 64, 2), 3), dtype=np.uint8)
+    image = cv2.resize(coarse, (width, height), interpolation=cv2.INTER_CUBIC)
+    return cv2.add(image, rng.integers(0, 24, image.shape, dtype=np.uint8))
+
+
+def write_image(path, size, seed=0):
+    """A JPEG/PNG (by extension) with textured background and hard-edged shapes."""
+    rng = np.random.default_rng(seed)
+    image = textured_background(rng, size)
+    for _ in range(max(size[0] * size[1] // 40_000, 10)):
+        center = (int(rng.integers(0, size[0])), int(rng.integers(0, size[1])))
+        color = tuple(int(c) for c in rng.integers(0, 255, 3))
+        cv2.circle(image, center, int(rng.integers(5, max(size[0] // 8, 6))), color, int(rng.integers(1, 6)))
+    cv2.imwrite(path, image, [cv2.IMWRITE_JPEG_QUALITY, 90])
+    return path
+
+
+def write_video(path, size, seconds, codec='mp4v', fps=FPS, seed=0):
+    """
+    A clip with a slowly panning textured background, moving shapes and sensor noise,
+    and a scene cut halfway through.
+    """
+    rng = np.random.default_rng(seed)
+    width, height = size
+    pan = width // 4
+    scenes = [textured_background(rng, (width + pan, height)) for _ in range(2)]
+    noise = [rng.integers(0, 12, (height, width, 3), dtype=np.uint8) for _ in range(4)]
+    shapes = [(rng.integers(0, width), rng.integers(0, height), rng.integers(-6, 7), rng.integers(-4, 5),
+               int(rng.integers(height // 20, height // 6)), tuple(int(c) for c in rng.integers(0, 255, 3)))
+              for _ in range(5)]
+    frame_count = int(seconds * fps)
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*codec), fps, size)
+    if not writer.isOpened():
+        raise ValueError(f"OpenCV cannot encode {codec} here")
+    try:
+        for i in range(frame_count):
+            background = scenes[0] if i < frame_count // 2 else scenes[1]
+            offset = i * pan // max(frame_count, 1)
+            frame = cv2.add(background[:, offset:offset + width], noise[i % len(noise)])
+            for x, y, dx, dy, radius, color in shapes:
+                center = (int((x + dx * i) % width), int((y + dy * i) % height))
+                cv2.circle(frame, center, radius, color, -1)
+            writer.write(frame)
+    finally:
+        writer.release()
+    return path
+
+
+def generate(name, media_dir):
+    """Path of the case's media in media_dir, generating it on first use."""
+    size, seconds, codec = CASES[name]
+    path = os.path.join(media_dir, name + (CODECS[codec] if codec else '.jpg'))
+    if not os.path.exists(path):
+        if codec:
+            write_video(path, size, seconds, codec)
+        else:
+            write_image(path, size)
+    return path
+
+
+def peak_rss_mb():
+    # VmHWM restarts at exec; ru_maxrss would carry over the parent's peak
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def best_time(fn, repeats, budget=KERNEL_BUDGET):
+    """Best of at least `repeats` calls, continuing until `budget` seconds are spent (after one warm-up)."""
+    fn()
+    timings = []
+    start = time.perf_counter()
+    while len(timings) < repeats or time.perf_counter() - start < budget:
+        t0 = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - t0)
+    return min(timings)
+
+
+def time_kernels(analyzer, kind, path, repeats):
+    """Best time of each feature kernel on a decoded frame (a pair of frames for the video ones)."""
+    if kind == 'image':
+        color = cv2.imread(path)
+        gray = cv2.cvtColor(color, cv2.COLOR_BGR2GRAY)
+        edges = cv2.Canny(gray, 100, 200)
+        return {
+            'decode': best_time(lambda: cv2.imread(path), repeats),
+            'canny': best_time(lambda: cv2.Canny(gray, 100, 200), repeats),
+            'calculate_texture_variance': best_time(lambda: analyzer.calculate_texture_variance(gray), repeats),
+            'calculate_edge_density': best_time(lambda: analyzer.calculate_edge_density(gray, edges), repeats),
+            'calculate_color_variance': best_time(lambda: analyzer.calculate_color_variance(color), repeats),
+            'calculate_edge_continuity': best_time(lambda: analyzer.calculate_edge_continuity(gray, edges), repeats),
+        }
+    cap = cv2.VideoCapture(path)
+    frames = []
+    while len(frames) < 2:
+        ok, frame = cap.read()
+        if not ok:
+            break
+        for _ in range(FPS // 2 - 1):
+            cap.grab()
+        frames.append(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY))
+    cap.release()
+    prev_gray, gray = frames
+    prev_edges, edges = cv2.Canny(prev_gray, 100, 200), cv2.Canny(gray, 100, 200)
+    return {
+        'compute_frame_features': best_time(lambda: analyzer.compute_frame_features(gray), repeats),
+        'calculate_motion': best_time(lambda: analyzer.calculate_motion(prev_gray, gray), repeats),
+        'calculate_edge_consistency': best_time(lambda: analyzer.calculate_edge_consistency(prev_edges, edges), repeats),
+        'calculate_texture_variance': best_time(lambda: analyzer.calculate_texture_variance(gray), repeats),
+    }
+
+
+def run_case(kind, path, repeats, cv_threads):
+    """Child process: time the analysis and its kernels and report peak RSS."""
+    cv2.setNumThreads(cv_threads)
+    analyzer = MediaAnalyzer()
+    analyze = analyzer.analyze_image if kind == 'image' else analyzer.analyze_video
+    baseline_mb = peak_rss_mb()
+    timings = []
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        analyze(path)
+        timings.append(time.perf_counter() - t0)
+    peak_mb = peak_rss_mb() - baseline_mb
+    print(json.dumps({
+        'seconds': min(timings),
+        'median_seconds': statistics.median(timings),
+        'peak_mb': peak_mb,
+        'kernels': time_kernels(analyzer, kind, path, repeats),
+    }))
+
+
+def environment(cv_threads):
+    """What the numbers depend on besides the code; baselines from elsewhere aren't comparable."""
+    return {
+        'python': platform.python_version(),
+        'opencv': cv2.__version__,
+        'numpy': np.__version__,
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+        'cv_threads': cv_threads,
+    }
+
+
+def regressions(baseline, current, threshold):
+    """
+    Compare two runs case by case.
+
+    Args:
+        baseline (dict): Earlier run, as saved with --save.
+        current (dict): This run.
+        threshold (float): Allowed relative growth, e.g. 0.15 for 15%.
+
+    Returns:
+        list: (case, measurement, baseline value, current value) for each regression
+    """
+    found = []
+
+    def check(case, name, before, after, noise):
+        if before is not None and after > before * (1 + threshold) and after - before > noise:
+            found.append((case, name, before, after))
+
+    for case, run in current['cases'].items():
+        before = baseline['cases'].get(case)
+        if before is None:
+            continue
+        check(case, 'seconds', before['seconds'], run['seconds'], NOISE_SECONDS)
+        check(case, 'peak_mb', before['peak_mb'], run['peak_mb'], NOISE_MB)
+        for kernel, seconds in run['kernels'].items():
+            check(case, kernel, before['kernels'].get(kernel), seconds, 0)
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark MediaAnalyzer on generated images and videos.")
+    parser.add_argument('--cases', nargs='+', choices=sorted(CASES), help="Cases to run (default: all)")
+    parser.add_argument('--quick', action='store_true', help=f"Only {', '.join(QUICK_CASES)}")
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--cv-threads', type=int, default=1, help="cv2.setNumThreads in each case (default 1, for stable numbers)")
+    parser.add_argument('--media-dir', help="Keep generated media here and reuse it on later runs")
+    parser.add_argument('--save', help="Write the results as a JSON baseline")
+    parser.add_argument('--compare', help="Baseline JSON to check against")
+    parser.add_argument('--threshold', type=float, default=0.15, help="Relative slowdown or memory growth counted as a regression")
+    args = parser.parse_args()
+
+    names = args.cases or (QUICK_CASES if args.quick else list(CASES))
+    tmp_dir = None
+    media_dir = args.media_dir
+    if media_dir is None:
+        tmp_dir = tempfile.TemporaryDirectory()
+        media_dir = tmp_dir.name
+    os.makedirs(media_dir, exist_ok=True)
+
+    results = {'environment': environment(args.cv_threads), 'cases': {}}
+    try:
+        for name in names:
+            kind = 'video' if CASES[name][2] else 'image'
+            path = generate(name, media_dir)
+            out = subprocess.run([sys.executable, __file__, '--child', json.dumps([kind, path, args.repeats, args.cv_threads])],
+                                 capture_output=True, text=True, check=True).stdout
+            run = results['cases'][name] = json.loads(out.strip().splitlines()[-1])
+            slowest = max(run['kernels'], key=run['kernels'].get)
+            print(f"{name:<22} {run['seconds']:8.4f}s (median {run['median_seconds']:.4f}s) "
+                  f"peak {run['peak_mb']:6.1f} MB   slowest kernel: {slowest} {run['kernels'][slowest] * 1000:.2f} ms")
+    finally:
+        if tmp_dir:
+            tmp_dir.cleanup()
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Baseline written to {args.save}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline.get('environment') != results['environment']:
+            print(f"Warning: baseline environment differs: {baseline.get('environment')}")
+        found = regressions(baseline, results, args.threshold)
+        for case, name, before, after in found:
+            print(f"REGRESSION {case} {name}: {before:.4f} -> {after:.4f} ({after / before - 1:+.0%})")
+        if found:
+            sys.exit(1)
+        print(f"No regressions beyond {args.threshold:.0%}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 3 and sys.argv[1] == '--child':
+        run_case(*json.loads(sys.argv[2]))
+        sys.exit(0)
+    main()
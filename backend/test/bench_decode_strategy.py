@@ -0,0 +1,65 @@
+import sys
+from pathlib import Path
+import time, tempfile
+
+import cv2
+import numpy as np
+
+# Backend modules import each other by bare name
+script_dir = Path(__file__).resolve().parent
+sys.path.append(str(script_dir.parent))
+
+from attrClassifier import MediaAnalyzer
+
+# Compares seek vs sequential vs auto frame sampling in MediaAnalyzer.analyze_video.
+# Usage: python bench_decode_strategy.py [video ...]
+# Without arguments a short and a long synthetic clip are generated.
+
+REPEATS = 3
+
+
+def write_clip(path, frame_count, size=(640, 360), fps=30):
+    rng = np.random.default_rng(0)
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'mp4v'), fps, size)
+    background = (rng.random((size[1], size[0], 3)) * 80).astype(np.uint8)
+    for i in range(frame_count):
+        frame = background.copy()
+        cv2.circle(frame, (i * 4 % size[0], size[1] // 2), 40, (255, 255, 255), -1)
+        writer.write(frame)
+    writer.release()
+    return path
+
+
+def bench(path):
+    results = {}
+    for strategy in ('seek', 'sequential', 'auto'):
+        timings = []
+        for _ in range(REPEATS):
+            analyzer = MediaAnalyzer(decode_strategy=strategy)
+            t0 = time.time()
+            result = analyzer.analyze_video(path)
+            timings.append(time.time() - t0)
+        results[strategy] = (min(timings), result)
+
+    meta = results['seek'][1]['metadata']
+    print(f"\n{Path(path).name}: {meta['frame_count']} frames, {meta['width']}x{meta['height']}")
+    for strategy, (elapsed, result) in results.items():
+        print(f"   {strategy:<11} {elapsed:.4f}s  (used: {result['metadata']['decode_strategy']})")
+
+    same = all(r['raw_data'] == results['seek'][1]['raw_data'] for _, r in results.values())
+    print(f"   identical raw_data: {same}")
+
+
+if __name__ == "__main__":
+    paths = sys.argv[1:]
+    tmp_dir = None
+    if not paths:
+        tmp_dir = tempfile.TemporaryDirectory()
+        paths = [
+            write_clip(str(Path(tmp_dir.name) / 'short_4s.mp4'), 120),
+            write_clip(str(Path(tmp_dir.name) / 'long_120s.mp4'), 3600),
+        ]
+    for path in paths:
+        bench(path)
+    if tmp_dir:
+        tmp_dir.cleanup()
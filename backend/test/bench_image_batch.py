@@ -0,0 +1,80 @@
+import sys
+from pathlib import Path
+import time, tempfile
+
+import cv2
+import numpy as np
+
+# Backend modules import each other by bare name
+script_dir = Path(__file__).resolve().parent
+sys.path.append(str(script_dir.parent))
+
+from attrClassifier import MediaAnalyzer
+
+# Images/sec of the previous per-image path vs analyze_image vs the batched analyze_images.
+# Usage: python bench_image_batch.py [image ...]
+# Without arguments 64 synthetic 1280x720 JPEGs are generated.
+
+REPEATS = 3
+
+
+def write_images(folder, count, size=(1280, 720)):
+    rng = np.random.default_rng(0)
+    paths = []
+    for i in range(count):
+        image = cv2.GaussianBlur(rng.integers(0, 255, (size[1], size[0], 3), dtype=np.uint8), (5, 5), 0)
+        cv2.rectangle(image, (i * 7 % size[0], 50), (i * 7 % size[0] + 200, 300), (255, 255, 255), -1)
+        path = str(Path(folder) / f"image_{i:03d}.jpg")
+        cv2.imwrite(path, image)
+        paths.append(path)
+    return paths
+
+
+def legacy_image_metrics(path):
+    """The previous analyze_image: color-image Canny for continuity, per-channel np.var."""
+    image = cv2.imread(path)
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    edges = cv2.Canny(gray, 100, 200)
+    contours, _ = cv2.findContours(cv2.Canny(image, 100, 200), cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    return {
+        'avg_texture_variance': float(np.var(cv2.Laplacian(gray, cv2.CV_64F))),
+        'edge_density': cv2.countNonZero(edges) / edges.size,
+        'color_variance': float(np.mean([np.var(image[:, :, i]) for i in range(3)])),
+        'edge_continuity': float(np.mean([len(c) for c in contours])) if contours else 0.0,
+    }
+
+
+def timed(fn):
+    best, result = None, None
+    for _ in range(REPEATS):
+        t0 = time.time()
+        result = fn()
+        elapsed = time.time() - t0
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+if __name__ == "__main__":
+    paths = sys.argv[1:]
+    tmp_dir = None
+    if not paths:
+        tmp_dir = tempfile.TemporaryDirectory()
+        paths = write_images(tmp_dir.name, 64)
+
+    analyzer = MediaAnalyzer()
+    runs = {
+        'previous per-image': timed(lambda: [legacy_image_metrics(p) for p in paths]),
+        'analyze_image': timed(lambda: [analyzer.analyze_image(p)['metrics'] for p in paths]),
+        'analyze_images': timed(lambda: [r['metrics'] for _, r, _ in analyzer.analyze_images(paths)]),
+    }
+
+    print(f"\n{len(paths)} images")
+    for name, (elapsed, _) in runs.items():
+        print(f"   {name:<19} {elapsed:.4f}s  {len(paths) / elapsed:8.1f} images/sec")
+
+    previous, current = runs['previous per-image'][1], runs['analyze_images'][1]
+    for metric in previous[0]:
+        diff = max(abs(a[metric] - b[metric]) / max(abs(a[metric]), 1e-12) for a, b in zip(previous, current))
+        print(f"   max relative change in {metric}: {diff:.2e}")
+    if tmp_dir:
+        tmp_dir.cleanup()
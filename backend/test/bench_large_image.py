@@ -0,0 +1,91 @@
+import sys
+from pathlib import Path
+import json, resource, subprocess, time, tempfile
+
+import cv2
+import numpy as np
+
+# Backend modules import each other by bare name
+script_dir = Path(__file__).resolve().parent
+sys.path.append(str(script_dir.parent))
+
+from attrClassifier import MediaAnalyzer
+
+# Time, peak memory and metric error of the image modes against full resolution.
+# Usage: python bench_large_image.py [image]
+# Without arguments a synthetic 8000x6000 (48 MP) JPEG is generated.
+# Each mode runs in its own process so peak RSS is measured per mode.
+
+MODES = [
+    ('full', {}),
+    ('tiled 64MB', {'image_mode': 'tiled', 'tile_memory_mb': 64}),
+    ('tiled 16MB', {'image_mode': 'tiled', 'tile_memory_mb': 16}),
+    ('reduced /2', {'image_mode': 'reduced', 'image_reduce': 2}),
+    ('reduced /4', {'image_mode': 'reduced', 'image_reduce': 4}),
+    ('reduced /8', {'image_mode': 'reduced', 'image_reduce': 8}),
+]
+
+
+def write_image(path, size=(8000, 6000)):
+    rng = np.random.default_rng(0)
+    # Smooth large-scale structure, shapes with hard edges, and fine grain
+    image = cv2.resize(rng.integers(0, 255, (size[1] // 100, size[0] // 100, 3), dtype=np.uint8), size,
+                       interpolation=cv2.INTER_CUBIC)
+    for _ in range(300):
+        center = (int(rng.integers(0, size[0])), int(rng.integers(0, size[1])))
+        color = tuple(int(c) for c in rng.integers(0, 255, 3))
+        cv2.circle(image, center, int(rng.integers(10, 600)), color, int(rng.integers(1, 8)))
+    image = cv2.add(image, rng.integers(0, 24, image.shape, dtype=np.uint8))
+    cv2.imwrite(path, image, [cv2.IMWRITE_JPEG_QUALITY, 90])
+    return path
+
+
+def peak_rss_mb():
+    # VmHWM restarts at exec; ru_maxrss would carry over the parent's peak
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_mode(path, options):
+    """Child process: analyze once and report time and peak RSS."""
+    baseline_mb = peak_rss_mb()
+    t0 = time.time()
+    result = MediaAnalyzer(**options).analyze_image(path)
+    elapsed = time.time() - t0
+    print(json.dumps({'seconds': elapsed, 'peak_mb': peak_rss_mb() - baseline_mb, 'metrics': result['metrics']}))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 3 and sys.argv[1] == '--child':
+        path, options = json.loads(sys.argv[2])
+        run_mode(path, options)
+        sys.exit(0)
+
+    tmp_dir = None
+    if len(sys.argv) > 1:
+        path = sys.argv[1]
+    else:
+        tmp_dir = tempfile.TemporaryDirectory()
+        path = write_image(str(Path(tmp_dir.name) / 'large.jpg'))
+
+    runs = {}
+    for name, options in MODES:
+        out = subprocess.run([sys.executable, __file__, '--child', json.dumps([path, options])],
+                             capture_output=True, text=True, check=True).stdout
+        runs[name] = json.loads(out.strip().splitlines()[-1])
+
+    print(f"\n{Path(path).name} (peak MB: resident memory added by the analysis, decode included)")
+    full = runs['full']['metrics']
+    names = ['avg_texture_variance', 'edge_density', 'color_variance', 'edge_continuity']
+    print(f"   {'mode':<12} {'seconds':>8} {'peak MB':>8}  " + "  ".join(f"{n[:14]:>14}" for n in names))
+    for name, run in runs.items():
+        errors = [(run['metrics'][n] - full[n]) / full[n] if full[n] else 0.0 for n in names]
+        print(f"   {name:<12} {run['seconds']:8.2f} {run['peak_mb']:8.0f}  " + "  ".join(f"{e:+14.2%}" for e in errors))
+    if tmp_dir:
+        tmp_dir.cleanup()
@@ -0,0 +1,292 @@
+import sys
+from pathlib import Path
+import argparse, asyncio, json, math, os, random, re, signal, socket, subprocess, tempfile, time
+
+import httpx
+
+from bench_cv import write_image, write_video
+from aiornot_stub import LATENCY_DISTRIBUTIONS
+
+# End-to-end load test of the FastAPI app.
+# Usage: python bench_load.py [--rate 2] [--duration 60] [--video-ratio 0.2] [--json report.json]
+# Starts llm_stub and aiornot_stub (latency distributions set by the --llm-* and
+# --verdict-* options) and the app pointed at them, or drives --url instead. Sessions
+# (POST /upload, then POST /analyze/metrics for the returned analysis_id) arrive as a
+# Poisson process at --rate per second, open loop: a slow server doesn't slow the
+# arrivals down, it builds up in-flight sessions. Reports throughput, p50/p95/p99 and
+# error rates per endpoint, and the server's event loop lag from /metrics.
+
+script_dir = Path(__file__).resolve().parent
+backend_dir = script_dir.parent
+
+ENDPOINTS = ("/upload", "/analyze/metrics")
+LOOP_LAG_METRIC = "trueview_event_loop_lag_seconds"
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(module_app, port, cwd, env):
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", module_app, "--host", "127.0.0.1", "--port", str(port),
+         "--log-level", "warning"],
+        cwd=cwd, env={**os.environ, **env},
+    )
+
+
+def stop_servers(processes, grace=15.0):
+    for process in processes:
+        process.terminate()
+    deadline = time.time() + grace
+    for process in processes:
+        try:
+            process.wait(max(deadline - time.time(), 0.1))
+        except subprocess.TimeoutExpired:
+            # Graceful shutdown waits for open requests, which may never finish under overload
+            process.kill()
+            process.wait()
+
+
+def wait_ready(url, timeout=60.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if httpx.get(url, timeout=1.0).status_code < 500:
+                return
+        except httpx.TransportError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up within {timeout:.0f}s")
+
+
+def make_corpus(media_dir, distinct, video_ratio, image_size, video_size, video_seconds):
+    """`distinct` images and videos with different content (so different metrics and LLM prompts)."""
+    images = [write_image(os.path.join(media_dir, f"image-{i}.jpg"), image_size, seed=i) for i in range(distinct)]
+    videos = []
+    if video_ratio > 0:
+        videos = [write_video(os.path.join(media_dir, f"video-{i}.mp4"), video_size, video_seconds, seed=i)
+                  for i in range(distinct)]
+    return [(Path(p).name, Path(p).read_bytes()) for p in images], [(Path(p).name, Path(p).read_bytes()) for p in videos]
+
+
+def percentile(ordered, q):
+    if not ordered:
+        return 0.0
+    return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+
+def histogram_buckets(text, name):
+    """Cumulative bucket counts of a histogram in a /metrics scrape, summed over label sets."""
+    buckets = {}
+    for match in re.finditer(rf'^{name}_bucket{{(?:[^}}]*,)?le="([^"]+)"}} (\S+)$', text, re.M):
+        bound = math.inf if match.group(1) == "+Inf" else float(match.group(1))
+        buckets[bound] = buckets.get(bound, 0) + float(match.group(2))
+    return buckets
+
+
+def histogram_quantile(q, buckets):
+    """Quantile estimate from cumulative buckets, interpolating within a bucket like Prometheus."""
+    bounds = sorted(buckets)
+    if not bounds or buckets[bounds[-1]] == 0:
+        return 0.0
+    rank = q * buckets[bounds[-1]]
+    lower, below = 0.0, 0.0
+    for bound in bounds:
+        count = buckets[bound]
+        if count >= rank:
+            if bound == math.inf:
+                return lower
+            return lower + (bound - lower) * (rank - below) / max(count - below, 1e-12)
+        lower, below = bound, count
+    return lower
+
+
+class LoadResults:
+    """Latency and outcome of every request, per endpoint."""
+
+    def __init__(self):
+        self.latencies = {endpoint: [] for endpoint in ENDPOINTS}
+        self.outcomes = {endpoint: {} for endpoint in ENDPOINTS}
+        self.sessions = 0
+        self.skipped = 0
+
+    def record(self, endpoint, seconds, outcome):
+        self.latencies[endpoint].append(seconds)
+        self.outcomes[endpoint][outcome] = self.outcomes[endpoint].get(outcome, 0) + 1
+
+    def report(self, elapsed):
+        endpoints = {}
+        for endpoint in ENDPOINTS:
+            ordered = sorted(self.latencies[endpoint])
+            outcomes = self.outcomes[endpoint]
+            total = sum(outcomes.values())
+            errors = sum(count for outcome, count in outcomes.items() if not outcome.startswith("2"))
+            endpoints[endpoint] = {
+                "requests": total,
+                "throughput": total / elapsed if elapsed else 0.0,
+                "p50": percentile(ordered, 0.50),
+                "p95": percentile(ordered, 0.95),
+                "p99": percentile(ordered, 0.99),
+                "max": ordered[-1] if ordered else 0.0,
+                "error_rate": errors / total if total else 0.0,
+                "outcomes": outcomes,
+            }
+        return {
+            "elapsed": elapsed,
+            "sessions": self.sessions,
+            "sessions_per_sec": self.sessions / elapsed if elapsed else 0.0,
+            "skipped": self.skipped,
+            "endpoints": endpoints,
+        }
+
+
+async def timed(client, results, endpoint, **kwargs):
+    t0 = time.perf_counter()
+    try:
+        response = await client.post(endpoint, **kwargs)
+    except httpx.HTTPError as e:
+        results.record(endpoint, time.perf_counter() - t0, type(e).__name__)
+        return None
+    results.record(endpoint, time.perf_counter() - t0, str(response.status_code))
+    return response
+
+
+async def session(client, results, corpus, video_ratio, metrics_ratio):
+    images, videos = corpus
+    name, data = random.choice(videos if videos and random.random() < video_ratio else images)
+    # A random trailer (ignored by decoders) makes every upload new to the result cache
+    data += os.urandom(16)
+    response = await timed(client, results, "/upload", files={"file": (name, data)})
+    if response is not None and response.status_code == 200 and random.random() < metrics_ratio:
+        await timed(client, results, "/analyze/metrics", json={"analysis_id": response.json()["analysis_id"]})
+    results.sessions += 1
+
+
+async def run_load(url, corpus, rate, duration, video_ratio, metrics_ratio, max_in_flight, timeout):
+    """Open-loop Poisson arrivals for `duration` seconds, then wait for the stragglers."""
+    results = LoadResults()
+    limits = httpx.Limits(max_connections=max_in_flight, max_keepalive_connections=max_in_flight)
+    async with httpx.AsyncClient(base_url=url, timeout=timeout, limits=limits) as client:
+        before = (await client.get("/metrics")).text
+        in_flight = set()
+        start = time.perf_counter()
+        next_arrival = start
+        while next_arrival - start < duration:
+            await asyncio.sleep(max(next_arrival - time.perf_counter(), 0))
+            if len(in_flight) >= max_in_flight:
+                results.skipped += 1
+            else:
+                task = asyncio.create_task(session(client, results, corpus, video_ratio, metrics_ratio))
+                in_flight.add(task)
+                task.add_done_callback(in_flight.discard)
+            next_arrival += random.expovariate(rate)
+        if in_flight:
+            await asyncio.wait(in_flight)
+        elapsed = time.perf_counter() - start
+        after = (await client.get("/metrics")).text
+
+    report = results.report(elapsed)
+    lag_before, lag_after = histogram_buckets(before, LOOP_LAG_METRIC), histogram_buckets(after, LOOP_LAG_METRIC)
+    lag = {bound: count - lag_before.get(bound, 0) for bound, count in lag_after.items()}
+    report["event_loop_lag"] = {f"p{int(q * 100)}": histogram_quantile(q, lag) for q in (0.5, 0.95, 0.99)}
+    report["event_loop_lag"]["samples"] = lag.get(math.inf, 0)
+    return report
+
+
+def print_report(report, rate):
+    print(f"\n{report['sessions']} sessions in {report['elapsed']:.1f}s "
+          f"({report['sessions_per_sec']:.2f}/s offered {rate:.2f}/s, {report['skipped']} skipped at the in-flight cap)")
+    print(f"   {'endpoint':<18} {'req':>6} {'req/s':>7} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8} {'errors':>7}  outcomes")
+    for endpoint, stats in report["endpoints"].items():
+        print(f"   {endpoint:<18} {stats['requests']:6d} {stats['throughput']:7.2f} {stats['p50']:8.3f} "
+              f"{stats['p95']:8.3f} {stats['p99']:8.3f} {stats['max']:8.3f} {stats['error_rate']:7.1%}  {stats['outcomes']}")
+    lag = report["event_loop_lag"]
+    print(f"   event loop lag: p50 {lag['p50'] * 1000:.1f} ms, p95 {lag['p95'] * 1000:.1f} ms, "
+          f"p99 {lag['p99'] * 1000:.1f} ms ({lag['samples']:.0f} probes)")
+
+
+def size_arg(value):
+    width, height = value.lower().split("x")
+    return int(width), int(height)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay an upload + metrics workload against the app with stub backends.")
+    parser.add_argument("--url", help="Drive an already running server instead of starting one with stubs")
+    parser.add_argument("--rate", type=float, default=2.0, help="Session arrivals per second")
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds of arrivals")
+    parser.add_argument("--video-ratio", type=float, default=0.2, help="Fraction of uploads that are videos")
+    parser.add_argument("--metrics-ratio", type=float, default=1.0, help="Fraction of sessions that request /analyze/metrics")
+    parser.add_argument("--max-in-flight", type=int, default=256, help="Arrivals beyond this many open sessions are skipped")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Client timeout per request, seconds")
+    parser.add_argument("--distinct", type=int, default=8, help="Distinct images (and videos) in the workload")
+    parser.add_argument("--image-size", type=size_arg, default=(1280, 720))
+    parser.add_argument("--video-size", type=size_arg, default=(640, 360))
+    parser.add_argument("--video-seconds", type=float, default=5.0)
+    parser.add_argument("--llm-ttft", type=float, default=0.3, help="LLM stub time to first token, seconds")
+    parser.add_argument("--llm-jitter", type=float, default=0.3)
+    parser.add_argument("--llm-distribution", choices=LATENCY_DISTRIBUTIONS, default="lognormal")
+    parser.add_argument("--llm-token-seconds", type=float, default=0.01)
+    parser.add_argument("--llm-tokens", type=int, default=60)
+    parser.add_argument("--llm-parallel", type=int, default=4, help="Generations the LLM stub runs at once (0: unlimited)")
+    parser.add_argument("--llm-load-seconds", type=float, default=0.0, help="LLM stub model load time (cold start)")
+    parser.add_argument("--verdict-latency", type=float, default=0.5)
+    parser.add_argument("--verdict-jitter", type=float, default=0.3)
+    parser.add_argument("--verdict-distribution", choices=LATENCY_DISTRIBUTIONS, default="lognormal")
+    parser.add_argument("--verdict-failure-rate", type=float, default=0.0)
+    parser.add_argument("--app-env", action="append", default=[], metavar="KEY=VALUE",
+                        help="Extra environment for the app, e.g. ANALYSIS_WORKERS=2 (repeatable)")
+    parser.add_argument("--json", help="Also write the report here")
+    args = parser.parse_args()
+    # Make SIGTERM unwind like Ctrl-C, so the servers started below are stopped too
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        corpus = make_corpus(tmp, args.distinct, args.video_ratio, args.image_size, args.video_size, args.video_seconds)
+        processes = []
+        url = args.url
+        try:
+            if url is None:
+                llm_port, verdict_port, app_port = free_port(), free_port(), free_port()
+                processes.append(start_server("llm_stub:app", llm_port, script_dir, {
+                    "STUB_LLM_TTFT": str(args.llm_ttft), "STUB_LLM_JITTER": str(args.llm_jitter),
+                    "STUB_LLM_DISTRIBUTION": args.llm_distribution,
+                    "STUB_LLM_TOKEN_SECONDS": str(args.llm_token_seconds), "STUB_LLM_TOKENS": str(args.llm_tokens),
+                    "STUB_LLM_PARALLEL": str(args.llm_parallel), "STUB_LLM_LOAD_SECONDS": str(args.llm_load_seconds),
+                }))
+                processes.append(start_server("aiornot_stub:app", verdict_port, script_dir, {
+                    "STUB_LATENCY": str(args.verdict_latency), "STUB_JITTER": str(args.verdict_jitter),
+                    "STUB_DISTRIBUTION": args.verdict_distribution,
+                    "STUB_FAILURE_RATE": str(args.verdict_failure_rate),
+                }))
+                app_env = {
+                    "OLLAMA_URL": f"http://127.0.0.1:{llm_port}/v1",
+                    "VERDICT_SOURCE": "api",
+                    "AIORNOT_URL": f"http://127.0.0.1:{verdict_port}",
+                    "AIORNOT_API_KEY": "stub",
+                    "UPLOAD_FOLDER": os.path.join(tmp, "media"),
+                    "LOG_LEVEL": "WARNING",
+                    **dict(item.split("=", 1) for item in args.app_env),
+                }
+                processes.append(start_server("save_file:app", app_port, backend_dir, app_env))
+                url = f"http://127.0.0.1:{app_port}"
+                wait_ready(f"http://127.0.0.1:{llm_port}/v1/models")
+                wait_ready(f"http://127.0.0.1:{verdict_port}/docs")
+            wait_ready(f"{url}/metrics")
+
+            report = asyncio.run(run_load(url, corpus, args.rate, args.duration, args.video_ratio,
+                                          args.metrics_ratio, args.max_in_flight, args.timeout))
+        finally:
+            stop_servers(processes)
+
+    print_report(report, args.rate)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+import sys
+from pathlib import Path
+import time, asyncio
+
+# Backend modules import each other by bare name
+script_dir = Path(__file__).resolve().parent
+sys.path.append(str(script_dir.parent))
+
+from explainability import ExplainabilityEngine
+
+# Compares one batched JSON completion against one completion per metric.
+# Needs the LLM server configured by OLLAMA_URL / OLLAMA_MODEL to be running.
+
+REPEATS = 3
+
+VIDEO_RESULT = {
+    'metadata': {'type': 'video', 'frame_count': 300, 'fps': 30.0, 'width': 1280, 'height': 720, 'duration': 10.0},
+    'metrics': {'avg_motion': 18.4, 'avg_edge_consistency': 7.9, 'avg_texture_variance': 812.5,
+                'motion_std': 3.1, 'edge_std': 1.4, 'texture_std': 96.0},
+}
+IMAGE_RESULT = {
+    'metadata': {'type': 'image', 'width': 1024, 'height': 768},
+    'metrics': {'avg_texture_variance': 212.7, 'texture_std': 0.0, 'edge_density': 0.041,
+                'color_variance': 3650.2, 'edge_continuity': 24.8},
+}
+
+
+async def bench(name, analysis_result):
+    print(f"\n{name}: {len(analysis_result['metrics'])} metrics")
+    for batched in (False, True):
+        label = 'batched' if batched else 'fan-out'
+        timings, usage = [], None
+        for _ in range(REPEATS):
+            engine = ExplainabilityEngine()
+            t0 = time.time()
+            results = await engine.analyze_all_metrics(analysis_result, batched=batched)
+            timings.append(time.time() - t0)
+            usage = engine.usage
+        errors = sum(r.get('analysis', '').startswith('Error') for r in results)
+        print(f"   {label:<8} best {min(timings):.2f}s  mean {sum(timings) / len(timings):.2f}s  "
+              f"calls {usage['calls']}  prompt tokens {usage['prompt_tokens']}  "
+              f"completion tokens {usage['completion_tokens']}  errors {errors}")
+
+
+async def main():
+    await bench('Video', VIDEO_RESULT)
+    await bench('Image', IMAGE_RESULT)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,192 @@
+"""
+Local stand-in for the OpenAI-compatible chat completions endpoint of Ollama, for tests
+and load benchmarks.
+
+Run it and point the backend at it:
+
+    uvicorn llm_stub:app --port 8002      (from backend/test)
+    OLLAMA_URL=http://localhost:8002/v1 uvicorn save_file:app
+
+A completion takes a time-to-first-token drawn from STUB_LLM_TTFT / STUB_LLM_JITTER /
+STUB_LLM_DISTRIBUTION (see aiornot_stub.sample_latency), then STUB_LLM_TOKEN_SECONDS per
+token for STUB_LLM_TOKENS tokens. At most STUB_LLM_PARALLEL completions are generated at
+once (0 for no limit), like OLLAMA_NUM_PARALLEL; the rest wait. STUB_LLM_FAILURE_RATE
+answers that fraction of requests with a 500.
+
+Like Ollama, a model that isn't loaded takes STUB_LLM_LOAD_SECONDS to load first and is
+unloaded after STUB_LLM_UNLOAD_AFTER idle seconds, or after the keep_alive of a native
+POST /api/generate preload. STUB_LLM_MODELS (comma-separated) limits the models served;
+others get a 404 like a model that hasn't been pulled.
+"""
+import asyncio, json, os, random, re, time, uuid
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from aiornot_stub import LATENCY_DISTRIBUTIONS, sample_latency
+
+from typing import Optional
+
+# The batched metric prompt (prompt_builder.build_batched_metric_prompt) names its JSON keys
+JSON_KEYS_PATTERN = re.compile(r'exactly these keys: (.*?)\. Each value')
+FILLER_WORDS = ("the", "edges", "texture", "shows", "natural", "variation", "consistent",
+                "with", "camera", "noise", "and", "lighting")
+
+
+def parse_duration(value) -> Optional[float]:
+    """Ollama keep_alive: seconds, or a duration like "30m"; negative keeps the model forever."""
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        seconds = float(value)
+    else:
+        units = {"s": 1, "m": 60, "h": 3600}
+        seconds = float(value[:-1]) * units[value[-1]] if value[-1] in units else float(value)
+    return float("inf") if seconds < 0 else seconds
+
+
+def create_app(ttft: float = float(os.getenv("STUB_LLM_TTFT", "0.2")),
+               jitter: float = float(os.getenv("STUB_LLM_JITTER", "0.0")),
+               distribution: str = os.getenv("STUB_LLM_DISTRIBUTION", "uniform"),
+               token_seconds: float = float(os.getenv("STUB_LLM_TOKEN_SECONDS", "0.01")),
+               tokens: int = int(os.getenv("STUB_LLM_TOKENS", "60")),
+               parallel: int = int(os.getenv("STUB_LLM_PARALLEL", "0")),
+               failure_rate: float = float(os.getenv("STUB_LLM_FAILURE_RATE", "0.0")),
+               models: Optional[str] = os.getenv("STUB_LLM_MODELS"),
+               load_seconds: float = float(os.getenv("STUB_LLM_LOAD_SECONDS", "0.0")),
+               unload_after: float = float(os.getenv("STUB_LLM_UNLOAD_AFTER", "300"))) -> FastAPI:
+    """
+    Args:
+        ttft (float): Time to first token, seconds (see aiornot_stub.sample_latency).
+        jitter (float): Spread of the time to first token.
+        distribution (str): One of aiornot_stub.LATENCY_DISTRIBUTIONS.
+        token_seconds (float): Seconds per generated token after the first.
+        tokens (int): Tokens per completion (per metric for batched JSON prompts).
+        parallel (int): Completions generated at once; 0 means unlimited.
+        failure_rate (float): Fraction of requests answered with a 500.
+        models (str): Comma-separated models served; None serves any model.
+        load_seconds (float): Time to load a model that isn't loaded.
+        unload_after (float): Idle seconds after which a model is unloaded.
+    """
+    if distribution not in LATENCY_DISTRIBUTIONS:
+        raise ValueError(f"Unknown latency distribution: {distribution}")
+    slots = asyncio.Semaphore(parallel) if parallel > 0 else None
+
+    @asynccontextmanager
+    async def slot():
+        if slots is None:
+            yield
+            return
+        async with slots:
+            yield
+
+    available = set(models.split(",")) if models else None
+    # model -> time it will be unloaded
+    expiry = {}
+    load_locks = {}
+
+    async def load(model, keep_for=None):
+        """Wait for the model to be loaded (loading it if needed) and reset its expiry, as Ollama does on every request."""
+        async with load_locks.setdefault(model, asyncio.Lock()):
+            if expiry.get(model, 0) <= time.time():
+                app.state.loads += 1
+                await asyncio.sleep(load_seconds)
+            expiry[model] = time.time() + (unload_after if keep_for is None else keep_for)
+
+    def missing(model):
+        if available is None or model in available:
+            return None
+        return JSONResponse({"error": {"message": f'model "{model}" not found, try pulling it first',
+                                       "type": "api_error"}}, status_code=404)
+
+    app = FastAPI()
+    app.state.requests = 0
+    app.state.loads = 0
+
+    def words(count):
+        return [random.choice(FILLER_WORDS) for _ in range(count)]
+
+    def reply_for(body):
+        """Completion text as a list of tokens (valid JSON for the batched metric prompt), within max_tokens."""
+        prompt = body["messages"][-1]["content"]
+        limit = body.get("max_tokens") or float("inf")
+        if (body.get("response_format") or {}).get("type") == "json_object":
+            keys = re.findall(r'"([^"]+)"', (JSON_KEYS_PATTERN.search(prompt) or [None, ""])[1])
+            count = int(min(tokens, limit // max(len(keys), 1)))
+            text = json.dumps({key: " ".join(words(count)) + "." for key in keys})
+            return [text], count * max(len(keys), 1)
+        count = int(min(tokens, limit))
+        return [word + " " for word in words(count)], count
+
+    @app.get("/v1/models")
+    async def list_models():
+        return {"object": "list", "data": [{"id": model, "object": "model", "owned_by": "stub"}
+                                           for model in sorted(available or {"stub"})]}
+
+    @app.post("/api/generate")
+    async def generate(request: Request):
+        """Ollama's native endpoint; only the preload form (no prompt) is supported."""
+        body = await request.json()
+        model = body.get("model", "stub")
+        if (error := missing(model)) is not None:
+            return error
+        await load(model, parse_duration(body.get("keep_alive")))
+        return {"model": model, "response": "", "done": True, "done_reason": "load"}
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        app.state.requests += 1
+        body = await request.json()
+        if random.random() < failure_rate:
+            return JSONResponse({"error": {"message": "Injected failure"}}, status_code=500)
+        model = body.get("model", "stub")
+        if (error := missing(model)) is not None:
+            return error
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        created = int(time.time())
+        pieces, completion_tokens = reply_for(body)
+        prompt_tokens = len(body["messages"][-1]["content"]) // 4
+        first_token = sample_latency(ttft, jitter, distribution)
+        per_piece = token_seconds * max(completion_tokens - 1, 0) / max(len(pieces), 1)
+
+        if not body.get("stream"):
+            async with slot():
+                await load(model)
+                await asyncio.sleep(first_token + per_piece * len(pieces))
+            return {
+                "id": completion_id, "object": "chat.completion", "created": created, "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(pieces)},
+                             "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                          "total_tokens": prompt_tokens + completion_tokens},
+            }
+
+        def chunk(delta, finish_reason=None):
+            payload = {"id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                       "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]}
+            return f"data: {json.dumps(payload)}\n\n"
+
+        async def events():
+            async with slot():
+                await load(model)
+                await asyncio.sleep(first_token)
+                yield chunk({"role": "assistant", "content": ""})
+                for i, piece in enumerate(pieces):
+                    if i:
+                        await asyncio.sleep(per_piece)
+                    yield chunk({"content": piece})
+            yield chunk({}, "stop")
+            if (body.get("stream_options") or {}).get("include_usage"):
+                # Totals come in a last chunk without choices, as from the OpenAI API
+                payload = {"id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                           "choices": [], "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                                                    "total_tokens": prompt_tokens + completion_tokens}}
+                yield f"data: {json.dumps(payload)}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    return app
+
+
+app = create_app()
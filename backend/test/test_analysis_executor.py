@@ -0,0 +1,97 @@
+import sys
+from pathlib import Path
+import asyncio, time
+
+import cv2
+import numpy as np
+import pytest
+
+# Backend modules import each other by bare name
+script_dir = Path(__file__).resolve().parent
+sys.path.append(str(script_dir.parent))
+
+import analysis_executor
+from analysis_executor import AnalysisExecutor, AnalysisQueueFull, AnalysisTimeout
+
+
+@pytest.fixture
+def image_path(tmp_path):
+    image = (np.random.default_rng(0).random((64, 64, 3)) * 255).astype(np.uint8)
+    path = str(tmp_path / 'image.png')
+    cv2.imwrite(path, image)
+    return path
+
+
+def test_process_pool_runs_analysis(image_path):
+    executor = AnalysisExecutor(mode='process', workers=1, cv_threads=1)
+    try:
+        result = asyncio.run(executor.run('image', image_path))
+    finally:
+        executor.shutdown()
+    assert result['metadata'] == {'type': 'image', 'width': 64, 'height': 64}
+    assert executor.pending == 0
+
+
+def test_queue_full_and_timeout(monkeypatch, image_path):
+    monkeypatch.setattr(analysis_executor, 'run_analysis', lambda *args: time.sleep(0.3))
+    executor = AnalysisExecutor(mode='thread', workers=1, max_queue=0, timeout=0.05)
+
+    async def scenario():
+        first = asyncio.create_task(executor.run('image', image_path))
+        await asyncio.sleep(0.01)
+        with pytest.raises(AnalysisQueueFull):
+            await executor.run('image', image_path)
+        with pytest.raises(AnalysisTimeout):
+            await first
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        executor.shutdown()
+
+
+def test_broken_pool_is_replaced_and_failed_submit_released(image_path):
+    executor = AnalysisExecutor(mode='thread', workers=1)
+    executor.start()
+    broken = executor._pool
+    calls = []
+
+    def submit(*args):
+        calls.append(executor._pool)
+        raise analysis_executor.BrokenProcessPool() if len(calls) == 1 else RuntimeError("no workers")
+
+    executor._submit = submit
+    try:
+        with pytest.raises(RuntimeError):
+            asyncio.run(executor.run('image', image_path))
+    finally:
+        executor.shutdown()
+    assert calls[0] is broken and calls[1] is not broken
+    assert broken._shutdown
+    assert executor.pending == 0
+
+
+def hang_or_echo(file_type, file_path, analyzer_options=None):
+    time.sleep(30 if file_path == 'stuck' else 0.3)
+    return {'path': file_path}
+
+
+def test_running_job_timeout_kills_its_worker(monkeypatch):
+    # Forked workers inherit the patched entry point
+    monkeypatch.setattr(analysis_executor, 'run_analysis', hang_or_echo)
+    executor = AnalysisExecutor(mode='process', workers=2, cv_threads=1, timeout=1)
+
+    async def scenario():
+        stuck = asyncio.create_task(executor.run('image', 'stuck'))
+        await asyncio.sleep(0.85)
+        # Still running on the other worker when the pool is killed, so it is resubmitted
+        other = asyncio.create_task(executor.run('image', 'fine'))
+        with pytest.raises(AnalysisTimeout):
+            await stuck
+        return await other
+
+    try:
+        assert asyncio.run(scenario()) == {'path': 'fine'}
+        assert executor.pending == 0
+    finally:
+        executor.shutdown()
@@ -0,0 +1,83 @@
+import sys
+from pathlib import Path
+import asyncio, json
+import cv2
+import numpy as np
+
+# Backend modules import each other by bare name
+script_dir = Path(__file__).resolve().parent
+sys.path.append(str(script_dir.parent))
+
+from analysis_executor import run_analysis
+from batch_scan import JsonlWriter, iter_media_paths, run_batch
+
+
+def make_images(folder, count):
+    rng = np.random.default_rng(0)
+    for i in range(count):
+        cv2.imwrite(str(folder / f"img{i}.png"), rng.integers(0, 255, (64, 64, 3), dtype=np.uint8))
+    (folder / "notes.txt").write_text("not media")
+
+
+async def analyze(file_type, path):
+    return await asyncio.to_thread(run_analysis, file_type, path)
+
+
+def test_writes_incrementally_and_resumes(tmp_path):
+    media = tmp_path / "media"
+    media.mkdir()
+    make_images(media, 3)
+    output = str(tmp_path / "results.jsonl")
+    paths = list(iter_media_paths(str(media)))
+    assert [Path(p).name for p in paths] == ["img0.png", "img1.png", "img2.png"]
+
+    # First run is interrupted after two files, the last line half written
+    writer = JsonlWriter(output)
+    asyncio.run(run_batch(paths[:2], analyze, writer))
+    writer.close()
+    with open(output, "a") as f:
+        f.write('{"path": "trunc')
+
+    writer = JsonlWriter(output)
+    skip = writer.done_paths()
+    reports = []
+    progress = asyncio.run(run_batch(paths, analyze, writer, skip=skip, report=lambda p: reports.append(p.ok), report_every=1))
+    writer.close()
+
+    records = [json.loads(line) for line in open(output)]
+    assert sorted(r["path"] for r in records) == paths
+    assert progress.ok == 1 and progress.skipped == 2 and progress.files_per_sec > 0
+    assert reports == [1]
+    assert all(r["status"] == "ok" and "raw_data" not in r["analysis_result"] for r in records)
+    assert "metric_explanations" not in records[0]
+
+
+def test_failures_are_recorded_not_raised(tmp_path):
+    missing = str(tmp_path / "gone.png")
+    writer = JsonlWriter(str(tmp_path / "results.jsonl"))
+    progress = asyncio.run(run_batch([missing], analyze, writer))
+    writer.close()
+
+    record = json.loads(open(tmp_path / "results.jsonl").read())
+    assert progress.errors == 1
+    assert record["path"] == missing and record["status"] == "error"
+
+
+def test_single_files_manifests_and_retrying_failures(tmp_path):
+    media = tmp_path / "media"
+    media.mkdir()
+    make_images(media, 2)
+    image = str(media / "img0.png")
+    assert list(iter_media_paths(image)) == [image]
+    manifest = tmp_path / "manifest.txt"
+    manifest.write_text("# listed\nimg1.png\n")
+    assert list(iter_media_paths(str(manifest), resolve=lambda p: str(media / p))) == [str(media / "img1.png")]
+
+    output = str(tmp_path / "results.jsonl")
+    writer = JsonlWriter(output)
+    asyncio.run(run_batch([image, str(tmp_path / "gone.png")], analyze, writer))
+    writer.close()
+    # The failed file is retried on resume; a fresh run replaces the output
+    assert JsonlWriter(output).done_paths() == {image}
+    JsonlWriter(output, append=False).close()
+    assert open(output).read() == ""
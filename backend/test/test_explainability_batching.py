@@ -0,0 +1,53 @@
+import sys
+from pathlib import Path
+import asyncio
+
+# Backend modules import each other by bare name
+script_dir = Path(__file__).resolve().parent
+sys.path.append(str(script_dir.parent))
+
+from explainability import ExplainabilityEngine, parse_batched_explanations
+
+IMAGE_RESULT = {
+    'metadata': {'type': 'image', 'width': 640, 'height': 480},
+    'metrics': {'avg_texture_variance': 420.0, 'texture_std': 0.0, 'edge_density': 0.2,
+                'color_variance': 5000.0, 'edge_continuity': 35.0},
+}
+
+
+def make_engine(batched_reply):
+    engine = ExplainabilityEngine()
+    calls = []
+
+    async def generate(prompt, json_mode=False):
+        calls.append(json_mode)
+        return batched_reply if json_mode else "single"
+
+    engine._generate_content = generate
+    return engine, calls
+
+
+def test_parse_tolerates_fences_and_drops_bad_entries():
+    reply = '```json\n{"edge_density": " dense ", "color_variance": 3, "extra": "x"}\n```'
+    assert parse_batched_explanations(reply, ['edge_density', 'color_variance']) == {'edge_density': 'dense'}
+    assert parse_batched_explanations("not json", ['edge_density']) == {}
+
+
+def test_batched_matches_fan_out_shape():
+    reply = '{' + ', '.join(f'"{name}": "batched"' for name in IMAGE_RESULT['metrics']) + '}'
+    engine, calls = make_engine(reply)
+    batched = asyncio.run(engine.analyze_all_metrics(IMAGE_RESULT, batched=True))
+    fan_out = asyncio.run(engine.analyze_all_metrics(IMAGE_RESULT, batched=False))
+
+    assert calls == [True] + [False] * 5
+    assert [r['analysis'] for r in batched] == ['batched'] * 5
+    for b, f in zip(batched, fan_out):
+        assert {**b, 'analysis': None} == {**f, 'analysis': None}
+    assert batched[2]['status'] == 'suspicious_high'
+
+
+def test_unparseable_reply_falls_back_per_metric():
+    engine, calls = make_engine("Sorry, here are my thoughts...")
+    results = asyncio.run(engine.analyze_all_metrics(IMAGE_RESULT, batched=True))
+    assert calls == [True] + [False] * 5
+    assert [r['analysis'] for r in results] == ['single'] * 5
@@ -4,10 +4,11 @@ import time, asyncio
 
 script_dir = Path(__file__).resolve().parent
 project_root = script_dir.parent.parent
-sys.path.append(str(project_root))
+# Backend modules import each other by bare name
+sys.path.append(str(script_dir.parent))
 
-from backend.attrClassifier import MediaAnalyzer
-from backend.explainability import ExplainabilityEngine
+from attrClassifier import MediaAnalyzer
+from explainability import ExplainabilityEngine
 
 async def test_image():
     start_time = time.time()    
@@ -0,0 +1,73 @@
+import sys
+from pathlib import Path
+import asyncio
+
+# Backend modules import each other by bare name
+script_dir = Path(__file__).resolve().parent
+sys.path.append(str(script_dir.parent))
+
+from explainability import ExplainabilityEngine, IMAGE_METRIC_CONFIGS, metric_status
+from explanation_cache import ExplanationCache, quantize_value
+
+
+def test_quantized_value_keeps_status():
+    config = IMAGE_METRIC_CONFIGS['edge_density']  # 0.03-0.10
+    for value in (0.0, 0.0299, 0.03, 0.05, 0.0999, 0.10, 0.1001, 0.5):
+        status = metric_status(config, value)
+        assert metric_status(config, quantize_value(config, value, status, 4)) == status
+    assert quantize_value(config, 0.050, 'normal', 4) == quantize_value(config, 0.055, 'normal', 4)
+    assert quantize_value(config, 0.05, 'normal', 0) == 0.05
+
+
+def test_concurrent_identical_prompts_share_one_generation(tmp_path):
+    cache = ExplanationCache(db_path=str(tmp_path / "explanations.db"))
+    calls = []
+
+    async def generate():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "explained"
+
+    async def scenario():
+        return await asyncio.gather(*[
+            cache.get_or_generate("m", "same  prompt", generate),
+            cache.get_or_generate("m", "same prompt\n", generate),
+            cache.get_or_generate("m", "same prompt", generate),
+        ])
+
+    assert asyncio.run(scenario()) == ["explained"] * 3
+    assert len(calls) == 1 and cache.stats()["coalesced"] == 2
+    assert ExplanationCache(db_path=str(tmp_path / "explanations.db")).get("m", "same prompt") == "explained"
+    assert cache.get("other-model", "same prompt") is None
+
+
+def test_empty_explanations_are_not_cached():
+    cache = ExplanationCache(db_path=None)
+
+    async def generate():
+        return ""
+
+    assert asyncio.run(cache.get_or_generate("m", "prompt", generate)) == ""
+    cache.set("m", "streamed", "  \n")
+    assert cache.get("m", "prompt") is None and cache.get("m", "streamed") is None
+
+
+def test_engine_reuses_cached_metric_explanations():
+    engine = ExplainabilityEngine(cache=ExplanationCache(db_path=None), value_bands=8)
+    calls = []
+
+    async def generate(prompt, json_mode=False):
+        calls.append(json_mode)
+        if json_mode:
+            return '{"edge_density": "batched", "color_variance": "batched"}'
+        return "single"
+
+    engine._generate_content = generate
+    first = {'metadata': {'type': 'image'}, 'metrics': {'edge_density': 0.051, 'color_variance': 5000.0}}
+    nearby = {'metadata': {'type': 'image'}, 'metrics': {'edge_density': 0.052, 'color_variance': 5010.0}}
+
+    asyncio.run(engine.analyze_all_metrics(first, batched=True))
+    results = asyncio.run(engine.analyze_all_metrics(nearby, batched=False))
+    assert calls == [True]
+    assert [r['analysis'] for r in results] == ['batched', 'batched']
+    assert results[0]['actual_value'] == 0.052
@@ -0,0 +1,68 @@
+import sys
+from pathlib import Path
+import asyncio
+import pytest
+
+# Backend modules import each other by bare name
+script_dir = Path(__file__).resolve().parent
+sys.path.append(str(script_dir.parent))
+
+from job_queue import JobQueue, JobQueueFull
+
+
+def test_round_robin_across_clients_and_stage_limit():
+    async def scenario():
+        order, inside, peak = [], 0, 0
+
+        async def runner(job):
+            nonlocal inside, peak
+            order.append(job.params["name"])
+            async with queue.stage(job, "cv"):
+                inside += 1
+                peak = max(peak, inside)
+                await asyncio.sleep(0.01)
+                inside -= 1
+            job.complete({"name": job.params["name"]})
+
+        queue = JobQueue(runner, workers=3, max_queued=10, stage_limits={"cv": 1})
+        queue.start()
+        jobs = [queue.create("busy", {"name": f"busy{i}"}) for i in range(4)]
+        jobs.append(queue.create("other", {"name": "other"}))
+        for job in jobs:
+            queue.submit(job)
+        while not all(job.finished for job in jobs):
+            await asyncio.sleep(0.01)
+        await queue.shutdown()
+        return order, peak, jobs
+
+    order, peak, jobs = asyncio.run(scenario())
+    assert order.index("other") == 1
+    assert peak == 1
+    assert jobs[0].snapshot()["stages"]["cv"]["status"] == "done"
+    assert [e["event"] for e in jobs[0].events][:2] == ["queued", "running"]
+    assert jobs[0].events[-1] == {**jobs[0].events[-1], "event": "done", "result": {"name": "busy0"}}
+
+
+def test_failed_runner_and_full_queue():
+    async def scenario():
+        async def runner(job):
+            async with queue.stage(job, "verdict"):
+                raise RuntimeError("verdict service down")
+
+        queue = JobQueue(runner, workers=1, max_queued=1)
+        queue.start()
+        job = queue.create("c")
+        subscriber = job.subscribe()
+        queue.submit(job)
+        with pytest.raises(JobQueueFull):
+            queue.submit(queue.create("c"))
+        events = []
+        while not events or events[-1]["event"] != "failed":
+            events.append(await subscriber.get())
+        await queue.shutdown()
+        return job, events
+
+    job, events = asyncio.run(scenario())
+    assert job.status == "failed" and job.error == "verdict service down"
+    assert job.stages["verdict"]["status"] == "failed"
+    assert [e["event"] for e in events] == ["queued", "running", "stage_started", "stage_finished", "failed"]
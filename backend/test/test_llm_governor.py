@@ -0,0 +1,65 @@
+import sys
+from pathlib import Path
+import asyncio
+
+# Backend modules import each other by bare name
+script_dir = Path(__file__).resolve().parent
+sys.path.append(str(script_dir.parent))
+
+from llm_governor import LLMGovernor, PRIORITY_OVERVIEW, PRIORITY_METRIC
+
+
+def test_caps_concurrency_and_serves_overview_first():
+    async def scenario():
+        governor = LLMGovernor(max_concurrency=2)
+        running, peak, order = 0, 0, []
+
+        async def call(name, priority):
+            nonlocal running, peak
+            async with governor.slot(priority):
+                running += 1
+                peak = max(peak, running)
+                order.append(name)
+                await asyncio.sleep(0.01)
+                running -= 1
+
+        # Fill both slots, then queue metrics ahead of an overview
+        tasks = [asyncio.create_task(call(f"m{i}", PRIORITY_METRIC)) for i in range(4)]
+        await asyncio.sleep(0)
+        tasks.append(asyncio.create_task(call("overview", PRIORITY_OVERVIEW)))
+        await asyncio.gather(*tasks)
+        return governor, peak, order
+
+    governor, peak, order = asyncio.run(scenario())
+    assert peak == 2
+    assert order[:3] == ["m0", "m1", "overview"]
+    stats = governor.stats()
+    assert stats["active"] == 0 and stats["waiting"] == 0
+    assert stats["generation"]["metric"]["count"] == 4
+    assert stats["queue_wait"]["overview"]["count"] == 1
+
+
+def test_cancelled_waiter_does_not_leak_a_slot():
+    async def scenario():
+        governor = LLMGovernor(max_concurrency=1)
+        release = asyncio.Event()
+
+        async def hold():
+            async with governor.slot():
+                await release.wait()
+
+        holder = asyncio.create_task(hold())
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(hold())
+        await asyncio.sleep(0)
+        waiter.cancel()
+        release.set()
+        await holder
+        await asyncio.gather(waiter, return_exceptions=True)
+
+        async with governor.slot(PRIORITY_OVERVIEW):
+            pass
+        return governor
+
+    governor = asyncio.run(scenario())
+    assert governor.active == 0
@@ -0,0 +1,90 @@
+import sys
+from pathlib import Path
+import asyncio
+import httpx
+from openai import AsyncOpenAI
+
+# Backend modules import each other by bare name
+script_dir = Path(__file__).resolve().parent
+sys.path.append(str(script_dir.parent))
+
+from explainability import ExplainabilityEngine
+from llm_stub import create_app
+
+IMAGE_RESULT = {
+    'metadata': {'type': 'image', 'width': 640, 'height': 480},
+    'metrics': {'avg_texture_variance': 420.0, 'texture_std': 0.0, 'edge_density': 0.2,
+                'color_variance': 5000.0, 'edge_continuity': 35.0},
+}
+
+
+def make_engine(stub):
+    engine = ExplainabilityEngine()
+    engine.client = AsyncOpenAI(base_url="http://stub/v1", api_key="test",
+                                http_client=httpx.AsyncClient(transport=httpx.ASGITransport(app=stub)))
+    return engine
+
+
+def test_engine_runs_against_stub():
+    async def scenario():
+        engine = make_engine(create_app(ttft=0, token_seconds=0, tokens=8))
+        try:
+            metrics = await engine.analyze_all_metrics(IMAGE_RESULT, batched=True)
+            streamed = [delta async for delta in engine._stream_content("Explain.")]
+            return metrics, streamed, engine.usage
+        finally:
+            await engine.aclose()
+
+    metrics, streamed, usage = asyncio.run(scenario())
+    # One JSON completion covered every metric, so there were no per-metric fallbacks;
+    # the streamed completion reports its tokens in a final usage chunk
+    assert usage['calls'] == 2
+    assert usage['completion_tokens'] == 8 * len(metrics) + 8
+    assert all(not m['analysis'].startswith('Error') for m in metrics)
+    assert len("".join(streamed).split()) == 8
+
+
+def test_stream_without_usage_counts_chunks(monkeypatch):
+    async def scenario():
+        engine = make_engine(create_app(ttft=0, token_seconds=0, tokens=8))
+        create = engine._create
+
+        async def without_usage(task, prompt, **kwargs):
+            kwargs.pop('stream_options')
+            return await create(task, prompt, **kwargs)
+
+        monkeypatch.setattr(engine, '_create', without_usage)
+        try:
+            streamed = [delta async for delta in engine._stream_content("Explain.")]
+            return streamed, engine.usage
+        finally:
+            await engine.aclose()
+
+    streamed, usage = asyncio.run(scenario())
+    assert usage['completion_tokens'] == len(streamed) > 0 and usage['prompt_tokens'] == 0
+
+
+def test_routes_by_task_caps_tokens_and_falls_back():
+    async def scenario():
+        stub = create_app(ttft=0, token_seconds=0, tokens=200, models="big", load_seconds=0.05)
+        engine = make_engine(stub)
+        engine.models = {'overview': 'big', 'metric': 'small'}
+        engine.max_tokens = {'overview': 50, 'metric': 20, 'metric_batch': 0}
+        engine._native = httpx.AsyncClient(base_url="http://stub", transport=httpx.ASGITransport(app=stub))
+        try:
+            warmed = {model: await engine.warm_up(model) for model in ('big', 'small')}
+            loads = stub.state.loads
+            overview = await engine.explain_overall_analysis(IMAGE_RESULT, {'ai_detected': True, 'ai_confidence': 0.9})
+            metric = await engine.explain_individual_metric(IMAGE_RESULT, 'edge_density')
+            return warmed, loads, stub.state.loads, overview, metric, engine.unavailable_models()
+        finally:
+            await engine.aclose()
+
+    warmed, loads_after_warmup, loads, overview, metric, unavailable = asyncio.run(scenario())
+    assert warmed == {'big': True, 'small': False}
+    # The warm-up loaded the model; the requests found it loaded
+    assert loads_after_warmup == loads == 1
+    assert len(overview.split()) == 50
+    # 'small' is missing, so the metric went to 'big' with the metric cap
+    assert len(metric['analysis'].split()) == 20
+    assert unavailable == ['small']
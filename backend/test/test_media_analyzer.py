@@ -0,0 +1,251 @@
+import sys
+from pathlib import Path
+
+import cv2
+import numpy as np
+import pytest
+
+# Backend modules import each other by bare name
+script_dir = Path(__file__).resolve().parent
+sys.path.append(str(script_dir.parent))
+
+from attrClassifier import MediaAnalyzer, RunningStats
+
+
+def write_clip(path, frame_count=60, size=(160, 120)):
+    rng = np.random.default_rng(1)
+    writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*'mp4v'), 30, size)
+    background = (rng.random((size[1], size[0], 3)) * 80).astype(np.uint8)
+    for i in range(frame_count):
+        frame = background.copy()
+        cv2.circle(frame, (i * 3 % size[0], size[1] // 2), 15, (255, 255, 255), -1)
+        writer.write(frame)
+    writer.release()
+    return str(path)
+
+
+def reference_video_metrics(path):
+    """The original seek-per-sample, Canny-per-pair implementation."""
+    cap = cv2.VideoCapture(path)
+    frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    frames = []
+    for i in range(0, frame_count, max(frame_count // 10, 1)):
+        cap.set(cv2.CAP_PROP_POS_FRAMES, i)
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.append(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY))
+    cap.release()
+
+    motion, edges = [], []
+    for i in range(1, len(frames)):
+        motion.append(float(np.mean(cv2.absdiff(frames[i], frames[i-1]))))
+        e1 = cv2.Canny(frames[i-1], 100, 200)
+        e2 = cv2.Canny(frames[i], 100, 200)
+        edges.append(float(np.mean(cv2.absdiff(e1, e2))))
+    texture = [float(np.var(cv2.Laplacian(f, cv2.CV_64F))) for f in frames]
+    return {'motion_scores': motion, 'edge_consistency': edges, 'texture_variances': texture}
+
+
+@pytest.fixture(scope='module')
+def clip(tmp_path_factory):
+    return write_clip(tmp_path_factory.mktemp('media') / 'clip.mp4')
+
+
+@pytest.mark.parametrize('strategy', ['seek', 'sequential', 'auto'])
+@pytest.mark.parametrize('prefetch_depth', [0, 2])
+def test_video_matches_reference(clip, strategy, prefetch_depth):
+    result = MediaAnalyzer(decode_strategy=strategy, prefetch_depth=prefetch_depth).analyze_video(clip)
+    reference = reference_video_metrics(clip)
+    assert result['raw_data'] == reference
+
+    metrics = result['metrics']
+    assert metrics['avg_motion'] == pytest.approx(np.mean(reference['motion_scores']))
+    assert metrics['motion_std'] == pytest.approx(np.std(reference['motion_scores']))
+    assert metrics['edge_std'] == pytest.approx(np.std(reference['edge_consistency']))
+    assert metrics['texture_std'] == pytest.approx(np.std(reference['texture_variances']))
+
+
+def test_num_samples(clip):
+    result = MediaAnalyzer(num_samples=30).analyze_video(clip)
+    assert len(result['raw_data']['texture_variances']) == 30
+    assert len(result['raw_data']['motion_scores']) == 29
+    assert result['metadata']['sample_indices'] == list(range(0, 60, 2))
+
+
+@pytest.mark.parametrize('strategy', ['seek', 'sequential', 'auto'])
+def test_segments_match_serial(clip, strategy):
+    serial = MediaAnalyzer(decode_strategy=strategy, num_samples=30).analyze_video(clip)
+    sharded = MediaAnalyzer(decode_strategy=strategy, num_samples=30, segments=3).analyze_video(clip)
+    assert sharded['metadata']['segments'] == 3
+    assert sharded['metrics'] == serial['metrics']
+    assert sharded['raw_data'] == serial['raw_data']
+
+
+def test_plan_segments():
+    analyzer = MediaAnalyzer(segments=4)
+    assert analyzer.plan_segments(range(0, 100, 10)) == [range(0, 50, 10), range(50, 100, 10)]
+    assert analyzer.plan_segments(range(0, 30, 10)) == [range(0, 30, 10)]
+
+
+def test_running_stats():
+    values = np.random.default_rng(3).normal(50, 10, 500)
+    stats = RunningStats()
+    for v in values:
+        stats.push(v)
+    assert stats.count == 500
+    assert stats.mean == pytest.approx(np.mean(values))
+    assert stats.std == pytest.approx(np.std(values))
+
+
+def test_image_metrics(tmp_path):
+    rng = np.random.default_rng(2)
+    image = (rng.random((90, 120, 3)) * 255).astype(np.uint8)
+    path = str(tmp_path / 'image.png')
+    cv2.imwrite(path, image)
+
+    result = MediaAnalyzer().analyze_image(path)
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    edges = cv2.Canny(gray, 100, 200)
+
+    assert result['metrics']['edge_density'] == float(np.sum(edges > 0) / edges.size)
+    assert result['raw_data']['texture_variances'] == [float(np.var(cv2.Laplacian(gray, cv2.CV_64F)))]
+
+
+def test_unknown_decode_strategy():
+    with pytest.raises(ValueError):
+        MediaAnalyzer(decode_strategy='random')
+
+
+def test_image_batch_matches_single(tmp_path):
+    rng = np.random.default_rng(3)
+    paths = []
+    for i, size in enumerate([(90, 120), (90, 120), (60, 80)]):
+        path = str(tmp_path / f'image{i}.png')
+        cv2.imwrite(path, (rng.random((*size, 3)) * 255).astype(np.uint8))
+        paths.append(path)
+    paths.insert(1, str(tmp_path / 'missing.png'))
+
+    analyzer = MediaAnalyzer()
+    batch = list(analyzer.analyze_images(paths))
+    assert [p for p, _, _ in batch] == paths
+    assert batch[1][1] is None and 'Could not read' in batch[1][2]
+    for path, result, error in batch[:1] + batch[2:]:
+        assert error is None
+        assert result == MediaAnalyzer().analyze_image(path)
+
+    # Continuity is measured on the same grayscale edge map as edge density
+    image = cv2.imread(paths[0])
+    edges = cv2.Canny(cv2.cvtColor(image, cv2.COLOR_BGR2GRAY), 100, 200)
+    contours, _ = cv2.findContours(edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    assert batch[0][1]['metrics']['edge_continuity'] == pytest.approx(np.mean([len(c) for c in contours]))
+    assert batch[0][1]['metrics']['color_variance'] == pytest.approx(np.mean([np.var(image[:, :, i]) for i in range(3)]))
+
+
+def test_running_stats_merge():
+    values = np.random.default_rng(4).normal(10, 3, 300)
+    merged = RunningStats()
+    for chunk in np.array_split(values, 7):
+        part = RunningStats.from_moments(len(chunk), np.mean(chunk), np.var(chunk))
+        merged.merge(part)
+    assert merged.count == 300
+    assert merged.mean == pytest.approx(np.mean(values))
+    assert merged.std == pytest.approx(np.std(values))
+
+
+def test_tiled_image_matches_full():
+    rng = np.random.default_rng(5)
+    image = cv2.GaussianBlur(rng.integers(0, 255, (700, 900, 3), dtype=np.uint8), (5, 5), 0)
+    # A long line and a large ring crossing many tile seams
+    cv2.line(image, (0, 350), (899, 360), (255, 255, 255), 2)
+    cv2.circle(image, (450, 350), 300, (0, 0, 0), 3)
+
+    full = MediaAnalyzer().analyze_image_array(image)
+    tiled = MediaAnalyzer(image_mode='tiled', tile_memory_mb=1).analyze_image_array(image)
+    assert tiled['metadata']['tiles'] > 4
+    assert tiled['metrics']['avg_texture_variance'] == pytest.approx(full['metrics']['avg_texture_variance'], rel=1e-9)
+    assert tiled['metrics']['color_variance'] == pytest.approx(full['metrics']['color_variance'], rel=1e-9)
+    assert tiled['metrics']['edge_density'] == pytest.approx(full['metrics']['edge_density'], rel=1e-3)
+    assert tiled['metrics']['edge_continuity'] == pytest.approx(full['metrics']['edge_continuity'], rel=0.05)
+
+    # 'auto' only tiles above the size threshold
+    assert 'tiles' not in MediaAnalyzer(image_mode='auto').analyze_image_array(image)['metadata']
+    assert 'tiles' in MediaAnalyzer(image_mode='auto', tiled_above_pixels=1000).analyze_image_array(image)['metadata']
+
+
+def test_reduced_decode(tmp_path):
+    path = str(tmp_path / 'image.png')
+    cv2.imwrite(path, np.zeros((200, 320, 3), dtype=np.uint8))
+    result = MediaAnalyzer(image_mode='reduced', image_reduce=4).analyze_image(path)
+    assert result['metadata'] == {'type': 'image', 'width': 80, 'height': 50, 'image_mode': 'reduced', 'downscale': 4}
+    with pytest.raises(ValueError):
+        MediaAnalyzer(image_mode='reduced', image_reduce=3)
+
+
+def write_two_scene_clip(path, frame_count=120, size=(160, 120)):
+    """Like write_clip, but the background changes halfway (a scene cut)."""
+    rng = np.random.default_rng(6)
+    writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*'mp4v'), 30, size)
+    backgrounds = [(rng.random((size[1], size[0], 3)) * 80).astype(np.uint8),
+                   (rng.random((size[1], size[0], 3)) * 80 + 150).astype(np.uint8)]
+    for i in range(frame_count):
+        frame = backgrounds[i * 2 // frame_count].copy()
+        cv2.circle(frame, (i * 3 % size[0], size[1] // 2), 15, (255, 255, 255), -1)
+        writer.write(frame)
+    writer.release()
+    return str(path)
+
+
+def test_adaptive_sampling_skips_scene_cut(tmp_path):
+    path = write_two_scene_clip(tmp_path / 'scenes.mp4')
+    uniform = MediaAnalyzer().analyze_video(path)
+    result = MediaAnalyzer(sampling='adaptive').analyze_video(path)
+    metadata = result['metadata']
+
+    assert metadata['sampling'] == 'adaptive'
+    assert metadata['scene_cuts'] and abs(metadata['scene_cuts'][0] - 60) <= 15
+    indices = metadata['sample_indices']
+    assert indices == sorted(set(indices)) and len(indices) == len(result['raw_data']['texture_variances'])
+    assert metadata['sampling_passes'] >= 2
+    # The uniform sampler scores the cut as motion; the adaptive one never pairs across it
+    assert max(uniform['raw_data']['motion_scores']) > 2 * max(result['raw_data']['motion_scores'])
+
+
+def test_adaptive_sampling_budgets(clip):
+    # A zero tolerance never converges, so the frame budget stops sampling
+    result = MediaAnalyzer(sampling='adaptive', num_samples=8, max_frames=20, convergence_tolerance=0).analyze_video(clip)
+    assert result['metadata']['stop_reason'] == 'max_frames'
+    assert len(result['metadata']['sample_indices']) == 20
+
+    result = MediaAnalyzer(sampling='adaptive', max_seconds=1e-9).analyze_video(clip)
+    assert result['metadata']['stop_reason'] == 'max_seconds'
+    assert len(result['metadata']['sample_indices']) == 1
+
+
+def test_adaptive_sampling_converges_on_static_video(tmp_path):
+    writer = cv2.VideoWriter(str(tmp_path / 'static.mp4'), cv2.VideoWriter_fourcc(*'mp4v'), 30, (160, 120))
+    frame = (np.random.default_rng(7).random((120, 160, 3)) * 255).astype(np.uint8)
+    for _ in range(90):
+        writer.write(frame)
+    writer.release()
+
+    result = MediaAnalyzer(sampling='adaptive').analyze_video(str(tmp_path / 'static.mp4'))
+    assert result['metadata']['stop_reason'] == 'converged'
+    assert len(result['metadata']['sample_indices']) < 90
+    assert result['metadata']['scene_cuts'] == []
+
+
+def test_adaptive_indices_follow_activity():
+    positions = np.arange(0, 100, 10)
+    activity = np.array([2, 2, 2, 2, 2, 12, 12, 12, 12], dtype=float)
+    cuts = MediaAnalyzer.find_scene_cuts(activity)
+    assert not cuts.any()
+    indices = MediaAnalyzer.adaptive_indices(positions, activity, cuts, 100, 20)
+    assert sum(i >= 50 for i in indices) > 1.5 * sum(i < 50 for i in indices)
+    # A lone spike is a cut, and isn't sampled more densely than its surroundings
+    spiky = np.array([2, 2, 2, 60, 2, 2, 2, 2, 2], dtype=float)
+    cuts = MediaAnalyzer.find_scene_cuts(spiky)
+    assert cuts.tolist() == [False, False, False, True, False, False, False, False, False]
+    assert MediaAnalyzer.adaptive_indices(positions, spiky, cuts, 100, 10) == list(range(5, 100, 10))
+    with pytest.raises(ValueError):
+        MediaAnalyzer(sampling='random')
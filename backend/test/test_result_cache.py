@@ -0,0 +1,41 @@
+import sys
+from pathlib import Path
+import time
+
+# Backend modules import each other by bare name
+script_dir = Path(__file__).resolve().parent
+sys.path.append(str(script_dir.parent))
+
+from result_cache import ResultCache, SQLiteCacheTier, cache_version
+
+
+def test_memory_tier_respects_byte_budget():
+    cache = ResultCache(version="v1", max_bytes=200, db_path=None)
+    for i in range(5):
+        cache.set(f"hash{i}", {"payload": "x" * 50})
+    assert cache.memory.currsize <= 200
+    assert cache.get("hash0") is None
+    assert cache.get("hash4") == {"payload": "x" * 50}
+    assert cache.stats()["hits"] == 1
+
+
+def test_version_isolates_entries():
+    a = ResultCache(version=cache_version({"num_samples": 10}, "llama3.1:8b"), db_path=None)
+    b = ResultCache(version=cache_version({"num_samples": 20}, "llama3.1:8b"), db_path=None)
+    assert a.key("abc") != b.key("abc")
+
+
+def test_disk_tier_promotes_and_expires(tmp_path):
+    db = str(tmp_path / "cache.db")
+    writer = ResultCache(version="v1", db_path=db)
+    writer.set("abc", {"brief_overview": "ok"})
+    writer.update("abc", metric_explanations=[{"metric_name": "edge_density"}])
+
+    reader = ResultCache(version="v1", db_path=db)
+    assert reader.get("abc") == {"brief_overview": "ok", "metric_explanations": [{"metric_name": "edge_density"}]}
+    assert reader.stats()["entries"] == 1
+
+    tier = SQLiteCacheTier(str(tmp_path / "ttl.db"), ttl=0.01)
+    tier.set("k", b"v")
+    time.sleep(0.02)
+    assert tier.get("k") is None
@@ -0,0 +1,62 @@
+import sys
+from pathlib import Path
+import asyncio, os, tempfile
+
+# Backend modules import each other by bare name
+script_dir = Path(__file__).resolve().parent
+sys.path.append(str(script_dir.parent))
+os.environ.setdefault("UPLOAD_FOLDER", tempfile.mkdtemp())
+
+import save_file
+from session_store import AnalysisSession
+
+ANALYSIS_RESULT = {
+    'metadata': {'type': 'image', 'width': 64, 'height': 64},
+    'metrics': {'edge_density': 0.2},
+}
+
+
+class FailingExplainer:
+    streamed_metrics = 0
+
+    async def stream_overall_analysis(self, analysis_result, ai_scan_result):
+        yield "The image shows"
+        raise RuntimeError("connection reset")
+
+    async def stream_all_metrics(self, analysis_result):
+        self.streamed_metrics += 1
+        yield 'metric_done', {'metric_name': 'edge_density', 'analysis': 'Streamed.'}
+
+
+def collect(events):
+    async def run():
+        return [event async for event in events]
+    return asyncio.run(run())
+
+
+def test_failed_overview_stream_is_not_cached(monkeypatch):
+    monkeypatch.setattr(save_file, 'explainer', FailingExplainer())
+    session = AnalysisSession('a1', ANALYSIS_RESULT, {}, 'hash-partial')
+    events = collect(save_file.stream_upload_events(session, {}, None))
+
+    assert any('Error generating explanation: connection reset' in event for event in events)
+    assert save_file.result_cache.get('hash-partial') is None
+
+
+def test_metrics_stream_reuses_speculative_task(monkeypatch):
+    explainer = FailingExplainer()
+    monkeypatch.setattr(save_file, 'explainer', explainer)
+
+    async def scenario():
+        session = AnalysisSession('a2', ANALYSIS_RESULT, {}, None)
+
+        async def speculative():
+            await asyncio.sleep(0.01)
+            return [{'metric_name': 'edge_density', 'analysis': 'Speculative.'}]
+
+        session.metrics_task = asyncio.create_task(speculative())
+        return [event async for event in save_file.stream_session_metrics(session)]
+
+    events = asyncio.run(scenario())
+    assert explainer.streamed_metrics == 0
+    assert len(events) == 1 and 'Speculative.' in events[0]
@@ -0,0 +1,56 @@
+import sys
+from pathlib import Path
+import json
+
+import numpy as np
+import pytest
+
+# Backend modules import each other by bare name
+script_dir = Path(__file__).resolve().parent
+sys.path.append(str(script_dir.parent))
+
+from serialization import encode_response, negotiate, shape_raw_data, unpack_floats
+
+PAYLOAD = {
+    'analysis_id': 'a1',
+    'analysis_result': {
+        'metadata': {'type': 'video'},
+        'metrics': {'avg_motion': np.float64(12.5)},
+        'raw_data': {'motion_scores': [1.0, 2.5, 3.0, 4.0], 'texture_variances': [10.0, 20.0, 30.0, 40.0, 50.0]},
+    },
+}
+
+
+def test_negotiate():
+    assert negotiate(None) == 'json'
+    assert negotiate('text/html, */*') == 'json'
+    assert negotiate('application/vnd.trueview.f32+json') == 'f32'
+    assert negotiate('application/json;q=0.5, application/vnd.trueview.f32+json') == 'f32'
+    assert negotiate('application/vnd.trueview.f32+json;q=0.1, application/json') == 'json'
+
+
+def test_shape_raw_data_omits_and_pages_without_mutating():
+    omitted = shape_raw_data(PAYLOAD, 'omit')
+    assert 'raw_data' not in omitted['analysis_result']
+    assert omitted['analysis_result']['metrics'] is PAYLOAD['analysis_result']['metrics']
+
+    page = shape_raw_data(PAYLOAD, offset=1, limit=2)['analysis_result']['raw_data']
+    assert page == {'motion_scores': [2.5, 3.0], 'texture_variances': [20.0, 30.0],
+                    'page': {'offset': 1, 'limit': 2, 'total': 5}}
+    assert len(PAYLOAD['analysis_result']['raw_data']['motion_scores']) == 4
+
+    with pytest.raises(ValueError):
+        shape_raw_data(PAYLOAD, 'some')
+
+
+def test_json_and_float32_encodings():
+    plain = json.loads(encode_response(PAYLOAD).body)
+    assert plain['analysis_result']['metrics']['avg_motion'] == 12.5
+    assert plain['analysis_result']['raw_data']['motion_scores'] == [1.0, 2.5, 3.0, 4.0]
+
+    response = encode_response(PAYLOAD, 'f32')
+    assert response.media_type == 'application/vnd.trueview.f32+json'
+    packed = json.loads(response.body)['analysis_result']['raw_data']['motion_scores']
+    assert packed['length'] == 4
+    np.testing.assert_array_equal(unpack_floats(packed), [1.0, 2.5, 3.0, 4.0])
+
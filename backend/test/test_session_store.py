@@ -0,0 +1,55 @@
+import sys
+from pathlib import Path
+import asyncio, time
+
+# Backend modules import each other by bare name
+script_dir = Path(__file__).resolve().parent
+sys.path.append(str(script_dir.parent))
+
+from session_store import SessionStore
+
+
+def test_lru_eviction_cancels_pending_work():
+    async def scenario():
+        store = SessionStore(max_sessions=2, ttl=60)
+        first = store.create({"metrics": {}}, {})
+        task = store.start_metrics(first, lambda s: asyncio.sleep(10))
+        store.create({"metrics": {}}, {})
+        store.create({"metrics": {}}, {})
+        await asyncio.sleep(0)
+        assert store.get(first.analysis_id) is None
+        assert task.cancelled()
+        assert len(store) == 2
+
+    asyncio.run(scenario())
+
+
+def test_metrics_task_is_shared_and_sessions_expire():
+    async def scenario():
+        store = SessionStore(max_sessions=10, ttl=0.05)
+        session = store.create({"metrics": {}}, {})
+        calls = []
+
+        async def explain(s):
+            calls.append(s.analysis_id)
+            return ["done"]
+
+        speculative = store.start_metrics(session, explain)
+        assert store.start_metrics(session, explain) is speculative
+        assert await speculative == ["done"]
+        assert calls == [session.analysis_id]
+
+        time.sleep(0.06)
+        assert store.get(session.analysis_id) is None
+
+    asyncio.run(scenario())
+
+
+def test_close_callbacks_run_once_on_expiry():
+    closed = []
+    store = SessionStore(max_sessions=1, ttl=60)
+    first = store.create({"metrics": {}}, {})
+    first.on_close.append(lambda: closed.append(first.analysis_id))
+    store.create({"metrics": {}}, {})
+    first.close()
+    assert closed == [first.analysis_id]
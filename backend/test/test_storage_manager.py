@@ -0,0 +1,118 @@
+import sys
+from pathlib import Path
+import asyncio, hashlib, os, threading, time
+import cv2
+import numpy as np
+
+# Backend modules import each other by bare name
+script_dir = Path(__file__).resolve().parent
+sys.path.append(str(script_dir.parent))
+
+from storage_manager import StorageManager
+
+
+def store_file(root, data, ext=".png"):
+    path = os.path.join(root, hashlib.sha256(data).hexdigest() + ext)
+    with open(path, "wb") as f:
+        f.write(data)
+    return path
+
+
+def test_lru_quota_skips_pinned_files(tmp_path):
+    storage = StorageManager(str(tmp_path), quota_bytes=3000, ttl=0)
+    paths = [store_file(tmp_path, bytes([i]) * 1000) for i in range(3)]
+    for path in paths:
+        storage.add(path)
+    storage.touch(paths[0])
+    storage.acquire(paths[1])
+
+    # Least recently used first (paths[2], then paths[0]), skipping the pinned paths[1]
+    newest = store_file(tmp_path, b"\xff" * 1500)
+    storage.acquire(newest)
+    storage.add(newest)
+    assert [os.path.exists(p) for p in paths] == [False, True, False]
+    assert storage.stats()["bytes"] == 2500 and storage.stats()["evictions"] == 2
+
+    assert not storage.make_room(1500)
+    storage.release(paths[1])
+    assert storage.make_room(1500) and not os.path.exists(paths[1]) and os.path.exists(newest)
+
+
+def test_ttl_and_restart_scan(tmp_path):
+    old = store_file(tmp_path, b"a" * 100)
+    os.utime(old, (time.time() - 7200, time.time() - 7200))
+    fresh = store_file(tmp_path, b"b" * 100)
+    (tmp_path / "notes.txt").write_text("not a stored upload")
+
+    storage = StorageManager(str(tmp_path), quota_bytes=0, ttl=3600)
+    assert storage.stats()["files"] == 2
+    hooks = []
+    storage.maintenance.append(lambda: hooks.append(1))
+    orphan = tmp_path / ".previews" / ("0" * 64 + ".thumb.jpg")
+    orphan.write_bytes(b"x")
+    storage.compact()
+    assert not os.path.exists(old) and os.path.exists(fresh)
+    assert not orphan.exists() and (tmp_path / "notes.txt").exists() and hooks == [1]
+
+
+def test_previews_count_toward_usage(tmp_path):
+    ok, image = cv2.imencode(".png", np.random.default_rng(0).integers(0, 255, (600, 800, 3), dtype=np.uint8))
+    image_path = store_file(tmp_path, image.tobytes())
+    video_src = str(tmp_path / "clip.mp4")
+    writer = cv2.VideoWriter(video_src, cv2.VideoWriter_fourcc(*"mp4v"), 30, (640, 480))
+    for i in range(30):
+        writer.write(np.full((480, 640, 3), i * 8, dtype=np.uint8))
+    writer.release()
+    video_path = store_file(tmp_path, open(video_src, "rb").read(), ".mp4")
+    os.remove(video_src)
+
+    async def scenario():
+        storage = StorageManager(str(tmp_path), quota_bytes=0, ttl=0, previews=True)
+        for path, file_type in ((image_path, "image"), (video_path, "video")):
+            storage.add(path)
+            await storage.schedule_previews(path, file_type)
+        return storage
+
+    storage = asyncio.run(scenario())
+    assert set(storage.previews(image_path)) == {"thumbnail"}
+    assert set(storage.previews(video_path)) == {"thumbnail", "proxy"}
+    thumbnail = cv2.imread(str(tmp_path / storage.previews(image_path)["thumbnail"]))
+    assert max(thumbnail.shape[:2]) == 320
+    proxy = cv2.VideoCapture(str(tmp_path / storage.previews(video_path)["proxy"]))
+    assert proxy.get(cv2.CAP_PROP_FRAME_HEIGHT) == 360 and proxy.get(cv2.CAP_PROP_FPS) == 15
+    on_disk = sum(f.stat().st_size for d in (tmp_path, tmp_path / ".previews") for f in d.iterdir() if f.is_file())
+    assert storage.stats()["bytes"] == on_disk
+
+
+def test_reserved_bytes_count_toward_quota(tmp_path):
+    storage = StorageManager(str(tmp_path), quota_bytes=3000, ttl=0)
+    stored = store_file(tmp_path, b"a" * 1000)
+    storage.add(stored)
+    preallocated = [0]
+    storage.reserved.append(lambda: preallocated[0])
+
+    assert storage.make_room(2000) and os.path.exists(stored)
+    preallocated[0] = 2500
+    # The partial upload's space is taken, so the stored file goes to make room
+    assert storage.make_room(500) and not os.path.exists(stored)
+    assert not storage.make_room(1000)
+    assert storage.stats()["reserved_bytes"] == 2500
+
+
+def test_scan_keeps_files_added_meanwhile(tmp_path, monkeypatch):
+    storage = StorageManager(str(tmp_path), quota_bytes=0, ttl=0)
+    late = store_file(tmp_path, b"c" * 100)
+    scandir = os.scandir
+
+    def slow_scandir(path):
+        entries = list(scandir(path))
+        # add() from another thread lands while the folder is being listed
+        threading.Thread(target=storage.add, args=(late,)).start()
+        time.sleep(0.05)
+        return iter([e for e in entries if e.path != late])
+
+    monkeypatch.setattr(os, "scandir", slow_scandir)
+    storage.scan()
+    monkeypatch.setattr(os, "scandir", scandir)
+    time.sleep(0.05)
+    assert storage.stats()["files"] == 1 and storage.stats()["bytes"] == 100
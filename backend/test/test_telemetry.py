@@ -0,0 +1,123 @@
+import sys
+from pathlib import Path
+import asyncio, logging, time
+
+import cv2
+import numpy as np
+import pytest
+
+# Backend modules import each other by bare name
+script_dir = Path(__file__).resolve().parent
+sys.path.append(str(script_dir.parent))
+
+import telemetry
+from telemetry import Counter, Histogram, Registry, STAGE_SECONDS, span
+from analysis_executor import AnalysisExecutor
+
+
+def test_histogram_renders_cumulative_buckets():
+    registry = Registry()
+    histogram = registry.register(Histogram("t_seconds", "Test", ("stage",), buckets=(0.1, 1)))
+    for value in (0.05, 0.5, 0.5, 5):
+        histogram.observe(value, stage="a")
+    counter = registry.register(Counter("t_total", "Test", ("result",)))
+    counter.inc(result="hit")
+
+    text = registry.render()
+    assert '# TYPE t_seconds histogram' in text
+    assert 't_seconds_bucket{stage="a",le="0.1"} 1' in text
+    assert 't_seconds_bucket{stage="a",le="1.0"} 3' in text
+    assert 't_seconds_bucket{stage="a",le="+Inf"} 4' in text
+    assert 't_seconds_count{stage="a"} 4' in text
+    assert 't_total{result="hit"} 1' in text
+
+
+def test_drain_and_merge():
+    source, target = Registry(), Registry()
+    for registry in (source, target):
+        registry.register(Histogram("t_seconds", "Test", ("stage",), buckets=(1,)))
+    source.metrics["t_seconds"].observe(0.5, stage="a")
+    target.metrics["t_seconds"].observe(2, stage="a")
+
+    target.merge(source.drain())
+    assert source.metrics["t_seconds"].samples() == {}
+    counts, total = target.metrics["t_seconds"].samples()[("a",)]
+    assert counts == [1, 1] and total == pytest.approx(2.5)
+
+
+def test_span_records_error_status():
+    STAGE_SECONDS.drain()
+    with pytest.raises(ValueError):
+        with span("test.stage"):
+            raise ValueError("boom")
+    with span("test.stage"):
+        pass
+    samples = STAGE_SECONDS.samples()
+    assert sum(samples[("test.stage", "error")][0]) == 1
+    assert sum(samples[("test.stage", "ok")][0]) == 1
+
+
+def test_logs_carry_request_id():
+    records = []
+    handler = logging.Handler()
+    handler.emit = records.append
+    handler.addFilter(telemetry._RequestIdFilter())
+    telemetry.log.addHandler(handler)
+    token = telemetry.request_id.set("req-123")
+    try:
+        telemetry.log.warning("hello")
+    finally:
+        telemetry.request_id.reset(token)
+        telemetry.log.removeHandler(handler)
+    assert records[0].request_id == "req-123"
+
+
+def test_worker_process_stages_are_merged(tmp_path):
+    image = (np.random.default_rng(0).random((64, 64, 3)) * 255).astype(np.uint8)
+    path = str(tmp_path / 'image.png')
+    cv2.imwrite(path, image)
+
+    STAGE_SECONDS.drain()
+    executor = AnalysisExecutor(mode='process', workers=1, cv_threads=1)
+    try:
+        asyncio.run(executor.run('image', path))
+    finally:
+        executor.shutdown()
+    stages = {stage for stage, _ in STAGE_SECONDS.samples()}
+    assert {"cv.decode", "cv.canny", "cv.analyze_image", "analysis.pool"} <= stages
+
+
+def test_forked_workers_dont_send_back_parent_spans(tmp_path):
+    image = (np.random.default_rng(0).random((64, 64, 3)) * 255).astype(np.uint8)
+    path = str(tmp_path / 'image.png')
+    cv2.imwrite(path, image)
+
+    STAGE_SECONDS.drain()
+    for _ in range(100):
+        STAGE_SECONDS.observe(0.01, stage="analysis.pool", status="ok")
+    executor = AnalysisExecutor(mode='process', workers=2, cv_threads=1)
+
+    async def scenario():
+        await asyncio.gather(*(executor.run('image', path) for _ in range(2)))
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        executor.shutdown()
+    counts, _ = STAGE_SECONDS.samples()[("analysis.pool", "ok")]
+    assert sum(counts) == 102
+    assert sum(STAGE_SECONDS.samples()[("cv.analyze_image", "ok")][0]) == 2
+
+
+def test_event_loop_lag_probe_sees_blocking():
+    async def scenario():
+        probe = asyncio.create_task(telemetry.monitor_event_loop(0.01))
+        await asyncio.sleep(0.02)
+        time.sleep(0.2)  # blocks the loop
+        await asyncio.sleep(0.03)
+        probe.cancel()
+
+    telemetry.EVENT_LOOP_LAG.drain()
+    asyncio.run(scenario())
+    (counts, total), = telemetry.EVENT_LOOP_LAG.samples().values()
+    assert total >= 0.15
@@ -0,0 +1,201 @@
+import sys
+from pathlib import Path
+import asyncio, hashlib, os, time
+import cv2
+import numpy as np
+import pytest
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.testclient import TestClient
+
+# Backend modules import each other by bare name
+script_dir = Path(__file__).resolve().parent
+sys.path.append(str(script_dir.parent))
+
+from file_validation_service import sniff_media_type
+from upload_store import (UploadStore, ResumableUploads, UploadRejected, UploadTooLarge, UnsupportedMedia,
+                          UploadConflict, UploadNotFound, TooManyUploads, upload_body)
+
+
+def png_bytes():
+    ok, data = cv2.imencode(".png", np.random.default_rng(0).integers(0, 255, (32, 32, 3), dtype=np.uint8))
+    return data.tobytes()
+
+
+async def chunked(data, size):
+    for i in range(0, len(data), size):
+        yield data[i:i + size]
+
+
+def test_sniff_media_type():
+    assert sniff_media_type(png_bytes()) == ("image", ".png")
+    assert sniff_media_type(b"\xff\xd8\xff\xe0" + bytes(60)) == ("image", ".jpg")
+    assert sniff_media_type(b"\x00\x00\x00\x18ftypisom" + bytes(52)) == ("video", ".mp4")
+    assert sniff_media_type(b"\x00\x00\x00\x18ftypheic" + bytes(52)) is None
+    assert sniff_media_type(b"\x1a\x45\xdf\xa3\x9f\x42\x82\x84webm" + bytes(50)) == ("video", ".webm")
+    assert sniff_media_type(b"<html>" + bytes(60)) is None
+
+
+def test_ingest_is_content_addressed_and_deduplicated(tmp_path):
+    store = UploadStore(str(tmp_path), chunk_size=100)
+    data = png_bytes()
+    first = asyncio.run(store.ingest(chunked(data, 37)))
+    second = asyncio.run(store.ingest(chunked(data, 1000)))
+
+    assert first["content_hash"] == hashlib.sha256(data).hexdigest()
+    assert first["path"] == str(tmp_path / (first["content_hash"] + ".png"))
+    assert (first["type"], first["size"], first["deduplicated"]) == ("image", len(data), False)
+    assert second["path"] == first["path"] and second["deduplicated"]
+    assert open(first["path"], "rb").read() == data
+    assert os.listdir(store.incoming) == []
+
+
+def test_limits_are_enforced_while_streaming(tmp_path):
+    store = UploadStore(str(tmp_path), max_image_bytes=500, max_video_bytes=500)
+    with pytest.raises(UploadTooLarge):
+        asyncio.run(store.ingest(chunked(png_bytes(), 64)))
+    with pytest.raises(UploadTooLarge):
+        asyncio.run(store.ingest(chunked(b"", 1), declared_size=10 ** 9))
+    with pytest.raises(UnsupportedMedia):
+        asyncio.run(store.ingest(chunked(b"#!/bin/sh\n" * 20, 64)))
+    with pytest.raises(UnsupportedMedia):
+        asyncio.run(store.ingest(chunked(b"", 1)))
+    assert os.listdir(store.incoming) == []
+    assert sorted(os.listdir(tmp_path)) == [".incoming"]
+
+
+def test_multipart_body_is_streamed(tmp_path):
+    store = UploadStore(str(tmp_path))
+    app = FastAPI()
+
+    @app.post("/upload")
+    async def upload(request: Request):
+        body = upload_body(request.stream(), request.headers.get("content-type", ""), request.query_params.get("filename"))
+        try:
+            stored = await store.ingest(body)
+        except UploadRejected as e:
+            raise HTTPException(status_code=e.status_code, detail=str(e))
+        return {**stored, "filename": body.filename}
+
+    client = TestClient(app)
+    data = png_bytes()
+    response = client.post("/upload", data={"note": "x" * 5000}, files={"file": ("../holiday.png", data, "image/png")})
+    assert response.status_code == 200
+    assert response.json()["filename"] == "holiday.png"
+    assert response.json()["content_hash"] == hashlib.sha256(data).hexdigest()
+
+    raw = client.post("/upload?filename=raw.png", content=data, headers={"content-type": "application/octet-stream"})
+    assert raw.json()["deduplicated"] and raw.json()["filename"] == "raw.png"
+
+    assert client.post("/upload", files={"other": ("a.png", data, "image/png")}).status_code == 400
+    assert client.post("/upload", files={"file": ("a.png", b"text" * 100, "image/png")}).status_code == 415
+
+
+def test_resumable_upload_survives_retries_and_restarts(tmp_path):
+    store = UploadStore(str(tmp_path))
+    chunk = 64 * 1024
+    data = png_bytes() + np.random.default_rng(1).integers(0, 255, 3 * chunk, dtype=np.uint8).tobytes()
+    parts = {offset: data[offset:offset + chunk] for offset in range(0, len(data), chunk)}
+
+    def sha(b):
+        return hashlib.sha256(b).hexdigest()
+
+    async def first_session():
+        uploads = ResumableUploads(store)
+        upload = uploads.init(len(data), "../clip.png", chunk_size=chunk)
+        assert os.path.getsize(uploads._data_path(upload.upload_id)) == len(data)
+        # Out of order, a retried chunk, and a corrupted one
+        await uploads.write_chunk(upload.upload_id, 2 * chunk, parts[2 * chunk], sha(parts[2 * chunk]))
+        await uploads.write_chunk(upload.upload_id, 0, parts[0], sha(parts[0]))
+        await uploads.write_chunk(upload.upload_id, 0, parts[0], sha(parts[0]))
+        with pytest.raises(UploadRejected):
+            await uploads.write_chunk(upload.upload_id, chunk, parts[chunk], sha(b"corrupted"))
+        with pytest.raises(UploadConflict):
+            await uploads.finalize(upload.upload_id)
+        return upload.upload_id
+
+    upload_id = asyncio.run(first_session())
+
+    async def second_session():
+        # A new process picks up the chunks already on disk
+        uploads = ResumableUploads(store)
+        assert uploads.get(upload_id).missing() == [1, 3]
+        for offset in (chunk, 3 * chunk):
+            await uploads.write_chunk(upload_id, offset, parts[offset], sha(parts[offset]))
+        return await uploads.finalize(upload_id)
+
+    stored = asyncio.run(second_session())
+    assert stored["content_hash"] == sha(data) and stored["filename"] == "clip.png"
+    assert open(stored["path"], "rb").read() == data
+    assert os.listdir(tmp_path / ".resumable") == []
+    assert asyncio.run(store.ingest(chunked(data, 5000)))["deduplicated"]
+
+
+def test_resumable_upload_checks_type_on_first_chunk(tmp_path):
+    uploads = ResumableUploads(UploadStore(str(tmp_path)))
+    upload = uploads.init(100_000, chunk_size=64 * 1024)
+    text = b"not media " * 6554
+    with pytest.raises(UnsupportedMedia):
+        asyncio.run(uploads.write_chunk(upload.upload_id, 0, text[:65536], hashlib.sha256(text[:65536]).hexdigest()))
+    with pytest.raises(UploadRejected):
+        asyncio.run(uploads.write_chunk(upload.upload_id, 1000, b"x", hashlib.sha256(b"x").hexdigest()))
+    with pytest.raises(UploadTooLarge):
+        uploads.init(10 ** 12)
+    asyncio.run(uploads.abort(upload.upload_id))
+    with pytest.raises(UploadNotFound):
+        uploads.get(upload.upload_id)
+
+
+def test_outstanding_resumable_uploads_are_capped(tmp_path):
+    store = UploadStore(str(tmp_path))
+    uploads = ResumableUploads(store, max_per_client=2, max_bytes=1_000_000)
+    first = uploads.init(300_000, client="10.0.0.1")
+    uploads.init(300_000, client="10.0.0.1")
+    with pytest.raises(TooManyUploads):
+        uploads.init(1000, client="10.0.0.1")
+    with pytest.raises(TooManyUploads):
+        uploads.init(500_000, client="10.0.0.2")
+    assert uploads.outstanding_bytes() == 600_000
+
+    # After a restart the uploads already on disk still count
+    restarted = ResumableUploads(store, max_per_client=2, max_bytes=1_000_000)
+    with pytest.raises(TooManyUploads):
+        restarted.init(1000, client="10.0.0.1")
+    asyncio.run(restarted.abort(first.upload_id))
+    restarted.init(1000, client="10.0.0.1")
+    assert restarted.outstanding_bytes() == 301_000
+
+
+def test_abort_and_expire_wait_for_chunks_in_flight(tmp_path, monkeypatch):
+    uploads = ResumableUploads(UploadStore(str(tmp_path)))
+    chunk = 64 * 1024
+    data = b"\x01" * chunk
+    pwrite = ResumableUploads._pwrite
+
+    def slow_pwrite(*args):
+        time.sleep(0.1)
+        pwrite(*args)
+
+    monkeypatch.setattr(ResumableUploads, "_pwrite", staticmethod(slow_pwrite))
+
+    async def scenario():
+        aborted = uploads.init(2 * chunk, chunk_size=chunk)
+        writing = asyncio.create_task(uploads.write_chunk(aborted.upload_id, chunk, data, hashlib.sha256(data).hexdigest()))
+        await asyncio.sleep(0.02)
+        await uploads.abort(aborted.upload_id)
+        await writing
+        with pytest.raises(UploadNotFound):
+            await uploads.write_chunk(aborted.upload_id, chunk, data, hashlib.sha256(data).hexdigest())
+
+        expiring = uploads.init(2 * chunk, chunk_size=chunk)
+        uploads.ttl = 0
+        writing = asyncio.create_task(uploads.write_chunk(expiring.upload_id, chunk, data, hashlib.sha256(data).hexdigest()))
+        await asyncio.sleep(0.02)
+        # A chunk is being written, so the upload isn't stale
+        assert await asyncio.to_thread(uploads.expire) == 0
+        await writing
+        assert await asyncio.to_thread(uploads.expire) == 1
+        with pytest.raises(UploadNotFound):
+            await uploads.write_chunk(expiring.upload_id, chunk, data, hashlib.sha256(data).hexdigest())
+
+    asyncio.run(scenario())
+    assert os.listdir(tmp_path / ".resumable") == []
@@ -0,0 +1,105 @@
+import sys
+from pathlib import Path
+import asyncio
+import httpx
+import pytest
+
+# Backend modules import each other by bare name
+script_dir = Path(__file__).resolve().parent
+sys.path.append(str(script_dir.parent))
+
+from detector import VerdictClient, VerdictError, VerdictUnavailable
+from aiornot_stub import create_app
+
+
+def make_client(stub, **kwargs):
+    options = dict(base_url="http://stub", max_retries=2, backoff=0.001, breaker_threshold=2, breaker_reset=60)
+    options.update(kwargs)
+    return VerdictClient(api_key="test", transport=httpx.ASGITransport(app=stub), **options)
+
+
+@pytest.fixture
+def media_file(tmp_path):
+    path = tmp_path / "clip.mp4"
+    path.write_bytes(b"\x00" * 1234)
+    return str(path)
+
+
+def test_scans_through_stub(media_file):
+    async def scenario():
+        client = make_client(create_app(latency=0))
+        try:
+            return await client.scan("image", media_file), await client.scan("video", media_file)
+        finally:
+            await client.aclose()
+
+    image, video = asyncio.run(scenario())
+    assert image == video == {"ai_detected": False, "ai_confidence": 0.34,
+                              "deepfake_detected": False, "deepfake_confidence": 0.34}
+
+
+def test_retries_then_opens_circuit(media_file):
+    stub = create_app(latency=0, failure_rate=1.0)
+
+    async def scenario():
+        client = make_client(stub)
+        try:
+            for _ in range(2):
+                with pytest.raises(VerdictUnavailable):
+                    await client.scan("image", media_file)
+            assert stub.state.requests == 6
+            # Open: fails without calling the API
+            with pytest.raises(VerdictUnavailable, match="circuit open"):
+                await client.scan("image", media_file)
+            assert stub.state.requests == 6
+        finally:
+            await client.aclose()
+
+    asyncio.run(scenario())
+
+
+def test_client_errors_are_not_retried(media_file):
+    stub = create_app(latency=0, failure_rate=1.0, failure_status=400)
+
+    async def scenario():
+        client = make_client(stub)
+        try:
+            with pytest.raises(VerdictError) as info:
+                await client.scan("video", media_file)
+            assert not isinstance(info.value, VerdictUnavailable)
+            assert client.breaker.state == "closed"
+        finally:
+            await client.aclose()
+
+    asyncio.run(scenario())
+    assert stub.state.requests == 1
+
+
+def test_cancelled_half_open_trial_lets_the_next_call_try(media_file):
+    async def scenario():
+        client = make_client(create_app(latency=5))
+        client.breaker.opened_at = 0  # open long enough ago to be half-open
+        try:
+            trial = asyncio.create_task(client.scan("image", media_file))
+            await asyncio.sleep(0.05)
+            trial.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await trial
+            return client.breaker.state, client.breaker.allow()
+        finally:
+            await client.aclose()
+
+    assert asyncio.run(scenario()) == ("half-open", True)
+
+
+def test_unexpected_error_counts_as_failure(tmp_path):
+    async def scenario():
+        client = make_client(create_app(latency=0), breaker_threshold=1)
+        try:
+            with pytest.raises(OSError):
+                await client.scan("image", str(tmp_path / "missing.png"))
+            return client.breaker.state
+        finally:
+            await client.aclose()
+
+    assert asyncio.run(scenario()) == "open"
@@ -0,0 +1,594 @@
+"""
+Streaming ingest of uploads into content-addressed storage.
+
+The request body is parsed as it arrives and the file part is written straight to a
+temporary file in `<root>/.incoming` while it is hashed, then renamed to
+`<root>/<sha256><ext>`. There is no spooled copy, concurrent uploads never share a
+path, and identical files are stored once. The type comes from the leading bytes
+(see sniff_media_type) and size limits apply while the body is still streaming.
+
+Large files can instead be sent in checksummed chunks that survive dropped
+connections (ResumableUploads).
+"""
+import asyncio, hashlib, json, os, secrets, threading, time
+from python_multipart.multipart import MultipartParser, MultipartParseError, parse_options_header
+from file_validation_service import SNIFF_BYTES, sniff_media_type
+
+from typing import Dict, Any, Optional, AsyncIterable, AsyncIterator, List
+
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+# Multipart headers of one part; more than this is not a browser upload
+MAX_PART_HEADER_BYTES = 16 * 1024
+# Boundaries and other form fields on top of the file itself
+FORM_OVERHEAD_BYTES = 64 * 1024
+
+
+class UploadRejected(Exception):
+    """The upload can't be accepted; status_code is the HTTP status to answer with."""
+    status_code = 400
+
+
+class UploadTooLarge(UploadRejected):
+    status_code = 413
+
+
+class UnsupportedMedia(UploadRejected):
+    status_code = 415
+
+
+class MultipartFileStream:
+    """
+    Async iterator over the bytes of one file field of a multipart/form-data body,
+    parsed incrementally; other fields are skipped. `filename` is set once the
+    field's headers have been read.
+    """
+
+    def __init__(self, stream: AsyncIterable[bytes], content_type: str, field_name: str = "file"):
+        _, params = parse_options_header(content_type)
+        boundary = params.get(b"boundary")
+        if not boundary:
+            raise UploadRejected("Missing multipart boundary")
+        self.filename: Optional[str] = None
+        self._stream = stream
+        self._field_name = field_name.encode()
+        self._found = False
+        self._in_field = False
+        self._header_bytes = 0
+        self._header_field = b""
+        self._header_value = b""
+        self._headers: Dict[bytes, bytes] = {}
+        self._data: List[bytes] = []
+        self._parser = MultipartParser(boundary, {
+            "on_part_begin": self._on_part_begin,
+            "on_header_field": self._on_header_field,
+            "on_header_value": self._on_header_value,
+            "on_header_end": self._on_header_end,
+            "on_headers_finished": self._on_headers_finished,
+            "on_part_data": self._on_part_data,
+            "on_part_end": self._on_part_end,
+        })
+
+    def _on_part_begin(self):
+        self._headers = {}
+        self._header_bytes = 0
+
+    def _on_header_field(self, data: bytes, start: int, end: int):
+        self._header_field += data[start:end]
+        self._header_bytes += end - start
+
+    def _on_header_value(self, data: bytes, start: int, end: int):
+        self._header_value += data[start:end]
+        self._header_bytes += end - start
+
+    def _on_header_end(self):
+        if self._header_bytes > MAX_PART_HEADER_BYTES:
+            raise UploadRejected("Multipart headers too large")
+        self._headers[self._header_field.lower()] = self._header_value
+        self._header_field = b""
+        self._header_value = b""
+
+    def _on_headers_finished(self):
+        _, options = parse_options_header(self._headers.get(b"content-disposition", b""))
+        if options.get(b"name") == self._field_name and not self._found:
+            self._found = self._in_field = True
+            filename = options.get(b"filename")
+            self.filename = os.path.basename(filename.decode(errors="replace")) if filename else None
+
+    def _on_part_data(self, data: bytes, start: int, end: int):
+        if self._in_field:
+            self._data.append(data[start:end])
+
+    def _on_part_end(self):
+        self._in_field = False
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        try:
+            async for chunk in self._stream:
+                self._parser.write(chunk)
+                if self._data:
+                    data, self._data = self._data, []
+                    for part in data:
+                        yield part
+            self._parser.finalize()
+        except MultipartParseError as e:
+            raise UploadRejected(f"Malformed multipart body: {e}")
+        if not self._found:
+            raise UploadRejected(f"No '{self._field_name.decode()}' field in the form")
+
+
+class RawBodyStream:
+    """The whole request body is the file (any non-multipart content type)."""
+
+    def __init__(self, stream: AsyncIterable[bytes], filename: Optional[str] = None):
+        self.filename = os.path.basename(filename) if filename else None
+        self._stream = stream
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        async for chunk in self._stream:
+            yield chunk
+
+
+def upload_body(stream: AsyncIterable[bytes], content_type: str, filename: Optional[str] = None):
+    """File bytes of a request body: the `file` field of a multipart form, or the raw body."""
+    if content_type.lower().startswith("multipart/form-data"):
+        return MultipartFileStream(stream, content_type)
+    return RawBodyStream(stream, filename)
+
+
+class UploadStore:
+    """
+    Content-addressed file storage for uploads.
+
+    Files live at `<root>/<sha256><ext>`, so the stored name is derived from the bytes and
+    the sniffed type, never from the client's filename.
+    """
+
+    def __init__(self,
+                 root: str,
+                 max_image_bytes: int = int(os.getenv("UPLOAD_MAX_IMAGE_MB", "100")) * 1024 * 1024,
+                 max_video_bytes: int = int(os.getenv("UPLOAD_MAX_VIDEO_MB", "2048")) * 1024 * 1024,
+                 chunk_size: int = UPLOAD_CHUNK_SIZE):
+        """
+        Args:
+            root (str): Storage directory (served under /media).
+            max_image_bytes (int): Largest accepted image.
+            max_video_bytes (int): Largest accepted video.
+            chunk_size (int): Bytes buffered per disk write.
+        """
+        self.root = root
+        self.incoming = os.path.join(root, ".incoming")
+        self.max_bytes = {"image": max_image_bytes, "video": max_video_bytes}
+        self.chunk_size = chunk_size
+        os.makedirs(self.incoming, exist_ok=True)
+        self.remove_stale()
+
+    def remove_stale(self, older_than: float = 3600):
+        # Partial files of a crashed process; recent ones may belong to another worker
+        cutoff = time.time() - older_than
+        for name in os.listdir(self.incoming):
+            path = os.path.join(self.incoming, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            except OSError:
+                pass
+
+    def path_for(self, content_hash: str, extension: str) -> str:
+        return os.path.join(self.root, content_hash + extension)
+
+    @staticmethod
+    def _write(file, hasher, chunks: List[bytes]):
+        for chunk in chunks:
+            hasher.update(chunk)
+            file.write(chunk)
+
+    async def ingest(self, chunks: AsyncIterable[bytes], declared_size: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Write a streamed file into the store, hashing it on the way.
+
+        Args:
+            chunks (async iterable): File bytes, e.g. from upload_body().
+            declared_size (int): Content-Length of the request, if known; rejected up front
+                when no file type could fit in it.
+
+        Returns:
+            dict: path, content_hash, size, type, extension and deduplicated
+                (True when the same bytes were already stored).
+
+        Raises:
+            UploadTooLarge: Over the limit for the declared size or the sniffed type.
+            UnsupportedMedia: The leading bytes aren't a supported image or video format.
+        """
+        if declared_size is not None and declared_size > max(self.max_bytes.values()) + FORM_OVERHEAD_BYTES:
+            raise UploadTooLarge(f"Upload of {declared_size} bytes exceeds the size limit")
+
+        hasher = hashlib.sha256()
+        tmp_path = os.path.join(self.incoming, secrets.token_hex(16))
+        pending: List[bytes] = []
+        pending_bytes = 0
+        size = 0
+        sniffed = None
+        file = None
+        try:
+            async for chunk in chunks:
+                pending.append(chunk)
+                pending_bytes += len(chunk)
+                size += len(chunk)
+                if sniffed is None:
+                    if pending_bytes < SNIFF_BYTES:
+                        continue
+                    sniffed = self.check_type(b"".join(pending))
+                    file = open(tmp_path, "wb")
+                self.check_size(sniffed[0], size)
+                if pending_bytes >= self.chunk_size:
+                    await asyncio.to_thread(self._write, file, hasher, pending)
+                    pending, pending_bytes = [], 0
+
+            if sniffed is None:
+                # Shorter than SNIFF_BYTES
+                sniffed = self.check_type(b"".join(pending))
+                file = open(tmp_path, "wb")
+            await asyncio.to_thread(self._write, file, hasher, pending)
+            file.close()
+        except BaseException:
+            if file is not None:
+                file.close()
+                os.remove(tmp_path)
+            raise
+
+        return self.commit(tmp_path, hasher.hexdigest(), size, *sniffed)
+
+    def commit(self, tmp_path: str, content_hash: str, size: int, file_type: str, extension: str) -> Dict[str, Any]:
+        """Move a fully written temp file to its content address; identical bytes already stored are replaced in place."""
+        path = self.path_for(content_hash, extension)
+        deduplicated = os.path.exists(path)
+        # Renaming over an existing copy (rather than dropping the new one) guarantees the
+        # file exists afterwards even if retention deletes the old copy in between
+        os.replace(tmp_path, path)
+        return {
+            "path": path,
+            "content_hash": content_hash,
+            "size": size,
+            "type": file_type,
+            "extension": extension,
+            "deduplicated": deduplicated,
+        }
+
+    def check_size(self, file_type: str, size: int):
+        if size > self.max_bytes[file_type]:
+            raise UploadTooLarge(f"{file_type.capitalize()} exceeds the {self.max_bytes[file_type]} byte limit")
+
+    @staticmethod
+    def check_type(head: bytes):
+        sniffed = sniff_media_type(head)
+        if sniffed is None:
+            raise UnsupportedMedia("Unsupported file type")
+        return sniffed
+
+
+# Resumable uploads: init / PUT chunk at offset / finalize (see UPLOAD_CHUNK_MB, UPLOAD_RESUMABLE_TTL)
+MIN_CHUNK_SIZE = 64 * 1024
+MAX_CHUNK_SIZE = 64 * 1024 * 1024
+
+
+class UploadNotFound(UploadRejected):
+    status_code = 404
+
+
+class UploadConflict(UploadRejected):
+    status_code = 409
+
+
+class TooManyUploads(UploadRejected):
+    status_code = 429
+
+
+class ResumableUpload:
+    """State of one resumable upload, persisted next to its data file so received chunks survive restarts."""
+
+    def __init__(self, upload_id: str, size: int, chunk_size: int, filename: Optional[str] = None,
+                 created_at: Optional[float] = None, chunks: Optional[Dict[int, str]] = None,
+                 sniffed: Optional[List[str]] = None, client: Optional[str] = None):
+        self.upload_id = upload_id
+        self.size = size
+        self.chunk_size = chunk_size
+        self.filename = filename
+        self.created_at = created_at or time.time()
+        self.chunks: Dict[int, str] = chunks or {}  # chunk index -> SHA-256 hex
+        self.sniffed = tuple(sniffed) if sniffed else None  # (file_type, extension) once chunk 0 is in
+        self.client = client  # Address that started the upload, for the per-client cap
+        self.discarded = False  # Aborted, expired or finalized; set under ResumableUploads._lock
+        self.lock = asyncio.Lock()
+        # Whole-file SHA-256 of the chunks received in order so far; finalize reads back the rest
+        self.hasher = hashlib.sha256()
+        self.hashed_upto = 0
+
+    @property
+    def chunk_count(self) -> int:
+        return -(-self.size // self.chunk_size)
+
+    def chunk_length(self, index: int) -> int:
+        return min(self.chunk_size, self.size - index * self.chunk_size)
+
+    def missing(self) -> List[int]:
+        return [i for i in range(self.chunk_count) if i not in self.chunks]
+
+    def to_json(self) -> Dict[str, Any]:
+        return {
+            "upload_id": self.upload_id,
+            "size": self.size,
+            "chunk_size": self.chunk_size,
+            "filename": self.filename,
+            "created_at": self.created_at,
+            "chunks": self.chunks,
+            "sniffed": self.sniffed,
+            "client": self.client,
+        }
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "upload_id": self.upload_id,
+            "size": self.size,
+            "chunk_size": self.chunk_size,
+            "chunk_count": self.chunk_count,
+            "bytes_received": sum(self.chunk_length(i) for i in self.chunks),
+            "missing": self.missing(),
+        }
+
+
+class ResumableUploads:
+    """
+    Chunked uploads that survive dropped connections.
+
+    init reserves a preallocated file; each chunk is verified against its SHA-256 and
+    written in place at its offset with a positional write, so chunks can arrive in any
+    order or in parallel. A retried chunk that is already stored is acknowledged without
+    rewriting it. finalize moves the completed file into the UploadStore, with the same
+    content addressing and deduplication as streamed uploads.
+
+    Preallocated space is taken before any data arrives, so outstanding uploads are capped
+    per client and in total bytes.
+    """
+
+    def __init__(self,
+                 store: UploadStore,
+                 chunk_size: int = int(os.getenv("UPLOAD_CHUNK_MB", "8")) * 1024 * 1024,
+                 ttl: float = float(os.getenv("UPLOAD_RESUMABLE_TTL", str(24 * 3600))),
+                 max_per_client: int = int(os.getenv("UPLOAD_RESUMABLE_PER_CLIENT", "4")),
+                 max_bytes: int = int(os.getenv("UPLOAD_RESUMABLE_MAX_MB", "8192")) * 1024 * 1024):
+        """
+        Args:
+            store (UploadStore): Where finalized uploads go; also supplies the size limits.
+            chunk_size (int): Chunk size when the client doesn't ask for one.
+            ttl (float): Seconds an upload may sit without receiving a chunk before it is discarded.
+            max_per_client (int): Outstanding uploads one client may hold; 0 disables.
+            max_bytes (int): Preallocated bytes across all outstanding uploads; 0 disables.
+        """
+        self.store = store
+        self.chunk_size = chunk_size
+        self.ttl = ttl
+        self.max_per_client = max_per_client
+        self.max_bytes = max_bytes
+        self.folder = os.path.join(store.root, ".resumable")
+        os.makedirs(self.folder, exist_ok=True)
+        self._lock = threading.Lock()
+        self._uploads: Dict[str, ResumableUpload] = {}
+        # Uploads left by a previous run count towards the caps
+        for name in os.listdir(self.folder):
+            if name.endswith(".json"):
+                try:
+                    self.get(name[:-len(".json")])
+                except (UploadNotFound, ValueError, TypeError, KeyError):
+                    pass
+
+    def _data_path(self, upload_id: str) -> str:
+        return os.path.join(self.folder, upload_id + ".part")
+
+    def _state_path(self, upload_id: str) -> str:
+        return os.path.join(self.folder, upload_id + ".json")
+
+    def _save(self, upload: ResumableUpload):
+        path = self._state_path(upload.upload_id)
+        # Under the lock so a discarded upload's state can't be written back after _remove
+        with self._lock:
+            if upload.discarded:
+                raise UploadNotFound("Upload not found or expired")
+            with open(path + ".tmp", "w") as f:
+                json.dump(upload.to_json(), f)
+            os.replace(path + ".tmp", path)
+
+    def _remove(self, upload_id: str):
+        with self._lock:
+            upload = self._uploads.pop(upload_id, None)
+            if upload is not None:
+                upload.discarded = True
+            for path in (self._data_path(upload_id), self._state_path(upload_id)):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+    def expire(self) -> int:
+        """
+        Discard uploads that haven't received a chunk within the TTL. Runs off the event
+        loop, so it can't wait for an upload's lock; one that is held is in use, not stale.
+        """
+        cutoff = time.time() - self.ttl
+        expired = 0
+        for name in os.listdir(self.folder):
+            if name.endswith(".json"):
+                upload_id = name[:-len(".json")]
+                upload = self._uploads.get(upload_id)
+                if upload is not None and upload.lock.locked():
+                    continue
+                try:
+                    if os.path.getmtime(os.path.join(self.folder, name)) < cutoff:
+                        self._remove(upload_id)
+                        expired += 1
+                except OSError:
+                    pass
+        return expired
+
+    def outstanding_bytes(self) -> int:
+        """Bytes preallocated for uploads that haven't been finalized or discarded."""
+        with self._lock:
+            return sum(upload.size for upload in self._uploads.values())
+
+    def init(self, size: int, filename: Optional[str] = None, chunk_size: Optional[int] = None,
+             client: Optional[str] = None) -> ResumableUpload:
+        """
+        Start an upload of `size` bytes and preallocate its file. Blocks while the space
+        is allocated, so call it off the event loop.
+
+        Args:
+            client (str): Address of the caller, for the per-client cap.
+
+        Raises:
+            UploadRejected: Invalid size or chunk size.
+            UploadTooLarge: Larger than any accepted file.
+            TooManyUploads: The client or the server already has the most outstanding uploads allowed.
+        """
+        self.expire()
+        chunk_size = chunk_size or self.chunk_size
+        if size <= 0:
+            raise UploadRejected("Upload size must be positive")
+        if size > max(self.store.max_bytes.values()):
+            raise UploadTooLarge(f"Upload of {size} bytes exceeds the size limit")
+        if not MIN_CHUNK_SIZE <= chunk_size <= MAX_CHUNK_SIZE:
+            raise UploadRejected(f"chunk_size must be between {MIN_CHUNK_SIZE} and {MAX_CHUNK_SIZE} bytes")
+
+        upload = ResumableUpload(secrets.token_hex(16), size, chunk_size, os.path.basename(filename) if filename else None,
+                                 client=client)
+        with self._lock:
+            outstanding = list(self._uploads.values())
+            if self.max_per_client and sum(u.client == client for u in outstanding) >= self.max_per_client:
+                raise TooManyUploads(f"At most {self.max_per_client} unfinished uploads per client")
+            if self.max_bytes and sum(u.size for u in outstanding) + size > self.max_bytes:
+                raise TooManyUploads("Too many unfinished uploads, try again later")
+            # Registered before the allocation so concurrent calls count it
+            self._uploads[upload.upload_id] = upload
+        try:
+            fd = os.open(self._data_path(upload.upload_id), os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+            try:
+                # Reserve the blocks up front so a full disk fails here, not halfway through
+                if hasattr(os, "posix_fallocate"):
+                    os.posix_fallocate(fd, 0, size)
+                else:
+                    os.ftruncate(fd, size)
+            finally:
+                os.close(fd)
+            self._save(upload)
+        except OSError:
+            self._remove(upload.upload_id)
+            raise
+        return upload
+
+    def get(self, upload_id: str) -> ResumableUpload:
+        upload = self._uploads.get(upload_id)
+        if upload is not None:
+            return upload
+        if len(upload_id) != 32 or any(c not in "0123456789abcdef" for c in upload_id):
+            raise UploadNotFound("Upload not found or expired")
+        try:
+            with open(self._state_path(upload_id)) as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            raise UploadNotFound("Upload not found or expired")
+        state["chunks"] = {int(i): digest for i, digest in state["chunks"].items()}
+        with self._lock:
+            return self._uploads.setdefault(upload_id, ResumableUpload(**state))
+
+    @staticmethod
+    def _pwrite(path: str, data: bytes, offset: int):
+        fd = os.open(path, os.O_WRONLY)
+        try:
+            view = memoryview(data)
+            while view:
+                written = os.pwrite(fd, view, offset)
+                view, offset = view[written:], offset + written
+        finally:
+            os.close(fd)
+
+    async def write_chunk(self, upload_id: str, offset: int, data: bytes, checksum: str) -> ResumableUpload:
+        """
+        Store one chunk at its offset.
+
+        Args:
+            offset (int): Byte offset; a multiple of the upload's chunk_size.
+            data (bytes): Exactly chunk_size bytes (the remainder for the last chunk).
+            checksum (str): SHA-256 hex of `data`.
+
+        Raises:
+            UploadRejected: Bad offset, length or checksum; the chunk isn't stored.
+            UploadConflict: The chunk was already stored with different content.
+            UploadNotFound: The upload was aborted or expired meanwhile.
+            UnsupportedMedia / UploadTooLarge: From the first chunk's magic bytes.
+        """
+        upload = self.get(upload_id)
+        if offset < 0 or offset >= upload.size or offset % upload.chunk_size:
+            raise UploadRejected(f"offset must be a multiple of {upload.chunk_size} below {upload.size}")
+        index = offset // upload.chunk_size
+        if len(data) != upload.chunk_length(index):
+            raise UploadRejected(f"Chunk {index} must be {upload.chunk_length(index)} bytes, got {len(data)}")
+        digest = await asyncio.to_thread(lambda: hashlib.sha256(data).hexdigest())
+        if digest != checksum.strip().lower():
+            raise UploadRejected(f"Checksum mismatch for chunk {index}")
+
+        async with upload.lock:
+            if upload.discarded:
+                raise UploadNotFound("Upload not found or expired")
+            stored = upload.chunks.get(index)
+            if stored == digest:
+                return upload
+            if stored is not None:
+                raise UploadConflict(f"Chunk {index} was already received with different content")
+            if index == 0:
+                upload.sniffed = self.store.check_type(data[:SNIFF_BYTES])
+                self.store.check_size(upload.sniffed[0], upload.size)
+            try:
+                await asyncio.to_thread(self._pwrite, self._data_path(upload_id), data, offset)
+            except FileNotFoundError:
+                # Expired between the check above and the write
+                raise UploadNotFound("Upload not found or expired")
+            if offset == upload.hashed_upto:
+                await asyncio.to_thread(upload.hasher.update, data)
+                upload.hashed_upto += len(data)
+            upload.chunks[index] = digest
+            self._save(upload)
+        return upload
+
+    def _hash_rest(self, upload: ResumableUpload) -> str:
+        with open(self._data_path(upload.upload_id), "rb") as f:
+            f.seek(upload.hashed_upto)
+            while chunk := f.read(upload.chunk_size):
+                upload.hasher.update(chunk)
+        upload.hashed_upto = upload.size
+        return upload.hasher.hexdigest()
+
+    async def finalize(self, upload_id: str) -> Dict[str, Any]:
+        """
+        Complete an upload and move it into the store.
+
+        Returns:
+            dict: Same fields as UploadStore.ingest, plus filename.
+
+        Raises:
+            UploadConflict: Chunks are still missing.
+        """
+        upload = self.get(upload_id)
+        async with upload.lock:
+            if upload.discarded:
+                raise UploadNotFound("Upload not found or expired")
+            missing = upload.missing()
+            if missing:
+                raise UploadConflict(f"{len(missing)} of {upload.chunk_count} chunks missing")
+            content_hash = await asyncio.to_thread(self._hash_rest, upload)
+            stored = self.store.commit(self._data_path(upload_id), content_hash, upload.size, *upload.sniffed)
+            self._remove(upload_id)
+        return {**stored, "filename": upload.filename}
+
+    async def abort(self, upload_id: str):
+        """Discard an upload, waiting for a chunk being written to it."""
+        upload = self.get(upload_id)
+        async with upload.lock:
+            self._remove(upload_id)
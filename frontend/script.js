@@ -118,7 +118,7 @@ async function handleAnalysis() {
         });
 
         // STEP 2: Fetch Detailed Metrics (Parallel)
-        fetchDetailedMetrics(initialData.analysis_result);
+        fetchDetailedMetrics(initialData.analysis_id);
 
     } catch (error) {
         alert('Error: ' + error.message);
@@ -128,12 +128,12 @@ async function handleAnalysis() {
     }
 }
 
-async function fetchDetailedMetrics(analysisResult) {
+async function fetchDetailedMetrics(analysisId) {
     try {
         const resp = await fetch(`${API_BASE}/analyze/metrics`, {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({ analysis_result: analysisResult })
+            body: JSON.stringify({ analysis_id: analysisId })
         });
 
         if (!resp.ok) throw new Error('Metric analysis failed');